@@ -0,0 +1,127 @@
+# Minimal RV32IMA "assembler", used for building the synthetic programs of the microbenchmarks. Every function
+# returns the 32-bit value of one instruction
+#
+# Instruction formats:
+#   https://luplab.gitlab.io/rvcodecjs/
+#   https://www.cs.sfu.ca/~ashriram/Courses/CS295/assets/notebooks/RISCV/RISCV_CARD.pdf
+
+OPCODE_LOAD = 0x03
+OPCODE_OP_IMM = 0x13
+OPCODE_AUIPC = 0x17
+OPCODE_STORE = 0x23
+OPCODE_AMO = 0x2f
+OPCODE_OP = 0x33
+OPCODE_LUI = 0x37
+OPCODE_BRANCH = 0x63
+OPCODE_JALR = 0x67
+OPCODE_JAL = 0x6f
+OPCODE_SYSTEM = 0x73
+
+
+def encode_R_type(opcode, rd, funct3, rs1, rs2, funct7):
+    return (funct7 << 25) | (rs2 << 20) | (rs1 << 15) | (funct3 << 12) | (rd << 7) | opcode
+
+
+def encode_I_type(opcode, rd, funct3, rs1, imm):
+    return ((imm & 0xFFF) << 20) | (rs1 << 15) | (funct3 << 12) | (rd << 7) | opcode
+
+
+def encode_S_type(opcode, funct3, rs1, rs2, imm):
+    return (((imm >> 5) & 0x7F) << 25) | (rs2 << 20) | (rs1 << 15) | (funct3 << 12) | ((imm & 0x1F) << 7) | opcode
+
+
+def encode_B_type(funct3, rs1, rs2, offset):
+    return (((offset >> 12) & 0x1) << 31) | (((offset >> 5) & 0x3F) << 25) | (rs2 << 20) | (rs1 << 15) \
+        | (funct3 << 12) | (((offset >> 1) & 0xF) << 8) | (((offset >> 11) & 0x1) << 7) | OPCODE_BRANCH
+
+
+def encode_U_type(opcode, rd, imm20):
+    return ((imm20 & 0xFFFFF) << 12) | (rd << 7) | opcode
+
+
+def encode_J_type(rd, offset):
+    return (((offset >> 20) & 0x1) << 31) | (((offset >> 1) & 0x3FF) << 21) | (((offset >> 11) & 0x1) << 20) \
+        | (((offset >> 12) & 0xFF) << 12) | (rd << 7) | OPCODE_JAL
+
+
+def encode_atomic(funct5, rd, rs1, rs2):
+    return encode_R_type(OPCODE_AMO, rd, 0x2, rs1, rs2, funct5 << 2)
+
+
+def encode_CSR(funct3, rd, rs1_or_uimm, csr):
+    return (csr << 20) | (rs1_or_uimm << 15) | (funct3 << 12) | (rd << 7) | OPCODE_SYSTEM
+
+
+# RV32I - immediate arithmetic
+def ADDI(rd, rs1, imm): return encode_I_type(OPCODE_OP_IMM, rd, 0x0, rs1, imm)
+def SLLI(rd, rs1, shamt): return encode_I_type(OPCODE_OP_IMM, rd, 0x1, rs1, shamt)
+def SLTIU(rd, rs1, imm): return encode_I_type(OPCODE_OP_IMM, rd, 0x3, rs1, imm)
+def XORI(rd, rs1, imm): return encode_I_type(OPCODE_OP_IMM, rd, 0x4, rs1, imm)
+def SRLI(rd, rs1, shamt): return encode_I_type(OPCODE_OP_IMM, rd, 0x5, rs1, shamt)
+def SRAI(rd, rs1, shamt): return encode_I_type(OPCODE_OP_IMM, rd, 0x5, rs1, 0x400 | shamt)
+def ORI(rd, rs1, imm): return encode_I_type(OPCODE_OP_IMM, rd, 0x6, rs1, imm)
+def ANDI(rd, rs1, imm): return encode_I_type(OPCODE_OP_IMM, rd, 0x7, rs1, imm)
+def LUI(rd, imm20): return encode_U_type(OPCODE_LUI, rd, imm20)
+def AUIPC(rd, imm20): return encode_U_type(OPCODE_AUIPC, rd, imm20)
+
+# RV32I - register arithmetic
+def ADD(rd, rs1, rs2): return encode_R_type(OPCODE_OP, rd, 0x0, rs1, rs2, 0x00)
+def SUB(rd, rs1, rs2): return encode_R_type(OPCODE_OP, rd, 0x0, rs1, rs2, 0x20)
+def SLL(rd, rs1, rs2): return encode_R_type(OPCODE_OP, rd, 0x1, rs1, rs2, 0x00)
+def SLT(rd, rs1, rs2): return encode_R_type(OPCODE_OP, rd, 0x2, rs1, rs2, 0x00)
+def SLTU(rd, rs1, rs2): return encode_R_type(OPCODE_OP, rd, 0x3, rs1, rs2, 0x00)
+def XOR(rd, rs1, rs2): return encode_R_type(OPCODE_OP, rd, 0x4, rs1, rs2, 0x00)
+def SRL(rd, rs1, rs2): return encode_R_type(OPCODE_OP, rd, 0x5, rs1, rs2, 0x00)
+def SRA(rd, rs1, rs2): return encode_R_type(OPCODE_OP, rd, 0x5, rs1, rs2, 0x20)
+def OR(rd, rs1, rs2): return encode_R_type(OPCODE_OP, rd, 0x6, rs1, rs2, 0x00)
+def AND(rd, rs1, rs2): return encode_R_type(OPCODE_OP, rd, 0x7, rs1, rs2, 0x00)
+
+# RV32M
+def MUL(rd, rs1, rs2): return encode_R_type(OPCODE_OP, rd, 0x0, rs1, rs2, 0x01)
+def MULH(rd, rs1, rs2): return encode_R_type(OPCODE_OP, rd, 0x1, rs1, rs2, 0x01)
+def MULHU(rd, rs1, rs2): return encode_R_type(OPCODE_OP, rd, 0x3, rs1, rs2, 0x01)
+def DIV(rd, rs1, rs2): return encode_R_type(OPCODE_OP, rd, 0x4, rs1, rs2, 0x01)
+def DIVU(rd, rs1, rs2): return encode_R_type(OPCODE_OP, rd, 0x5, rs1, rs2, 0x01)
+def REM(rd, rs1, rs2): return encode_R_type(OPCODE_OP, rd, 0x6, rs1, rs2, 0x01)
+def REMU(rd, rs1, rs2): return encode_R_type(OPCODE_OP, rd, 0x7, rs1, rs2, 0x01)
+
+# RV32I - loads and stores
+def LB(rd, rs1, imm): return encode_I_type(OPCODE_LOAD, rd, 0x0, rs1, imm)
+def LH(rd, rs1, imm): return encode_I_type(OPCODE_LOAD, rd, 0x1, rs1, imm)
+def LW(rd, rs1, imm): return encode_I_type(OPCODE_LOAD, rd, 0x2, rs1, imm)
+def LBU(rd, rs1, imm): return encode_I_type(OPCODE_LOAD, rd, 0x4, rs1, imm)
+def LHU(rd, rs1, imm): return encode_I_type(OPCODE_LOAD, rd, 0x5, rs1, imm)
+def SB(rs1, rs2, imm): return encode_S_type(OPCODE_STORE, 0x0, rs1, rs2, imm)
+def SH(rs1, rs2, imm): return encode_S_type(OPCODE_STORE, 0x1, rs1, rs2, imm)
+def SW(rs1, rs2, imm): return encode_S_type(OPCODE_STORE, 0x2, rs1, rs2, imm)
+
+# RV32I - branches and jumps
+def BEQ(rs1, rs2, offset): return encode_B_type(0x0, rs1, rs2, offset)
+def BNE(rs1, rs2, offset): return encode_B_type(0x1, rs1, rs2, offset)
+def BLT(rs1, rs2, offset): return encode_B_type(0x4, rs1, rs2, offset)
+def BGE(rs1, rs2, offset): return encode_B_type(0x5, rs1, rs2, offset)
+def BLTU(rs1, rs2, offset): return encode_B_type(0x6, rs1, rs2, offset)
+def BGEU(rs1, rs2, offset): return encode_B_type(0x7, rs1, rs2, offset)
+def JAL(rd, offset): return encode_J_type(rd, offset)
+def JALR(rd, rs1, imm): return encode_I_type(OPCODE_JALR, rd, 0x0, rs1, imm)
+
+# RV32A
+def LR_W(rd, rs1): return encode_atomic(0x02, rd, rs1, 0)
+def SC_W(rd, rs1, rs2): return encode_atomic(0x03, rd, rs1, rs2)
+def AMOSWAP_W(rd, rs1, rs2): return encode_atomic(0x01, rd, rs1, rs2)
+def AMOADD_W(rd, rs1, rs2): return encode_atomic(0x00, rd, rs1, rs2)
+def AMOOR_W(rd, rs1, rs2): return encode_atomic(0x08, rd, rs1, rs2)
+def AMOAND_W(rd, rs1, rs2): return encode_atomic(0x0C, rd, rs1, rs2)
+
+# Zicsr
+def CSRRW(rd, rs1, csr): return encode_CSR(0x1, rd, rs1, csr)
+def CSRRS(rd, rs1, csr): return encode_CSR(0x2, rd, rs1, csr)
+def CSRRC(rd, rs1, csr): return encode_CSR(0x3, rd, rs1, csr)
+def CSRRWI(rd, uimm, csr): return encode_CSR(0x5, rd, uimm, csr)
+def CSRRSI(rd, uimm, csr): return encode_CSR(0x6, rd, uimm, csr)
+def CSRRCI(rd, uimm, csr): return encode_CSR(0x7, rd, uimm, csr)
+
+
+if __name__ == '__main__':
+    print(f"\nExecuting:\n\t{__file__} \n")
+    print("Hopefully here we will have tests for functions in this file")
@@ -0,0 +1,24 @@
+from time import perf_counter
+
+from main import run_CPU
+
+# Macrobenchmark runs the real workload - Linux boot. The boot is deterministic (timer is driven by the number of
+# executed instructions), so the same instructions are executed on every run and the times are comparable.
+
+
+# Boots the kernel and returns a list of (instruction no., seconds since the start) for every checkpoint
+def run_boot_benchmark(cpu, block_compiler, checkpoints):
+    registers = cpu.registers
+    results = []
+
+    start_time = perf_counter()
+    for checkpoint in sorted(checkpoints):
+        run_CPU(cpu, block_compiler, checkpoint)
+        results.append((registers.executed_instruction_counter, perf_counter() - start_time))
+
+    return results
+
+
+if __name__ == '__main__':
+    print(f"\nExecuting:\n\t{__file__} \n")
+    print("Hopefully here we will have tests for functions in this file")
@@ -0,0 +1,97 @@
+from time import perf_counter
+
+from config import START_ADDRESS_OF_RAM
+from main import run_CPU
+from benchmarks.instruction_encoder import *
+
+# Microbenchmarks run a tight synthetic loop made of instructions of one class, on the same machine that boots Linux
+# (instruction cache, Address_Space, timer and interrupt checks between instructions, ...). So the result shows how
+# fast the emulator executes that kind of instructions, without the noise of everything else the kernel does.
+
+# Loop code is written into RAM instead of the kernel, data is in another 4 KiB page, so stores don't invalidate
+# the cached code
+CODE_ADDRESS = START_ADDRESS_OF_RAM
+DATA_ADDRESS = START_ADDRESS_OF_RAM + 0x100000
+
+# Body of the loop is repeated a few times, so the jump back to the start has a small share of the executed instructions
+BODY_REPEATS = 4
+
+# Registers used by the programs
+T0, T1, T2, A0 = 5, 6, 7, 10
+R1, R2, R3, R4 = 28, 29, 30, 31
+
+CSR_MSCRATCH = 0x340
+
+# Initial values of the registers. Divisor is not zero and dividend is not -1, as the emulator doesn't implement
+# these cases according to the specification
+INITIAL_REGISTER_VALUES = {T0: 1000, T1: 7, T2: 0x12345678, A0: DATA_ADDRESS}
+
+
+# Name -> loop body
+def get_microbenchmark_programs():
+    return {
+        "alu_immediate": [
+            ADDI(R1, T0, 123), SLLI(R2, T2, 3), SRLI(R3, T2, 5), SRAI(R4, T2, 7), XORI(R1, T2, 0x55),
+            ORI(R2, T2, 0x0F), ANDI(R3, T2, 0xF0), SLTIU(R4, T0, 2000), LUI(R1, 0x12345), AUIPC(R2, 0x10),
+        ],
+        "register_arithmetic": [
+            ADD(R1, T0, T1), SUB(R2, T0, T1), SLL(R3, T2, T1), SRL(R4, T2, T1), SRA(R1, T2, T1),
+            XOR(R2, T2, T0), OR(R3, T2, T0), AND(R4, T2, T0), SLT(R1, T1, T0), SLTU(R2, T0, T1),
+        ],
+        "multiply_divide": [
+            MUL(R1, T0, T1), MULH(R2, T2, T0), MULHU(R3, T2, T0), DIV(R4, T0, T1), DIVU(R1, T2, T1),
+            REM(R2, T0, T1), REMU(R3, T2, T1),
+        ],
+        "load_store": [
+            SW(A0, T2, 0), LW(R1, A0, 0), SH(A0, T2, 4), LH(R2, A0, 4), LHU(R3, A0, 4),
+            SB(A0, T2, 8), LB(R4, A0, 8), LBU(R1, A0, 8),
+        ],
+        # Half of the branches are taken, all of them (and the jumps) continue with the next instruction
+        "branch": [
+            BEQ(T0, T1, 4), BNE(T0, T1, 4), BLT(T1, T0, 4), BGE(T1, T0, 4), BLTU(T0, T1, 4), BGEU(T0, T1, 4),
+            JAL(0, 4), AUIPC(R1, 0), JALR(0, R1, 8),
+        ],
+        "atomic": [
+            LR_W(R1, A0), SC_W(R2, A0, T2), AMOSWAP_W(R3, A0, T2), AMOADD_W(R4, A0, T1), AMOOR_W(R1, A0, T0),
+            AMOAND_W(R2, A0, T2),
+        ],
+        "CSR": [
+            CSRRW(R1, T2, CSR_MSCRATCH), CSRRS(R2, 0, CSR_MSCRATCH), CSRRC(R3, T1, CSR_MSCRATCH),
+            CSRRWI(R4, 5, CSR_MSCRATCH), CSRRSI(R1, 3, CSR_MSCRATCH), CSRRCI(R2, 1, CSR_MSCRATCH),
+        ],
+    }
+
+
+def load_program(cpu, body):
+    program = body * BODY_REPEATS
+    program.append(JAL(0, -4 * len(program)))
+
+    # Written through the address space, so instructions (and compiled blocks) cached from the previous program are
+    # dropped
+    for index, instruction in enumerate(program):
+        cpu.memory.write_4_bytes__little_endian(CODE_ADDRESS + 4 * index, instruction)
+
+    registers = cpu.registers
+    registers.x[:] = [0] * 32
+    for register, value in INITIAL_REGISTER_VALUES.items():
+        registers.x[register] = value
+    registers.instruction_pointer = CODE_ADDRESS
+
+
+# Returns (number of executed instructions, seconds)
+def run_microbenchmark(cpu, block_compiler, body, instruction_count):
+    load_program(cpu, body)
+
+    registers = cpu.registers
+    start_instruction_no = registers.executed_instruction_counter
+
+    start_time = perf_counter()
+    run_CPU(cpu, block_compiler, start_instruction_no + instruction_count)
+    elapsed_time = perf_counter() - start_time
+
+    return registers.executed_instruction_counter - start_instruction_no, elapsed_time
+
+
+if __name__ == '__main__':
+    print(f"\nExecuting:\n\t{__file__} \n")
+    print("Hopefully here we will have tests for functions in this file")
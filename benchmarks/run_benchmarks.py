@@ -0,0 +1,135 @@
+import argparse
+import contextlib
+import io
+import json
+import platform
+
+from config import ReportType, ExecutionEngine, EXECUTION_ENGINE
+from main import create_machine
+from cpu.block_compiler import Block_compiler
+from emulator_management.emulator_logger import Emulator_logger
+from benchmarks.microbenchmarks import get_microbenchmark_programs, run_microbenchmark
+from benchmarks.macrobenchmarks import run_boot_benchmark
+
+# Measures the speed of the emulator in executed guest instructions per second
+#
+# Run from the root directory of the repository:
+#   python3 -m benchmarks.run_benchmarks                                  - all benchmarks, results are printed
+#   python3 -m benchmarks.run_benchmarks --output results.json            - also save the results
+#   python3 -m benchmarks.run_benchmarks --baseline results.json          - compare with previously saved results
+#   python3 -m benchmarks.run_benchmarks --suite micro --engine block_compiler
+#
+# Results of every benchmark are saved under the name "<suite>/<benchmark>", so results of two runs can be compared
+# benchmark by benchmark
+
+DEFAULT_MICROBENCHMARK_INSTRUCTIONS = 200000
+DEFAULT_REPEATS = 3
+DEFAULT_BOOT_CHECKPOINTS = "1000000,5000000,20000000"
+
+
+def create_benchmark_machine(engine):
+    # Machine prints its configuration while it's created, benchmarks only print their results
+    with contextlib.redirect_stdout(io.StringIO()):
+        logger = Emulator_logger(0, 0, ReportType.NONE)
+        cpu, console = create_machine(logger)
+
+    console.tty_output_enabled = False
+    console.keyboard_input_enabled = False
+
+    block_compiler = None
+    if engine == ExecutionEngine.BLOCK_COMPILER:
+        block_compiler = Block_compiler(cpu)
+
+    return cpu, block_compiler
+
+
+def get_result(instructions, seconds):
+    return {"instructions": instructions, "seconds": seconds, "instructions_per_second": instructions / seconds}
+
+
+def run_microbenchmarks(engine, instruction_count, repeats):
+    results = {}
+    cpu, block_compiler = create_benchmark_machine(engine)
+
+    for name, body in get_microbenchmark_programs().items():
+        # Best of a few runs, it's the least disturbed by everything else running on the host
+        best_result = None
+        for _ in range(repeats):
+            result = get_result(*run_microbenchmark(cpu, block_compiler, body, instruction_count))
+            if best_result is None or result["instructions_per_second"] > best_result["instructions_per_second"]:
+                best_result = result
+
+        results[f"micro/{name}"] = best_result
+        print_result(f"micro/{name}", best_result)
+
+    return results
+
+
+def run_macrobenchmarks(engine, checkpoints):
+    results = {}
+    cpu, block_compiler = create_benchmark_machine(engine)
+
+    for instructions, seconds in run_boot_benchmark(cpu, block_compiler, checkpoints):
+        results[f"macro/boot_to_{instructions}"] = get_result(instructions, seconds)
+        print_result(f"macro/boot_to_{instructions}", results[f"macro/boot_to_{instructions}"])
+
+    return results
+
+
+def print_result(name, result):
+    print(f"    {name:<32} {result['instructions']:>12} instr. {result['seconds']:>9.3f} s"
+          f" {result['instructions_per_second']:>12.0f} instr./s", flush=True)
+
+
+def print_comparison(results, baseline):
+    print(f"\n    {'Benchmark':<32} {'Baseline':>12} {'Current':>12} {'Change':>9}")
+
+    for name, result in results.items():
+        current = result["instructions_per_second"]
+        if name in baseline["benchmarks"]:
+            previous = baseline["benchmarks"][name]["instructions_per_second"]
+            print(f"    {name:<32} {previous:>12.0f} {current:>12.0f} {100 * (current - previous) / previous:>+8.1f}%")
+        else:
+            print(f"    {name:<32} {'-':>12} {current:>12.0f} {'-':>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of the RISC-V emulator")
+    parser.add_argument("--suite", choices=["all", "micro", "macro"], default="all")
+    parser.add_argument("--engine", choices=[engine.name.lower() for engine in ExecutionEngine],
+                        default=EXECUTION_ENGINE.name.lower())
+    parser.add_argument("--instructions", type=int, default=DEFAULT_MICROBENCHMARK_INSTRUCTIONS,
+                        help="number of instructions executed by every microbenchmark")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS,
+                        help="microbenchmarks are repeated, and the best result is taken")
+    parser.add_argument("--boot-checkpoints", default=DEFAULT_BOOT_CHECKPOINTS,
+                        help="comma separated instruction counts at which the boot time is measured")
+    parser.add_argument("--output", help="save the results to this JSON file")
+    parser.add_argument("--baseline", help="compare the results with a JSON file saved by a previous run")
+    arguments = parser.parse_args()
+
+    engine = ExecutionEngine[arguments.engine.upper()]
+    print(f" [BENCHMARK] Engine: {engine.name}, Python {platform.python_version()} ({platform.python_implementation()})")
+
+    results = {}
+    if arguments.suite in ("all", "micro"):
+        results.update(run_microbenchmarks(engine, arguments.instructions, arguments.repeats))
+    if arguments.suite in ("all", "macro"):
+        checkpoints = [int(checkpoint) for checkpoint in arguments.boot_checkpoints.split(",")]
+        results.update(run_macrobenchmarks(engine, checkpoints))
+
+    if arguments.baseline is not None:
+        with open(arguments.baseline, 'r') as file:
+            print_comparison(results, json.load(file))
+
+    if arguments.output is not None:
+        with open(arguments.output, 'w') as file:
+            json.dump({"engine": engine.name,
+                       "python_version": platform.python_version(),
+                       "python_implementation": platform.python_implementation(),
+                       "benchmarks": results}, file, indent=4)
+        print(f"\n [BENCHMARK] Results saved to '{arguments.output}'")
+
+
+if __name__ == '__main__':
+    main()
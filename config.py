@@ -7,6 +7,23 @@ class ReportType(Enum):
     LONG_REPORT = 2
     ONELINE_LONG_REPORT = 3
     ONLY_PROGRESS_REPORT = 4
+    INSTRUCTION_MIX_REPORT = 5  # Periodically prints how many times each instruction was executed and how long it took
+    BINARY_TRACE = 6            # Writes every executed instruction into a compact binary file (see BINARY_TRACE_PATH)
+
+
+class ExecutionEngine(Enum):
+    INTERPRETER = 0     # Executes one instruction at a time. Supports all logger report types
+    BLOCK_COMPILER = 1  # Compiles guest basic blocks into Python functions. Only ONLY_PROGRESS_REPORT and BINARY_TRACE are supported
+
+
+class Timebase(Enum):
+    INSTRUCTION_COUNT = 0  # mtime advances by one tick per executed instruction, every run is the same (deterministic)
+    WALL_CLOCK = 1         # mtime follows the host clock, the emulator sleeps while the guest is idle (WFI)
+
+
+class ProfilerMode(Enum):
+    INSTRUCTION_COUNT = 0  # Guest profiler takes a sample every PROFILER_SAMPLE_INTERVAL executed instructions
+    HOST_TIMER = 1         # Guest profiler takes a sample every PROFILER_TIMER_INTERVAL seconds of host CPU time (not on Windows)
 
 
 # File paths
@@ -16,35 +33,138 @@ LINKER_MAP_FILE_PATH = 'Linux_kernel_image/debug_info/System.map'
 
 
 # VM/Emulator address space
-RAM_SIZE = 64*1024*1024
+RAM_SIZE = 64*1024*1024  # Can be changed freely, memory node of the device tree is updated at startup
 START_ADDRESS_OF_RAM  = 0x80000000
+START_ADDRESS_OF_PLIC = 0x0C000000
 START_ADDRESS_OF_UART = 0x10000000
+START_ADDRESS_OF_VIRTIO_BLOCK = 0x10010000
+START_ADDRESS_OF_HOST_FILE_CHANNEL = 0x10020000
 START_ADDRESS_OF_TIMER_CLINT = 0x11000000
 
+# Interrupt sources (numbers of the interrupt lines of the PLIC) of the devices
+VIRTIO_BLOCK_INTERRUPT_SOURCE = 1
+UART_INTERRUPT_SOURCE = 10
+
+
+# CPU execution engine
+EXECUTION_ENGINE = ExecutionEngine.INTERPRETER
+
+# Timer (CLINT) of the machine
+TIMEBASE = Timebase.INSTRUCTION_COUNT
+TIMER_FREQUENCY = 1000000              # Ticks of mtime per second, written into the device tree (timebase-frequency)
+WALL_CLOCK_TIMER_CHECK_INTERVAL = 1000  # With Timebase.WALL_CLOCK, the host clock is checked every N instructions
+
+# With Timebase.INSTRUCTION_COUNT: when the idle kernel executes WFI, the timer (mtime) jumps forward to the next
+# timer interrupt, instead of executing the idle loop until that time. Guest time then runs faster than the host time
+# while the guest is idle
+WFI_SKIPS_IDLE_TIME = True
+
+# UART (16550) - with its receive interrupt enabled, the UART moves console input into its receive FIFO every N
+# instructions (and whenever the CPU executes WFI)
+UART_INPUT_CHECK_INTERVAL = 1000
+
+# Console of the kernel, written into the kernel command line in the device tree:
+#   "hvc0"  - console through CSR registers, polled by the kernel on timer ticks
+#   "ttyS0" - interrupt-driven UART
+KERNEL_CONSOLE = "hvc0"
+
+
+# Disk - file with a disk image, attached as a virtio-mmio block device (see devices/device_virtio_block.py). The file
+# is memory mapped, so the guest reads and writes it directly (changes are written into the file)
+VIRTIO_BLOCK_IMAGE_PATH = None
+VIRTIO_BLOCK_READ_ONLY = False
+
+# Host file channel - programs in the guest can read and write these host files directly from/into their memory
+# (see devices/device_host_file_channel.py). List of (path, mode), mode is "r" or "w" (the file is truncated at
+# startup), the guest refers to a file by its index. Example:
+#   HOST_FILE_CHANNEL_FILES = [("input.bin", "r"), ("results.bin", "w")]
+HOST_FILE_CHANNEL_FILES = None
+
+# Snapshots of the whole machine (RAM, registers, devices), see emulator_management/snapshot.py
+SNAPSHOT_LOAD_PATH = None               # If set, the emulator continues from this snapshot instead of booting Linux
+SNAPSHOT_SAVE_PATH = None               # If set, the snapshot is saved to this file ...
+SNAPSHOT_SAVE_AT_INSTRUCTION_NO = None  # ... after this many instructions are executed (emulation then continues)
+# After a snapshot is saved or loaded, an incremental snapshot (only RAM pages changed since the previous snapshot)
+# is saved every SNAPSHOT_CHECKPOINT_INTERVAL instructions. "{instruction_no}" in the path is replaced with the number
+# of executed instructions
+SNAPSHOT_CHECKPOINT_INTERVAL = None
+SNAPSHOT_CHECKPOINT_PATH = "checkpoint_{instruction_no}.snapshot"
+
+
+# Fork server - boots once and runs every received shell command in a forked copy of the machine
+# (see emulator_management/fork_server.py). Needs Linux/macOS
+FORK_SERVER_ENABLED = False
+FORK_SERVER_SOCKET_PATH = "emulator.sock"
+FORK_SERVER_PROMPT = "~ # "                         # Console output which means that the shell waits for a command
+FORK_SERVER_BOOT_INSTRUCTION_LIMIT = 100000000     # Boot (or resume from snapshot) must reach the prompt in this limit
+FORK_SERVER_JOB_INSTRUCTION_LIMIT = 100000000      # Job is stopped if the prompt doesn't come back in this limit
+
+
+# Headless automation - script of expect/send steps for the console, the emulator exits when the script is done
+# (see emulator_management/automation.py). Keyboard input is disabled while the script runs. Example:
+#   AUTOMATION_SCRIPT = [("expect", "~ # "), ("send", "uname -a\r"), ("expect", "~ # ")]
+AUTOMATION_SCRIPT = None
+AUTOMATION_DEFAULT_TIMEOUT = 100000000  # Max. number of instructions an "expect" step waits for its text
+
+
+# Sampling profiler of the guest code (see emulator_management/guest_profiler.py). Results are written when the
+# emulator exits (also with Ctrl+C)
+PROFILER_MODE = None                          # None (disabled) or ProfilerMode
+PROFILER_SAMPLE_INTERVAL = 10007              # Instructions between samples (not a round number, to avoid sampling
+                                              # in step with periodic guest code)
+PROFILER_TIMER_INTERVAL = 0.001               # Seconds of host CPU time between samples
+PROFILER_OUTPUT_PATH = "guest_profile.folded" # Folded call stacks, for flame graph tools
+PROFILER_TOP_FUNCTIONS = 25                   # Number of functions in the printed table
+
+
+# Console input can be streamed from a file, a named pipe, or stdin ("-"). The guest reads it before the keyboard
+CONSOLE_INPUT_PATH = None
+CONSOLE_INPUT_CHUNK_SIZE = 64 * 1024   # Stream is read in chunks of this size ...
+CONSOLE_INPUT_MAX_CHUNKS = 16          # ... and at most this many chunks wait for the guest, then the reading waits
+
+# Console server - console of the guest on a local socket, for clients attached with
+#   python3 -m emulator_management.console_server
+# (see emulator_management/console_server.py). When enabled, the emulator runs headless (no terminal output/keyboard)
+CONSOLE_SERVER_ADDRESS = None                  # Path of a Unix socket, or ("127.0.0.1", port) for TCP
+CONSOLE_SERVER_CLIENT_BUFFER_SIZE = 256 * 1024  # Output for a client that reads slower than that is dropped
+CONSOLE_SERVER_HISTORY_SIZE = 4096             # Last bytes of the output sent to a newly attached client
+CONSOLE_SERVER_SEND_INTERVAL = 0.01            # Seconds between sending the output to the clients
+
+# Console output of the guest is printed in chunks: after a newline, when the buffer is full, or when the oldest
+# buffered character waits longer than the interval (in seconds)
+CONSOLE_OUTPUT_BUFFER_SIZE = 4096
+CONSOLE_OUTPUT_FLUSH_INTERVAL = 0.05
+
 
 # Options for easier debugging
 TTY_OUTPUT_ENABLED = True
 LOGGER_PRINT_DEVICE_ACTIVITY = False
 LOGGER_PRINT_CSR_REGISTER_ACTIVITY = False
 
-TEST_UART_INPUT = ""
 LOGGER_REPORT_TYPE = ReportType.NONE
 START_TRACEOUT_AT_INSTRUCTION_NO = None
 STOP_TRACEOUT_AT_INSTRUCTION_NO = None
 EXIT_EMULATOR_AT_INSTRUCTION_NO  = None
 BREAKPOINT_AT_INSTRUCTION_NO = None
+INSTRUCTION_MIX_REPORT_INTERVAL = 5000000  # Number of executed instructions between two instruction mix reports
+
+# Binary trace (ReportType.BINARY_TRACE) - executed instructions between START_TRACEOUT_AT_INSTRUCTION_NO and
+# STOP_TRACEOUT_AT_INSTRUCTION_NO, see emulator_management/binary_trace.py for the format and the analysis tools
+BINARY_TRACE_PATH = "trace.bin"
+BINARY_TRACE_RING_SIZE = None      # None - the trace is written while running, N - only the last N instructions are
+                                   # kept in memory, and written when the emulator exits
+BINARY_TRACE_COMPRESSION = "zlib"  # "zlib", "lzma" (smaller, but slower) or None
+BINARY_TRACE_CHUNK_SIZE = 65536    # Instructions per compressed chunk
 
 
 # Default settings for Windows and Linux
 if system() == 'Windows' or system() == "Linux":
-    TEST_UART_INPUT = ""
     START_TRACEOUT_AT_INSTRUCTION_NO = 0
     STOP_TRACEOUT_AT_INSTRUCTION_NO = 61000001
     LOGGER_REPORT_TYPE = ReportType.ONLY_PROGRESS_REPORT
 else:
-    TEST_UART_INPUT = "ls -lah / \r\n"
+    AUTOMATION_SCRIPT = [("expect", "~ # "), ("send", "ls -lah /\r"), ("expect", "~ # ")]
     START_TRACEOUT_AT_INSTRUCTION_NO = 0
-    EXIT_EMULATOR_AT_INSTRUCTION_NO = 67750000
     LOGGER_REPORT_TYPE = ReportType.ONLY_PROGRESS_REPORT
 
 
@@ -0,0 +1,351 @@
+from config import START_ADDRESS_OF_RAM, RAM_SIZE
+from cpu.instruction_cache import CODE_PAGE_SIZE_BITS
+from cpu.instruction_executer import execute_LB, execute_LH, execute_LW, execute_LBU, execute_LHU, execute_SB, \
+    execute_SH, execute_SW, execute_ADDI, execute_SLLI, execute_SLTIU, execute_XORI, execute_SRLI, execute_SRAI, \
+    execute_ORI, execute_ANDI, execute_LUI, execute_AUIPC, execute_ADD, execute_SUB, execute_SLL, execute_SLT, \
+    execute_SLTU, execute_XOR, execute_SRL, execute_SRA, execute_OR, execute_AND, execute_MUL, execute_MULH, \
+    execute_MULHU, execute_DIV, execute_DIVU, execute_REM, execute_REMU, execute_BEQ, execute_BNE, execute_BLT, \
+    execute_BGE, execute_BLTU, execute_BGEU, execute_JAL, execute_JALR, execute_FENCE
+
+# Longer blocks are split into multiple blocks. Interrupts are checked only between blocks, so this also limits
+# how long an interrupt can wait before it is handled
+MAX_BLOCK_LENGTH = 64
+
+# Marks addresses that were never compiled. "None" is already used for addresses where no block can be compiled
+NOT_COMPILED = object()
+
+
+# Alternative execution engine to the instruction-by-instruction interpreter in cpu/instruction_executer.py
+#
+# A "basic block" is a straight-line sequence of instructions, that is always executed from the first to the last
+# instruction. This class finds such blocks in the guest code and translates each of them into the source code of a
+# single Python function, which is then compiled by Python's compile(). Inside that function the guest registers are
+# kept in local variables (x1, x2, ...) and are written back to registers.x only when the block exits. That way we
+# skip the decoding, the function calls, the logging and the "x0 = 0" reset that the interpreter does for every
+# single instruction.
+#
+# A block ends:
+#   - after a branch or jump instruction (it changes the instruction pointer)
+#   - before a CSR, ecall, ebreak, mret, wfi or atomic instruction. These have side effects on the rest of the
+#     emulator, so they are always executed by the interpreter
+#   - before a load/store that doesn't access RAM (MMIO access to a device), or a store that would overwrite cached
+#     code. This can only be known when the instruction is executed, so the compiled code checks the address and
+#     exits from the block if needed. The interpreter then executes that instruction
+#
+# Compiled function returns the number of executed instructions. If it returns 0, the first instruction of the block
+# could not be executed by the compiled code and the caller must execute it with the interpreter
+#
+# With the binary trace (see emulator_management/binary_trace.py) the compiled code also appends the value of the
+# destination register after every instruction, and records the executed instructions when it exits
+class Block_compiler:
+
+    def __init__(self, cpu):
+        self.cpu = cpu
+        self.instruction_cache = cpu.instruction_cache
+        self.binary_trace = cpu.logger.binary_trace
+
+        # Block start address -> compiled function (or None if there is no block that starts at that address)
+        self.blocks = {}
+
+        # Page number -> list of start addresses of the blocks that contain instructions from that page
+        self.block_pages = {}
+
+        # Every instruction of a block is fetched through the instruction cache, so each page with compiled code is
+        # also tracked there. When a write into such page is detected, we drop all blocks from that page
+        self.instruction_cache.invalidation_listeners.append(self.invalidate_page)
+
+    def get_block(self, address):
+        block = self.blocks.get(address, NOT_COMPILED)
+
+        if block is NOT_COMPILED:
+            block = self.compile_block(address)
+
+        return block
+
+    def invalidate_page(self, page_number):
+        for address in self.block_pages.pop(page_number, ()):
+            self.blocks.pop(address, None)
+
+    def compile_block(self, start_address):
+        block_instructions = []
+
+        address = start_address
+        while len(block_instructions) < MAX_BLOCK_LENGTH:
+            # Only instructions in RAM are tracked by the instruction cache
+            if not START_ADDRESS_OF_RAM <= address < START_ADDRESS_OF_RAM + RAM_SIZE:
+                break
+
+            instruction, handler, operands = self.instruction_cache.fetch(address)
+
+            if not is_compilable(handler):
+                break
+
+            block_instructions.append((address, instruction, handler, operands))
+            address += 4
+
+            if handler in BLOCK_ENDING_HANDLERS:
+                break
+
+        block = None
+        if len(block_instructions) > 0:
+            source_code = generate_block_source(start_address, block_instructions, self.binary_trace is not None)
+            block = compile_block_function(start_address, source_code, self.binary_trace)
+
+        self.blocks[start_address] = block
+
+        first_page = start_address >> CODE_PAGE_SIZE_BITS
+        last_page = max(start_address, address - 4) >> CODE_PAGE_SIZE_BITS
+        for page_number in range(first_page, last_page + 1):
+            if page_number in self.block_pages:
+                self.block_pages[page_number].append(start_address)
+            else:
+                self.block_pages[page_number] = [start_address]
+
+        return block
+
+
+# Templates of the Python code for each instruction, filled in with the names of local variables that hold the
+# guest registers. Generated code works with unsigned 32-bit register values (same as the interpreter). For signed
+# comparisons and arithmetic shifts the values are converted to signed with ((value ^ 0x80000000) - 0x80000000),
+# which gives the same result as interpret_as_32_bit_signed_value() but without a function call
+
+# Handler -> number of bytes accessed
+LOAD_HANDLERS = {execute_LB: 1, execute_LH: 2, execute_LW: 4, execute_LBU: 1, execute_LHU: 2}
+STORE_HANDLERS = {execute_SB: 1, execute_SH: 2, execute_SW: 4}
+
+# Handler -> expression that calculates the value of the destination register
+ARITHMETIC_IMMEDIATE_TEMPLATES = {
+    execute_ADDI:  "({rs1} + {imm}) & 0xFFFFFFFF",
+    execute_SLLI:  "({rs1} << {imm}) & 0xFFFFFFFF",
+    execute_SLTIU: "1 if {rs1} < {imm} else 0",
+    execute_XORI:  "{rs1} ^ {imm}",
+    execute_SRLI:  "{rs1} >> {imm}",
+    execute_SRAI:  "((({rs1} ^ 0x80000000) - 0x80000000) >> {imm}) & 0xFFFFFFFF",
+    execute_ORI:   "{rs1} | {imm}",
+    execute_ANDI:  "{rs1} & {imm}",
+}
+
+# Division quirks (dividend -1, python's rounding towards negative infinity) are the same as in the interpreter
+ARITHMETIC_REGISTER_TEMPLATES = {
+    execute_ADD:   "({rs1} + {rs2}) & 0xFFFFFFFF",
+    execute_SUB:   "({rs1} - {rs2}) & 0xFFFFFFFF",
+    execute_SLL:   "({rs1} << ({rs2} & 0b11111)) & 0xFFFFFFFF",
+    execute_SLT:   "1 if {rs1} ^ 0x80000000 < {rs2} ^ 0x80000000 else 0",
+    execute_SLTU:  "1 if {rs1} < {rs2} else 0",
+    execute_XOR:   "{rs1} ^ {rs2}",
+    execute_SRL:   "{rs1} >> ({rs2} & 0b11111)",
+    execute_SRA:   "((({rs1} ^ 0x80000000) - 0x80000000) >> ({rs2} & 0b11111)) & 0xFFFFFFFF",
+    execute_OR:    "{rs1} | {rs2}",
+    execute_AND:   "{rs1} & {rs2}",
+    execute_MUL:   "({rs1} * {rs2}) & 0xFFFFFFFF",
+    execute_MULH:  "(((({rs1} ^ 0x80000000) - 0x80000000) * (({rs2} ^ 0x80000000) - 0x80000000)) >> 32) & 0xFFFFFFFF",
+    execute_MULHU: "(({rs1} * {rs2}) >> 32) & 0xFFFFFFFF",
+    execute_DIV:   "(0 if {rs1} == 0xFFFFFFFF else (({rs1} ^ 0x80000000) - 0x80000000) // (({rs2} ^ 0x80000000) - 0x80000000)) & 0xFFFFFFFF",
+    execute_DIVU:  "{rs1} // {rs2}",
+    execute_REM:   "(-1 if {rs1} == 0xFFFFFFFF else (({rs1} ^ 0x80000000) - 0x80000000) % (({rs2} ^ 0x80000000) - 0x80000000)) & 0xFFFFFFFF",
+    execute_REMU:  "{rs1} % {rs2}",
+}
+
+# Handler -> condition under which the branch is taken
+BRANCH_TEMPLATES = {
+    execute_BEQ:  "{rs1} == {rs2}",
+    execute_BNE:  "{rs1} != {rs2}",
+    execute_BLT:  "{rs1} ^ 0x80000000 < {rs2} ^ 0x80000000",
+    execute_BGE:  "{rs1} ^ 0x80000000 >= {rs2} ^ 0x80000000",
+    execute_BLTU: "{rs1} < {rs2}",
+    execute_BGEU: "{rs1} >= {rs2}",
+}
+
+BLOCK_ENDING_HANDLERS = (*BRANCH_TEMPLATES, execute_JAL, execute_JALR)
+
+
+# Everything else (CSR, atomic, ecall, mret, ..., and unimplemented instructions) is left to the interpreter
+def is_compilable(handler):
+    return (handler in LOAD_HANDLERS or handler in STORE_HANDLERS or handler in ARITHMETIC_IMMEDIATE_TEMPLATES
+            or handler in ARITHMETIC_REGISTER_TEMPLATES or handler in BLOCK_ENDING_HANDLERS
+            or handler in (execute_LUI, execute_AUIPC, execute_FENCE))
+
+
+def compile_block_function(start_address, source_code, binary_trace):
+    code = compile(source_code, f"<compiled block 0x{start_address:08x}>", "exec")
+
+    namespace = {"binary_trace": binary_trace}
+    exec(code, namespace)
+
+    return namespace["block"]
+
+
+class Block_source_generator:
+
+    def __init__(self, start_address, instruction_values, traced):
+        self.lines = []
+        self.written_registers = []
+
+        self.start_address = start_address
+        self.instruction_values = instruction_values
+        self.traced = traced
+
+    @staticmethod
+    def read(register_no):
+        # Register x0 is hardwired to zero
+        if register_no == 0:
+            return "0"
+        return f"x{register_no}"
+
+    # Writes to x0 end up in local variable "x0", which is never written back
+    def write(self, register_no, expression):
+        self.lines.append(f"    x{register_no} = {expression}")
+
+        if register_no != 0 and register_no not in self.written_registers:
+            self.written_registers.append(register_no)
+
+    def emit(self, line):
+        self.lines.append(f"    {line}")
+
+    # Value of the destination register after the instruction ("0" for instructions without one)
+    def emit_trace_value(self, expression):
+        if self.traced:
+            self.emit(f"append_rd_value({expression})")
+
+    def emit_exit(self, indentation, next_instruction_address, executed_instructions):
+        for register_no in self.written_registers:
+            self.lines.append(f"{indentation}x[{register_no}] = x{register_no}")
+        if self.traced and executed_instructions > 0:
+            self.lines.append(f"{indentation}binary_trace.record_block(registers.executed_instruction_counter, "
+                              f"{self.start_address}, {self.instruction_values}, {executed_instructions})")
+        self.lines.append(f"{indentation}registers.instruction_pointer = {next_instruction_address}")
+        self.lines.append(f"{indentation}return {executed_instructions}")
+
+    # Leave the block *before* executing the current instruction, if the accessed memory isn't RAM
+    def emit_RAM_check(self, access_size, instruction_address, instruction_index):
+        self.emit(f"if not {START_ADDRESS_OF_RAM} <= address <= {START_ADDRESS_OF_RAM + RAM_SIZE - access_size}:")
+        self.emit_exit("        ", instruction_address, instruction_index)
+
+
+def generate_block_source(start_address, block_instructions, traced):
+    instruction_values = tuple(instruction for address, instruction, handler, operands in block_instructions)
+    generator = Block_source_generator(start_address, instruction_values, traced)
+
+    used_registers = set()
+    for address, instruction, handler, operands in block_instructions:
+        used_registers.update(get_used_registers(handler, operands))
+    used_registers.discard(0)
+
+    next_instruction_address = start_address + 4 * len(block_instructions)
+    block_ends_with_jump = False
+
+    for index, (address, instruction, handler, operands) in enumerate(block_instructions):
+        generator.emit(f"# 0x{address:08x}")
+
+        if handler in LOAD_HANDLERS:
+            generate_load(generator, handler, operands, address, index)
+        elif handler in STORE_HANDLERS:
+            generate_store(generator, handler, operands, address, index)
+        elif handler in ARITHMETIC_IMMEDIATE_TEMPLATES:
+            destination_reg, source_reg, immediate_val = operands
+            expression = ARITHMETIC_IMMEDIATE_TEMPLATES[handler].format(rs1=generator.read(source_reg), imm=immediate_val)
+            generator.write(destination_reg, expression)
+        elif handler in ARITHMETIC_REGISTER_TEMPLATES:
+            destination_reg, source_reg_1, source_reg_2 = operands
+            expression = ARITHMETIC_REGISTER_TEMPLATES[handler].format(rs1=generator.read(source_reg_1), rs2=generator.read(source_reg_2))
+            generator.write(destination_reg, expression)
+        elif handler is execute_LUI:
+            destination_reg, immediate_val = operands
+            generator.write(destination_reg, f"{immediate_val}")
+        elif handler is execute_AUIPC:
+            destination_reg, immediate_val = operands
+            generator.write(destination_reg, f"{address + immediate_val}")
+        elif handler is execute_FENCE:
+            generator.emit("pass")
+        elif handler in BRANCH_TEMPLATES:
+            source_reg_1, source_reg_2, jump_offset = operands
+            condition = BRANCH_TEMPLATES[handler].format(rs1=generator.read(source_reg_1), rs2=generator.read(source_reg_2))
+            generator.emit(f"next_instruction_address = {address + jump_offset} if {condition} else {address + 4}")
+            block_ends_with_jump = True
+        elif handler is execute_JAL:
+            destination_reg, immediate_val = operands
+            generator.emit(f"next_instruction_address = {address + immediate_val}")
+            generator.write(destination_reg, f"{address + 4}")
+            block_ends_with_jump = True
+        elif handler is execute_JALR:
+            destination_reg, source_reg, immediate_val = operands
+            # Jump address must be calculated before the destination register is updated (rd can be the same as rs1)
+            generator.emit(f"next_instruction_address = {generator.read(source_reg)} + {immediate_val}")
+            generator.write(destination_reg, f"{address + 4}")
+            block_ends_with_jump = True
+
+        # Stores, branches and FENCE have no destination register, all other instructions have it as the first operand
+        if handler in STORE_HANDLERS or handler in BRANCH_TEMPLATES or handler is execute_FENCE:
+            generator.emit_trace_value("0")
+        else:
+            generator.emit_trace_value(generator.read(operands[0]))
+
+    if block_ends_with_jump:
+        next_instruction_address = "next_instruction_address"
+
+    generator.emit_exit("    ", next_instruction_address, len(block_instructions))
+
+    header = [
+        "def block(cpu):",
+        "    registers = cpu.registers",
+        "    x = registers.x",
+        "    memory = cpu.memory",
+        "    cached_code_pages = memory.cached_code_pages",
+    ]
+    if traced:
+        header.append("    append_rd_value = binary_trace.rd_values.append")
+    for register_no in sorted(used_registers):
+        header.append(f"    x{register_no} = x[{register_no}]")
+
+    return "\n".join(header + generator.lines) + "\n"
+
+
+# Register-only instructions have three register operands. For all others the last operand is the immediate value
+def get_used_registers(handler, operands):
+    if handler in ARITHMETIC_REGISTER_TEMPLATES:
+        return operands
+    return operands[:-1]
+
+
+def generate_load(generator, handler, operands, instruction_address, instruction_index):
+    destination_reg, source_reg, immediate_val = operands
+
+    generator.emit(f"address = {generator.read(source_reg)} + {immediate_val}")
+    generator.emit_RAM_check(LOAD_HANDLERS[handler], instruction_address, instruction_index)
+
+    if handler is execute_LB:
+        generator.emit("value = memory.get_1_byte(address)")
+        generator.write(destination_reg, "(value | 0xFFFFFF00) if value & 0x80 else value")
+    elif handler is execute_LH:
+        generator.emit("value = memory.get_2_bytes__little_endian(address)")
+        generator.write(destination_reg, "(value | 0xFFFF0000) if value & 0x8000 else value")
+    elif handler is execute_LW:
+        generator.write(destination_reg, "memory.get_4_bytes__little_endian(address)")
+    elif handler is execute_LBU:
+        generator.write(destination_reg, "memory.get_1_byte(address)")
+    elif handler is execute_LHU:
+        generator.write(destination_reg, "memory.get_2_bytes__little_endian(address)")
+
+
+def generate_store(generator, handler, operands, instruction_address, instruction_index):
+    source_reg_1, source_reg_2, immediate_val = operands
+
+    access_size = STORE_HANDLERS[handler]
+
+    generator.emit(f"address = {generator.read(source_reg_1)} + {immediate_val}")
+    generator.emit_RAM_check(access_size, instruction_address, instruction_index)
+
+    # A write into a page with cached code could change the instructions of this very block, so such writes are
+    # left to the interpreter (which also drops the affected blocks)
+    if access_size == 1:
+        generator.emit(f"if address >> {CODE_PAGE_SIZE_BITS} in cached_code_pages:")
+    else:
+        generator.emit(f"if address >> {CODE_PAGE_SIZE_BITS} in cached_code_pages or (address + {access_size - 1}) >> {CODE_PAGE_SIZE_BITS} in cached_code_pages:")
+    generator.emit_exit("        ", instruction_address, instruction_index)
+
+    if handler is execute_SB:
+        generator.emit(f"memory.write_1_byte(address, {generator.read(source_reg_2)} & 0xFF)")
+    elif handler is execute_SH:
+        generator.emit(f"memory.write_2_bytes__little_endian(address, {generator.read(source_reg_2)})")
+    elif handler is execute_SW:
+        generator.emit(f"memory.write_4_bytes__little_endian(address, {generator.read(source_reg_2)})")
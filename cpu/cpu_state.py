@@ -0,0 +1,22 @@
+# Groups together everything that an instruction needs during its execution, so we don't need to pass 5-6 arguments
+# to every function that executes instructions
+class CPU_state:
+
+    def __init__(self, registers, CSR_registers, trap_and_interrupt_handler, memory, logger):
+        self.registers = registers
+        self.CSR_registers = CSR_registers
+        self.trap_and_interrupt_handler = trap_and_interrupt_handler
+        self.memory = memory
+        self.logger = logger
+
+        # Set later (in create_machine), after the instruction cache is created for this CPU
+        self.instruction_cache = None
+
+        # Set later (in create_machine). Used by the WFI instruction to skip the idle time
+        self.device_timer_CLINT = None
+
+        # Set later (in create_machine). WFI checks it for console input before the CPU goes idle
+        self.device_UART_8250 = None
+
+        # Set later (in create_machine). Events of the devices, run by the CPU loop (see cpu/event_scheduler.py)
+        self.event_scheduler = None
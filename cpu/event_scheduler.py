@@ -0,0 +1,57 @@
+# Devices that need to do something at a certain time (the timer raising its interrupt) don't check the time before
+# every instruction. Instead, they schedule an event at the instruction no. when it has to happen, and the CPU loop
+# only compares the instruction counter with a single number - the instruction no. of the nearest event.
+#
+# Time is the number of executed instructions (registers.executed_instruction_counter), the same as the timer uses.
+# With the block compiler, events are run only between the blocks, so they can be run a few instructions late.
+#
+# Every device has at most one event, scheduling a new one replaces the previous one.
+
+# Instruction no. that is never reached, used when there are no events
+NO_EVENT = 1 << 64
+
+
+class Event_scheduler:
+
+    def __init__(self, registers):
+        self.registers = registers
+
+        # Name of the device -> (instruction no., function called at that instruction no.)
+        self.events = {}
+
+        # Instruction no. of the nearest event, checked by the CPU loop between instructions
+        self.next_event_at_instruction_no = NO_EVENT
+
+    # Default instruction no. 0 means "before the next instruction". Used when a device has to react to something
+    # that happened during the current instruction (like a register write)
+    def schedule_event(self, name, callback, at_instruction_no=0):
+        self.events[name] = (at_instruction_no, callback)
+        self.next_event_at_instruction_no = min(self.next_event_at_instruction_no, at_instruction_no)
+
+    def cancel_event(self, name):
+        if self.events.pop(name, None) is not None:
+            self.update_next_event()
+
+    # Called by the CPU loop when the instruction counter reaches next_event_at_instruction_no
+    def run_due_events(self):
+        now = self.registers.executed_instruction_counter
+
+        due_events = sorted((at_instruction_no, name) for name, (at_instruction_no, callback) in self.events.items()
+                            if at_instruction_no <= now)
+        for at_instruction_no, name in due_events:
+            # Callback can schedule a new event for the same device (or cancel events of others), so the event is
+            # removed before its callback is called
+            event = self.events.pop(name, None)
+            if event is not None:
+                event[1]()
+
+        self.update_next_event()
+
+    def update_next_event(self):
+        self.next_event_at_instruction_no = min((at_instruction_no for at_instruction_no, callback in self.events.values()),
+                                                default=NO_EVENT)
+
+
+if __name__ == '__main__':
+    print(f"\nExecuting:\n\t{__file__} \n")
+    print("Hopefully here we will have tests for functions in this file")
@@ -0,0 +1,68 @@
+from config import START_ADDRESS_OF_RAM, RAM_SIZE
+from cpu.instruction_executer import decode_instruction
+
+# Cached instructions are grouped into pages, so that a write into memory only needs to check if it hit a page
+# with cached instructions, and not every single cached address
+CODE_PAGE_SIZE_BITS = 12  # 4 KiB pages
+
+
+# Decoding the instruction (extracting register numbers, sign-extending immediate values and finding the function
+# which executes it) always gives the same result for the same instruction value. Kernel code almost never changes,
+# so instead of fetching and decoding the instruction at the same address over and over again, we do it only once
+# and store the result in a dict with the instruction address as the key.
+#
+# If the CPU writes into memory that contains cached instructions (loading of a user-space program, self-modifying
+# code, ...), the Address_Space calls invalidate_page() and all cached instructions in that page are dropped
+class Instruction_cache:
+
+    def __init__(self, memory):
+        self.memory = memory
+
+        # Instruction address -> (instruction, handler, operands)
+        self.entries = {}
+
+        # Page number -> list of cached instruction addresses in that page
+        self.code_pages = {}
+
+        # Functions that are called with the page number when cached instructions of a page are dropped. Used by
+        # caches that are built on top of this one (see cpu/block_compiler.py)
+        self.invalidation_listeners = []
+
+        memory.attach_instruction_cache(self)
+
+    def fetch(self, address):
+        entry = self.entries.get(address)
+
+        if entry is None:
+            entry = self.fetch_and_decode(address)
+
+        return entry
+
+    def fetch_and_decode(self, address):
+        instruction = self.memory.get_4_bytes__little_endian(address)
+        handler, operands = decode_instruction(instruction)
+        entry = (instruction, handler, operands)
+
+        # Only RAM is tracked for writes, so we can't cache instructions that are executed from anywhere else
+        if START_ADDRESS_OF_RAM <= address < START_ADDRESS_OF_RAM + RAM_SIZE:
+            self.entries[address] = entry
+
+            page_number = address >> CODE_PAGE_SIZE_BITS
+            if page_number in self.code_pages:
+                self.code_pages[page_number].append(address)
+            else:
+                self.code_pages[page_number] = [address]
+
+        return entry
+
+    def invalidate_page(self, page_number):
+        for address in self.code_pages.pop(page_number, ()):
+            del self.entries[address]
+
+        for listener in self.invalidation_listeners:
+            listener(page_number)
+
+    # Used when the whole RAM is replaced (for example when a snapshot is loaded)
+    def invalidate_all(self):
+        for page_number in list(self.code_pages):
+            self.invalidate_page(page_number)
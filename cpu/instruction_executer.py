@@ -1,937 +1,1232 @@
+from string import Formatter
+
 from utils.helper_functions import interpret_as_32_bit_signed_value, interpret_as_12_bit_signed_value, \
     interpret_as_20_bit_signed_value, interpret_as_21_bit_signed_value, convert_to_32_bit_unsigned_value, \
     sign_extend_12_bit_value, interpret_as_13_bit_signed_value
 from cpu.instruction_decoder import Instruction_parser
 
 
-# TODO: This function is almost 900 lines long, it desperately needs to be split up into multiple functions
-def execute_instruction(instruction, registers, CSR_registers, trap_and_interrupt_handler, memory, logger):
+# Executing an instruction is split into two steps:
+#   1. decode_instruction() - finds the function that executes the instruction and extracts its operands (register
+#      numbers, already sign-extended immediate values, ...) out of the instruction bits
+#   2. execute_decoded_instruction() - calls that function
+#
+# Result of the first step depends only on the instruction value, so it can be cached and reused every time the CPU
+# executes the instruction at the same address again (see cpu/instruction_cache.py)
+def execute_instruction(instruction, cpu):
+    handler, operands = decode_instruction(instruction)
 
-    logger.register_one_CPU_step(instruction, registers, CSR_registers, memory, trap_and_interrupt_handler)
+    return execute_decoded_instruction(instruction, handler, operands, cpu)
 
-    # Extract the 'operation/instruction' type
-    opcode = instruction & 0b01111111
 
-    instruction_pointer_updated = False
+def execute_decoded_instruction(instruction, handler, operands, cpu):
+    registers, logger = cpu.registers, cpu.logger
 
-    # --- 'Load' instructions ---
-    if opcode == 0x03:
-        instruction_subtype, destination_reg, source_reg, immediate_val = Instruction_parser.decode_I_type(instruction)
+    logger.register_one_CPU_step(instruction, registers, cpu.CSR_registers, cpu.memory, cpu.trap_and_interrupt_handler, handler)
 
-        # Immediate is a signed value for all 'load' instructions
-        immediate_val = interpret_as_12_bit_signed_value(immediate_val)
+    instruction_pointer_updated = handler(cpu, instruction, operands)
 
-        base_address = registers.x[source_reg]
-        offset = immediate_val
+    registers.executed_instruction_counter += 1
 
-        address = base_address + offset
+    # Handlers don't build any trace messages. The logger gets only the handler and operands of the executed
+    # instruction, and turns them into text (see format_executed_instruction) only if the trace is actually printed
+    if logger.instruction_events_enabled:
+        logger.register_executed_instruction(handler, operands)
 
-        # --- Instruction 'LB' ---
-        if instruction_subtype == 0:
-            value = memory.get_1_byte(address)
+    return instruction_pointer_updated
 
-            # SIGN-EXTEND THE BYTE
-            # If the last (8th) bit of the byte is set to '1', it means that the value is negative (if we interpreted it
-            # as signed value)
-            # When loading this 8-bit long byte into a 32-bit long register, ff we want to keep that value as negative
-            # number (and as the same negative value) we need to extend '1's to all additional bits
-            # For example:
-            #   1111 is -1 as a 4-bit value. But as a 8-bit value 00001111 it is 15 when we interpret it as signed value
-            #   If we want to keep -1 when expanding 4-bit value into 8-bit space, we need to add '1's -> 11111111
-            if value & 0b10000000 != 0:
-                value = value | 0xFFFFFF00
 
-            registers.x[destination_reg] = value
+# Returns a tuple (handler, operands) where handler is a function that executes the instruction
+#
+# Which instruction it is, is defined by the bit fields opcode, funct3 and funct7 (see instruction_decoder.py), so
+# instead of comparing these fields one by one in a long if/elif chain we just put them together into a single number
+# and use it as an index into DISPATCH_TABLE. Every entry of the table holds the handler for that instruction and
+# the function that extracts operands of the instruction
+def decode_instruction(instruction):
+    handler, decode_operands = DISPATCH_TABLE[get_dispatch_key(instruction)]
 
-            logger.register_executed_instruction(f"lb x{destination_reg}, {immediate_val}(x{source_reg})  (Load Byte, 8-bit - With sign extension)")
-            pass
+    # Few instructions (ecall/ebreak/wfi/mret) share the same opcode, funct3 and funct7. For those there is no handler
+    # in the table, only a function that finds the handler by looking into the rest of the instruction
+    if handler is None:
+        return decode_operands(instruction)
 
-        # --- Instruction 'LH' ---
-        elif instruction_subtype == 1:
-            value = memory.get_2_bytes__little_endian(address)
+    return handler, decode_operands(instruction)
 
-            # Sign-extend it (For explanation see handling for instruction 'LB')
-            if value & 0x8000 != 0:
-                value = value | 0xFFFF0000
 
-            registers.x[destination_reg] = value
+#                                   funct7                          funct3               opcode
+# Instruction bit no. |  31 30 29 28 27 26 25 | 24 ... 15 |  14 13 12  | 11 ... 07 | 06 05 04 03 02 01 00
+# Dispatch key bit no.|  16 15 14 13 12 11 10 |    n/a    |  09 08 07  |    n/a    | 06 05 04 03 02 01 00
+def get_dispatch_key(instruction):
+    return (instruction & 0x7F) | ((instruction >> 5) & 0x380) | ((instruction >> 15) & 0x1FC00)
 
-            logger.register_executed_instruction(f"lh x{destination_reg}, {immediate_val}(x{source_reg})  (Load Half-word, 16-bit - With sign extension)")
-            pass
 
+# ============================================================================================================
+#  Load instructions
+# ============================================================================================================
 
-        # --- Instruction 'LW' ---
-        elif instruction_subtype == 2:
-            value = memory.get_4_bytes__little_endian(address)
+# --- Instruction 'LB' ---
+def execute_LB(cpu, instruction, operands):
+    registers = cpu.registers
+    destination_reg, source_reg, immediate_val = operands
 
-            registers.x[destination_reg] = value
+    value = cpu.memory.get_1_byte(registers.x[source_reg] + immediate_val)
 
-            logger.register_executed_instruction(f"lw x{destination_reg}, {immediate_val}(x{source_reg})  (Load Word, 32-bit)")
-            pass
+    # SIGN-EXTEND THE BYTE
+    # If the last (8th) bit of the byte is set to '1', it means that the value is negative (if we interpreted it
+    # as signed value)
+    # When loading this 8-bit long byte into a 32-bit long register, ff we want to keep that value as negative
+    # number (and as the same negative value) we need to extend '1's to all additional bits
+    # For example:
+    #   1111 is -1 as a 4-bit value. But as a 8-bit value 00001111 it is 15 when we interpret it as signed value
+    #   If we want to keep -1 when expanding 4-bit value into 8-bit space, we need to add '1's -> 11111111
+    if value & 0b10000000 != 0:
+        value = value | 0xFFFFFF00
 
-        # --- Instruction 'LBU' ---
-        elif instruction_subtype == 4:
-            value = memory.get_1_byte(address)
+    registers.x[destination_reg] = value
 
-            registers.x[destination_reg] = value
+    return False
 
-            logger.register_executed_instruction(f"lbu x{destination_reg}, {immediate_val}(x{source_reg})  (Load Byte, 8-bit - Unsigned)")
-            pass
 
-        # --- Instruction 'LHU' ---
-        elif instruction_subtype == 5:
-            value = memory.get_2_bytes__little_endian(address)
+# --- Instruction 'LH' ---
+def execute_LH(cpu, instruction, operands):
+    registers = cpu.registers
+    destination_reg, source_reg, immediate_val = operands
 
-            registers.x[destination_reg] = value
+    value = cpu.memory.get_2_bytes__little_endian(registers.x[source_reg] + immediate_val)
 
-            logger.register_executed_instruction(f"lhu x{destination_reg}, {immediate_val}(x{source_reg})  (Load Half-word, 16-bit - Unsigned)")
-            pass
-        else:
-            print(f"[ERROR] Instruction not implemented: 0x{instruction:08x} !!")
-            raise Exception("Unimplemented instruction")
-        pass
+    # Sign-extend it (For explanation see handling for instruction 'LB')
+    if value & 0x8000 != 0:
+        value = value | 0xFFFF0000
 
-    # --- Instruction 'FENCE' ---
-    elif opcode == 0x0f:
-        # Fence is only relevant for more complex CPU implementations
-        logger.register_executed_instruction(f"fence (Ignored instruction)")
-        pass
+    registers.x[destination_reg] = value
 
-    # --- Arithmetic/Logic instructions with immediate ---
-    elif opcode == 0x13:
-        # Arithmetic/logic instructions with immediate value hardcoded into instruction
-        # Instruction_parser.print_I_type_instruction(instruction)
+    return False
 
-        instruction_subtype, destination_reg, source_reg, immediate_val = Instruction_parser.decode_I_type(instruction)
 
-        source_reg_value = registers.x[source_reg]
+# --- Instruction 'LW' ---
+def execute_LW(cpu, instruction, operands):
+    registers = cpu.registers
+    destination_reg, source_reg, immediate_val = operands
 
-        # --- Instruction 'ADDI' ---
-        if instruction_subtype == 0:
-            sign = ""
+    registers.x[destination_reg] = cpu.memory.get_4_bytes__little_endian(registers.x[source_reg] + immediate_val)
 
-            # The first bit (MSB) tells if the values is negative or not
-            # If the first bit of the value is set to 1, then the values is negative, encoded as Two's_complement
-            # https://en.wikipedia.org/wiki/Two's_complement
-            # TODO: Just replace with helper functions
-            if (immediate_val & 0b100000000000) == 0:
-                registers.x[destination_reg] = source_reg_value + immediate_val
-            else:
-                immediate_val = (~immediate_val & 0xFFF) + 1
-                registers.x[destination_reg] = source_reg_value - immediate_val
-                sign = "-"
+    return False
 
-            # Shorten the register value to 32 bits if it's longer than that after add/sub
-            registers.x[destination_reg] = registers.x[destination_reg] & 0xFFFFFFFF
 
-            logger.register_executed_instruction(f"addi x{destination_reg}, x{source_reg}, {sign}{immediate_val}  (Add immediate)")
-            pass
+# --- Instruction 'LBU' ---
+def execute_LBU(cpu, instruction, operands):
+    registers = cpu.registers
+    destination_reg, source_reg, immediate_val = operands
 
-        # --- Instruction 'SLLI' ---
-        elif instruction_subtype == 1:
-            # There are only 32 bits in registers so the valid immediate values are up to 2**5
-            if immediate_val & 0x111111100000 != 0:
-                print(f"[ERROR] SLLI: Invalid instruction encoding !!")
-                raise Exception("Invalid instruction")
+    registers.x[destination_reg] = cpu.memory.get_1_byte(registers.x[source_reg] + immediate_val)
 
-            value_to_be_shifted = source_reg_value
-            shift_amount = immediate_val & 0b11111  # Get only the lower 5 bits of the immediate
+    return False
 
-            result = value_to_be_shifted << shift_amount
 
-            registers.x[destination_reg] = result & 0xFFFFFFFF  # Shorten to 32 bits
+# --- Instruction 'LHU' ---
+def execute_LHU(cpu, instruction, operands):
+    registers = cpu.registers
+    destination_reg, source_reg, immediate_val = operands
 
-            logger.register_executed_instruction(f"slli x{destination_reg}, x{source_reg}, {immediate_val}  (Shift Left Logical - Immediate)")
-            pass
+    registers.x[destination_reg] = cpu.memory.get_2_bytes__little_endian(registers.x[source_reg] + immediate_val)
 
-        # --- instruction "SLTIU" ---
-        elif instruction_subtype == 3:
+    return False
 
-            if source_reg_value < immediate_val:
-                result = 1
-            else:
-                result = 0
 
-            registers.x[destination_reg] = result
+# ============================================================================================================
+#  Store instructions
+# ============================================================================================================
 
-            logger.register_executed_instruction(f"sltiu x{destination_reg}, x{source_reg}, {immediate_val}  (Set Less Than - Immediate Unsigned)")
-            pass
+# --- instruction "SB" ---
+def execute_SB(cpu, instruction, operands):
+    registers = cpu.registers
+    source_reg_1, source_reg_2, immediate_val = operands
 
-        # --- Instruction 'XORI' ---
-        elif instruction_subtype == 4:
+    cpu.memory.write_1_byte(registers.x[source_reg_1] + immediate_val, registers.x[source_reg_2] & 0xFF)
 
-            # SIGN-EXTEND THE IMMEDIATE
-            # If the last (12th) bit of the immediate is set to '1', it means that the value is negative (if we
-            # interpreted it as signed value)
-            # When loading this 12-bit long value into a 32-bit long register, we want to keep that value as negative
-            # number (and as the exactly same negative value) we need to extend '1's to all additional bits
-            # For example:
-            #   1111 is -1 as a 4-bit value. But as a 8-bit value 00001111 it is 15 when we interpret it as signed value
-            #   If we want to keep -1 when expanding 4-bit value into 8-bit space, we need to add '1's -> 11111111
-            immediate_val = sign_extend_12_bit_value(immediate_val)
+    return False
 
-            result = source_reg_value ^ immediate_val
 
-            registers.x[destination_reg] = result
+# --- instruction "SH" ---
+def execute_SH(cpu, instruction, operands):
+    registers = cpu.registers
+    source_reg_1, source_reg_2, immediate_val = operands
 
-            logger.register_executed_instruction(f"xori x{destination_reg}, x{source_reg}, {immediate_val}  (bitwise XOR - Immediate)")
-            pass
+    cpu.memory.write_2_bytes__little_endian(registers.x[source_reg_1] + immediate_val, registers.x[source_reg_2])
 
-        # Instructions 'SRLI' and 'SRAI'
-        elif instruction_subtype == 5:
-            # For 'SRLI' and 'SRAI' the "immediate value filed" actually consists of two encoded fields - type and value
+    return False
 
-            #                      Shift instruction type     encoded value
-            # Immediate bit no. |  12 11 10 09 08 07 06 05 | 04 03 02 01 00
-            #                   |  ty ty ty ty ty ty ty ty | im im im im im
 
-            # Shift the immediate to get the shift instruction type
-            shift_instruction_type = immediate_val >> 5
+# --- instruction "SW" ---
+def execute_SW(cpu, instruction, operands):
+    registers = cpu.registers
+    source_reg_1, source_reg_2, immediate_val = operands
 
-            # Store encoded value into separate variable to be less confusing
-            shift_amount = immediate_val & 0b00000000011111
+    cpu.memory.write_4_bytes__little_endian(registers.x[source_reg_1] + immediate_val, registers.x[source_reg_2])
 
-            # --- Instruction 'SRLI' ---
-            if shift_instruction_type == 0x00:
+    return False
 
-                result = source_reg_value >> shift_amount
 
-                registers.x[destination_reg] = result
+# ============================================================================================================
+#  Arithmetic/Logic instructions with immediate value hardcoded into instruction
+# ============================================================================================================
 
-                logger.register_executed_instruction(f"srli x{destination_reg}, x{source_reg}, {shift_amount}  (Shift Right Logical - Immediate)")
-                pass
+# --- Instruction 'ADDI' ---
+def execute_ADDI(cpu, instruction, operands):
+    x = cpu.registers.x
+    destination_reg, source_reg, immediate_val = operands
 
-            # --- Instruction 'SRAI' ---
-            elif shift_instruction_type == 0x20:
-                source_reg_value = interpret_as_32_bit_signed_value(source_reg_value)
+    # Immediate is already sign-extended to 32 bits by the operand decoder, so adding a negative value is the same as
+    # adding its Two's complement and throwing away the carry above the 32nd bit
+    # https://en.wikipedia.org/wiki/Two's_complement
+    # Shorten the register value to 32 bits if it's longer than that after addition
+    x[destination_reg] = (x[source_reg] + immediate_val) & 0xFFFFFFFF
 
-                # Python's shift operator is arithmetic shift operator so it should automatically sign-extend the value
-                result = source_reg_value >> shift_amount
+    return False
 
-                registers.x[destination_reg] = result & 0xFFFFFFFF
 
-                logger.register_executed_instruction(f"srai x{destination_reg}, x{source_reg}, {shift_amount}  (Shift Right Arithmeticly - Immediate)")
-                pass
+# --- Instruction 'SLLI' ---
+def execute_SLLI(cpu, instruction, operands):
+    x = cpu.registers.x
+    destination_reg, source_reg, shift_amount = operands
 
-            else:
-                report_unimplemented_instruction(instruction, registers.instruction_pointer, registers.executed_instruction_counter)
-            pass
+    x[destination_reg] = (x[source_reg] << shift_amount) & 0xFFFFFFFF  # Shorten to 32 bits
 
-        # --- Instruction 'ORI' ---
-        elif instruction_subtype == 6:
+    return False
 
-            # This instruction interprets 12-bit immediate as signed value. Before making the logic operation on 32-bit
-            # register, we need to "sign extend" the immediate to 32-bit length
-            immediate_val = sign_extend_12_bit_value(immediate_val)
 
-            result = source_reg_value | immediate_val
+# --- instruction "SLTIU" ---
+def execute_SLTIU(cpu, instruction, operands):
+    x = cpu.registers.x
+    destination_reg, source_reg, immediate_val = operands
 
-            registers.x[destination_reg] = result
+    if x[source_reg] < immediate_val:
+        result = 1
+    else:
+        result = 0
 
-            logger.register_executed_instruction(f"ori x{destination_reg}, x{source_reg}, {immediate_val}  (bitwise OR - Immediate)")
-            pass
+    x[destination_reg] = result
 
-        # --- Instruction 'ANDI' ---
-        elif instruction_subtype == 7:
+    return False
 
-            # This instruction interprets 12-bit immediate as signed value. Before making the logic operation on 32-bit
-            # register, we need to "sign extend" the immediate to 32-bit length
-            immediate_val = sign_extend_12_bit_value(immediate_val)
 
-            result = source_reg_value & immediate_val
+# --- Instruction 'XORI' ---
+def execute_XORI(cpu, instruction, operands):
+    x = cpu.registers.x
+    destination_reg, source_reg, immediate_val = operands
 
-            registers.x[destination_reg] = result
+    x[destination_reg] = x[source_reg] ^ immediate_val
 
-            logger.register_executed_instruction(f"andi x{destination_reg}, x{source_reg}, {immediate_val}  (bitwise AND - Immediate)")
-            pass
+    return False
 
-        else:
-            print(f"[ERROR] Instruction not implemented: 0x{instruction:08x} !!")
-            raise Exception("Unimplemented instruction")
-        pass
 
-    # --- instruction "AUIPC" ---
-    elif opcode == 0x17:
+# --- Instruction 'SRLI' ---
+def execute_SRLI(cpu, instruction, operands):
+    x = cpu.registers.x
+    destination_reg, source_reg, shift_amount = operands
 
-        destination_reg, immediate_val = Instruction_parser.decode_U_type(instruction)
+    x[destination_reg] = x[source_reg] >> shift_amount
 
-        immediate_val = interpret_as_20_bit_signed_value(immediate_val)
+    return False
 
-        registers.x[destination_reg] = registers.instruction_pointer + (immediate_val << 12)
 
-        logger.register_executed_instruction(f"auipc x{destination_reg}, {immediate_val}  (Add Upper Immediate to PC)")
-        pass
+# --- Instruction 'SRAI' ---
+def execute_SRAI(cpu, instruction, operands):
+    x = cpu.registers.x
+    destination_reg, source_reg, shift_amount = operands
 
-    # --- 'Store' instructions ---
-    elif opcode == 0x23:
+    # Python's shift operator is arithmetic shift operator so it should automatically sign-extend the value
+    result = interpret_as_32_bit_signed_value(x[source_reg]) >> shift_amount
 
-        instruction_subtype, source_reg_1, source_reg_2, immediate_val = Instruction_parser.decode_S_type(instruction)
+    x[destination_reg] = result & 0xFFFFFFFF
 
-        # Immediate is a signed value for all 'store' instructions
-        immediate_val = interpret_as_12_bit_signed_value(immediate_val)
+    return False
 
-        address = registers.x[source_reg_1] + immediate_val
-        value_to_write = registers.x[source_reg_2]
 
-        # --- instruction "SB" ---
-        if instruction_subtype == 0x0:
-            memory.write_1_byte(address, value_to_write & 0xFF)
+# --- Instruction 'ORI' ---
+def execute_ORI(cpu, instruction, operands):
+    x = cpu.registers.x
+    destination_reg, source_reg, immediate_val = operands
 
-            logger.register_executed_instruction(f"sw x{source_reg_2}, {immediate_val}(x{source_reg_1})  (Store Byte, 8-bit)")
-            pass
+    x[destination_reg] = x[source_reg] | immediate_val
 
-        # --- instruction "SH" ---
-        elif instruction_subtype == 0x1:
-            memory.write_2_bytes__little_endian(address, value_to_write)
+    return False
 
-            logger.register_executed_instruction(f"sw x{source_reg_2}, {immediate_val}(x{source_reg_1})  (Store Half-word, 16-bit)")
-            pass
 
-        # --- instruction "SW" ---
-        elif instruction_subtype == 0x2:
-            memory.write_4_bytes__little_endian(address, value_to_write)
+# --- Instruction 'ANDI' ---
+def execute_ANDI(cpu, instruction, operands):
+    x = cpu.registers.x
+    destination_reg, source_reg, immediate_val = operands
 
-            logger.register_executed_instruction(f"sw x{source_reg_2}, {immediate_val}(x{source_reg_1})  (Store Word, 32-bit)")
-            pass
-        else:
-            print(f"[ERROR] Instruction not implemented: 0x{instruction:08x} !!")
-            raise Exception("Unimplemented instruction")
-        pass
+    x[destination_reg] = x[source_reg] & immediate_val
 
-    # --- RV32A Atomic instructions ---
-    elif opcode == 0x2f:
-        instruction_subtype_f3, instruction_subtype_f5, source_reg_1, source_reg_2, destination_reg = Instruction_parser.decode_R_type_atomic(instruction)
+    return False
 
-        source_reg_1_val = registers.x[source_reg_1]
-        source_reg_2_val = registers.x[source_reg_2]
 
-        if instruction_subtype_f3 == 0x2:
+# --- instruction "LUI" ---
+def execute_LUI(cpu, instruction, operands):
+    destination_reg, immediate_val = operands
 
-            # destination_reg <-- memory(source_reg_1_val)
-            old_value_in_memory = memory.get_4_bytes__little_endian(address=source_reg_1_val)
-            registers.x[destination_reg] = old_value_in_memory
+    # Immediate is already shifted into bits [31:12] by the operand decoder
+    cpu.registers.x[destination_reg] = immediate_val
 
-            # --- instruction "AMO_ADD.W" ---
-            if instruction_subtype_f5 == 0x00:
+    return False
 
-                new_value_in_memory = old_value_in_memory + source_reg_2_val
-                new_value_in_memory = new_value_in_memory & 0xFFFFFFFF # Shorten the value to 32 bits if it's longer than that
 
-                memory.write_4_bytes__little_endian(address=source_reg_1_val, value=new_value_in_memory)
+# --- instruction "AUIPC" ---
+def execute_AUIPC(cpu, instruction, operands):
+    registers = cpu.registers
+    destination_reg, immediate_val = operands
 
-                logger.register_executed_instruction(f"amo-add.w x{destination_reg}, x{source_reg_2}, (x{source_reg_1})  (Atomic ADD)")
-                pass
+    # Immediate is already sign-extended and shifted into bits [31:12] by the operand decoder
+    registers.x[destination_reg] = registers.instruction_pointer + immediate_val
 
-            # --- instruction "AMO_SWAP.W" ---
-            elif instruction_subtype_f5 == 0x01:
+    return False
 
-                # Old mem. value ends up in reg 'rd' (done before this if statement), then new value is set in memory
-                memory.write_4_bytes__little_endian(address=source_reg_1_val, value=source_reg_2_val)
 
-                logger.register_executed_instruction(f"amo-swap.w x{destination_reg}, x{source_reg_2}, (x{source_reg_1})  (Atomic SWAP)")
-                pass
+# ============================================================================================================
+#  Arithmetic/Logic instructions - registers only
+# ============================================================================================================
 
-            # --- instruction "LD.W" ---
-            elif instruction_subtype_f5 == 0x02:
+# --- instruction "ADD" ---
+def execute_ADD(cpu, instruction, operands):
+    x = cpu.registers.x
+    destination_reg, source_reg_1, source_reg_2 = operands
 
-                address_to_load = source_reg_1_val
+    # Make sure that the result is limited to only first 32 bits of the value
+    x[destination_reg] = (x[source_reg_1] + x[source_reg_2]) & 0xFFFFFFFF
 
-                value_at_address = memory.get_4_bytes__little_endian(address_to_load)
+    return False
 
-                registers.atomic_load_reserved__address = address_to_load
 
-                registers.x[destination_reg] = value_at_address
+# --- instruction "SUB" ---
+def execute_SUB(cpu, instruction, operands):
+    x = cpu.registers.x
+    destination_reg, source_reg_1, source_reg_2 = operands
 
-                logger.register_executed_instruction(f"ld.w x{destination_reg}, x{source_reg_1}  (Load Reserved - Atomic)")
-                pass
+    # Make sure that the result is limited to only first 32 bits of the value
+    x[destination_reg] = (x[source_reg_1] - x[source_reg_2]) & 0xFFFFFFFF
 
-            # --- instruction "SC.W" ---
-            elif instruction_subtype_f5 == 0x03:
+    return False
 
-                address_to_store = source_reg_1_val
 
-                value_to_store = source_reg_2_val
+# --- instruction "SLL" ---
+def execute_SLL(cpu, instruction, operands):
+    x = cpu.registers.x
+    destination_reg, source_reg_1, source_reg_2 = operands
 
-                if address_to_store == registers.atomic_load_reserved__address:
-                    condition_result = 0
+    shift_amount = x[source_reg_2] & 0b11111  # Get only the lower 5 bits of the register rs2
 
-                    memory.write_4_bytes__little_endian(address_to_store, value_to_store)
-                else:
-                    condition_result = 1
+    # Make sure that the result is limited to only first 32 bits of the value
+    x[destination_reg] = (x[source_reg_1] << shift_amount) & 0xFFFFFFFF
 
-                registers.atomic_load_reserved__address = -1
-                registers.x[destination_reg] = condition_result
+    return False
 
-                logger.register_executed_instruction(f"sc.w x{destination_reg}, x{source_reg_2}, (x{source_reg_1})  (Store Conditional - Atomic)")
-                pass
 
-            # --- instruction "AMO_OR.W" ---
-            elif instruction_subtype_f5 == 0x08:
+# --- instruction "SLT" ---
+def execute_SLT(cpu, instruction, operands):
+    x = cpu.registers.x
+    destination_reg, source_reg_1, source_reg_2 = operands
 
-                # memory(source_reg_1_val) <-- memory(source_reg_1_val) | source_reg_2_val
-                new_value_in_memory = old_value_in_memory | source_reg_2_val
-                memory.write_4_bytes__little_endian(address=source_reg_1_val, value=new_value_in_memory)
+    if interpret_as_32_bit_signed_value(x[source_reg_1]) < interpret_as_32_bit_signed_value(x[source_reg_2]):
+        result = 1
+    else:
+        result = 0
 
-                logger.register_executed_instruction(f"amo-or.w x{destination_reg}, x{source_reg_2}, (x{source_reg_1})  (Atomic OR)")
-                pass
+    x[destination_reg] = result
 
-            # --- instruction "AMO_AND.W" ---
-            elif instruction_subtype_f5 == 0x0C:
+    return False
 
-                # memory(source_reg_1_val) <-- memory(source_reg_1_val) & source_reg_2_val
-                new_value_in_memory = old_value_in_memory & source_reg_2_val
-                memory.write_4_bytes__little_endian(address=source_reg_1_val, value=new_value_in_memory)
 
-                logger.register_executed_instruction(f"amo-and.w x{destination_reg}, x{source_reg_2}, (x{source_reg_1})  (Atomic AND)")
-                pass
+# --- instruction "SLTU" ---
+def execute_SLTU(cpu, instruction, operands):
+    x = cpu.registers.x
+    destination_reg, source_reg_1, source_reg_2 = operands
 
-            else:
-                report_unimplemented_instruction(instruction, registers.instruction_pointer, registers.executed_instruction_counter)
-            pass
-        else:
-            print(f"[ERROR] Instruction not implemented: 0x{instruction:08x} !!")
-            raise Exception("Unimplemented instruction")
-        pass
+    if x[source_reg_1] < x[source_reg_2]:
+        result = 1
+    else:
+        result = 0
 
-    # --- Arithmetic/Logic instructions - registers only ---
-    elif opcode == 0x33:
-        instruction_subtype_f3, instruction_subtype_f7, source_reg_1, source_reg_2, destination_reg = Instruction_parser.decode_R_type(instruction)
+    x[destination_reg] = result
 
-        source_reg_1_val = registers.x[source_reg_1]
-        source_reg_2_val = registers.x[source_reg_2]
+    return False
 
-        if instruction_subtype_f7 == 0x0:
 
-            # --- instruction "ADD" ---
-            if instruction_subtype_f3 == 0:
-                result = source_reg_1_val + source_reg_2_val
+# --- instruction "XOR" ---
+def execute_XOR(cpu, instruction, operands):
+    x = cpu.registers.x
+    destination_reg, source_reg_1, source_reg_2 = operands
 
-                # Make sure that the result is limited to only first 32 bits of the value
-                result = result & 0xFFFFFFFF
+    x[destination_reg] = x[source_reg_1] ^ x[source_reg_2]
 
-                registers.x[destination_reg] = result
+    return False
 
-                logger.register_executed_instruction(f"add x{destination_reg}, x{source_reg_1}, x{source_reg_2}  (Addition)")
-                pass
 
-            # --- instruction "SLL" ---
-            elif instruction_subtype_f3 == 1:
-                value_to_be_shifted = source_reg_1_val
-                shift_amount = source_reg_2_val & 0b11111  # Get only the lower 5 bits of the register rs2
+# --- instruction "SRL" ---
+def execute_SRL(cpu, instruction, operands):
+    x = cpu.registers.x
+    destination_reg, source_reg_1, source_reg_2 = operands
 
-                result = value_to_be_shifted << shift_amount
+    shift_amount = x[source_reg_2] & 0b11111  # Get only the lower 5 bits of the register rs2
 
-                # Make sure that the result is limited to only first 32 bits of the value
-                result = result & 0xFFFFFFFF
+    x[destination_reg] = x[source_reg_1] >> shift_amount
 
-                registers.x[destination_reg] = result
+    return False
 
-                logger.register_executed_instruction(f"sll x{destination_reg}, x{source_reg_1}, x{source_reg_2}  (Shift Left Logical)")
-                pass
 
-            # --- instruction "SLT" ---
-            elif instruction_subtype_f3 == 2:
+# --- instruction "SRA" ---
+def execute_SRA(cpu, instruction, operands):
+    x = cpu.registers.x
+    destination_reg, source_reg_1, source_reg_2 = operands
 
-                source_reg_1_val = interpret_as_32_bit_signed_value(source_reg_1_val)
-                source_reg_2_val = interpret_as_32_bit_signed_value(source_reg_2_val)
+    shift_amount = x[source_reg_2] & 0b11111  # Get only the lower 5 bits of the register rs2
 
-                if source_reg_1_val < source_reg_2_val:
-                    result = 1
-                else:
-                    result = 0
+    # Python's shift operator is arithmetic shift operator so it should automatically sign-extend the value
+    result = interpret_as_32_bit_signed_value(x[source_reg_1]) >> shift_amount
 
-                registers.x[destination_reg] = result
+    x[destination_reg] = result & 0xFFFFFFFF
 
-                logger.register_executed_instruction(f"slt x{destination_reg}, x{source_reg_1}, x{source_reg_2}  (Set Less Than - Signed)")
-                pass
+    return False
 
-            # --- instruction "SLTU" ---
-            elif instruction_subtype_f3 == 3:
 
-                if source_reg_1_val < source_reg_2_val:
-                    result = 1
-                else:
-                    result = 0
+# --- instruction "OR" ---
+def execute_OR(cpu, instruction, operands):
+    x = cpu.registers.x
+    destination_reg, source_reg_1, source_reg_2 = operands
 
-                registers.x[destination_reg] = result
+    x[destination_reg] = x[source_reg_1] | x[source_reg_2]
 
-                logger.register_executed_instruction(f"sltu x{destination_reg}, x{source_reg_1}, x{source_reg_2}  (Set Less Than - Unsigned)")
-                pass
+    return False
 
-            # --- instruction "XOR" ---
-            elif instruction_subtype_f3 == 4:
 
-                result = source_reg_1_val ^ source_reg_2_val
+# --- instruction "AND" ---
+def execute_AND(cpu, instruction, operands):
+    x = cpu.registers.x
+    destination_reg, source_reg_1, source_reg_2 = operands
 
-                registers.x[destination_reg] = result
+    x[destination_reg] = x[source_reg_1] & x[source_reg_2]
 
-                logger.register_executed_instruction(f"xor x{destination_reg}, x{source_reg_1}, x{source_reg_2}  (Bitwise XOR)")
-                pass
+    return False
 
-            # --- instruction "SRL" ---
-            elif instruction_subtype_f3 == 5:
 
-                value_to_be_shifted = source_reg_1_val
-                shift_amount = source_reg_2_val & 0b11111  # Get only the lower 5 bits of the register rs2
+# ============================================================================================================
+#  RV32M Multiply Extension
+# ============================================================================================================
 
-                result = value_to_be_shifted >> shift_amount
+# --- instruction "MUL" ---
+def execute_MUL(cpu, instruction, operands):
+    x = cpu.registers.x
+    destination_reg, source_reg_1, source_reg_2 = operands
 
-                registers.x[destination_reg] = result
+    result = interpret_as_32_bit_signed_value(x[source_reg_1]) * interpret_as_32_bit_signed_value(x[source_reg_2])
 
-                logger.register_executed_instruction(f"srl x{destination_reg}, x{source_reg_1}, x{source_reg_2}  (Shift Right Logical)")
-                pass
+    # Shorten the result to 32-bits
+    x[destination_reg] = result & 0xFFFFFFFF
 
-            # --- instruction "OR" ---
-            elif instruction_subtype_f3 == 6:
+    return False
 
-                result = source_reg_1_val | source_reg_2_val
 
-                registers.x[destination_reg] = result
+# --- instruction "MULH" ---
+def execute_MULH(cpu, instruction, operands):
+    x = cpu.registers.x
+    destination_reg, source_reg_1, source_reg_2 = operands
 
-                logger.register_executed_instruction(f"or x{destination_reg}, x{source_reg_1}, x{source_reg_2}  (Bitwise OR)")
-                pass
+    result = interpret_as_32_bit_signed_value(x[source_reg_1]) * interpret_as_32_bit_signed_value(x[source_reg_2])
 
-            # --- instruction "AND" ---
-            elif instruction_subtype_f3 == 7:
+    # Multiplication of two 32-bit numbers can result in a much larger number.
+    # Get only the bits higher than 32 bits (0xFFFFFFFF00000000)
+    x[destination_reg] = (result >> 32) & 0xFFFFFFFF
 
-                result = source_reg_1_val & source_reg_2_val
+    return False
 
-                registers.x[destination_reg] = result
 
-                logger.register_executed_instruction(f"and x{destination_reg}, x{source_reg_1}, x{source_reg_2}  (Bitwise AND)")
-                pass
-            else:
-                report_unimplemented_instruction(instruction, registers.instruction_pointer, registers.executed_instruction_counter)
-            pass
+# --- instruction "MULHU" ---
+def execute_MULHU(cpu, instruction, operands):
+    x = cpu.registers.x
+    destination_reg, source_reg_1, source_reg_2 = operands
 
-        # --- RV32M Multiply Extension ---
-        elif instruction_subtype_f7 == 0x1:
+    result = x[source_reg_1] * x[source_reg_2]
 
-            # --- instruction "MUL" ---
-            if instruction_subtype_f3 == 0:
-                source_reg_1_val = interpret_as_32_bit_signed_value(source_reg_1_val)
-                source_reg_2_val = interpret_as_32_bit_signed_value(source_reg_2_val)
+    # Multiplication of two 32-bit numbers can result in a much larger number.
+    # Get only the bits higher than 32 bits (0xFFFFFFFF00000000)
+    x[destination_reg] = (result >> 32) & 0xFFFFFFFF
 
-                result = source_reg_1_val * source_reg_2_val
+    return False
 
-                # Shorten the result to 32-bits
-                result = result & 0xFFFFFFFF
 
-                registers.x[destination_reg] = result
+# --- instruction "DIV" ---
+def execute_DIV(cpu, instruction, operands):
+    x = cpu.registers.x
+    destination_reg, source_reg_1, source_reg_2 = operands
 
-                logger.register_executed_instruction(f"mul x{destination_reg}, x{source_reg_1}, x{source_reg_2}  (Signed Multiplication )")
+    dividend = interpret_as_32_bit_signed_value(x[source_reg_1])
+    divisor  = interpret_as_32_bit_signed_value(x[source_reg_2])
 
-            # --- instruction "MULH" ---
-            elif instruction_subtype_f3 == 1:
-                source_reg_1_val = interpret_as_32_bit_signed_value(source_reg_1_val)
-                source_reg_2_val = interpret_as_32_bit_signed_value(source_reg_2_val)
+    # TODO: Handle division by zero
+    # TODO: Handle signed overflow
+    if dividend == -1:
+        # To make output more aligned with implementations writen in C
+        result = 0
+    else:
+        result = dividend // divisor
 
-                result = source_reg_1_val * source_reg_2_val
+    # TODO: Could I just replace convert_to_32_bit_unsigned_value() with (result & 0xFFFFFFFF)??
+    x[destination_reg] = convert_to_32_bit_unsigned_value(result)
 
-                # Multiplication of two 32-bit numbers can result in a much larger number.
-                # Get only the bits higher than 32 bits (0xFFFFFFFF00000000)
-                result = (result >> 32) & 0xFFFFFFFF
+    return False
 
-                registers.x[destination_reg] = result
 
-                logger.register_executed_instruction(f"mulh x{destination_reg}, x{source_reg_1}, x{source_reg_2}  (Signed Multiplication - Higher-order bits)")
+# --- instruction "DIVU" ---
+def execute_DIVU(cpu, instruction, operands):
+    x = cpu.registers.x
+    destination_reg, source_reg_1, source_reg_2 = operands
 
-            # --- instruction "MULHU" ---
-            elif instruction_subtype_f3 == 3:
-                result = source_reg_1_val * source_reg_2_val
+    # TODO: Handle division by zero
+    x[destination_reg] = x[source_reg_1] // x[source_reg_2]
 
-                # Multiplication of two 32-bit numbers can result in a much larger number.
-                # Get only the bits higher than 32 bits (0xFFFFFFFF00000000)
-                result = (result >> 32) & 0xFFFFFFFF
+    return False
 
-                registers.x[destination_reg] = result
 
-                logger.register_executed_instruction(f"mulhu x{destination_reg}, x{source_reg_1}, x{source_reg_2}  (Unsigned Multiplication - Higher-order bits)")
+# --- instruction "REM" ---
+def execute_REM(cpu, instruction, operands):
+    x = cpu.registers.x
+    destination_reg, source_reg_1, source_reg_2 = operands
 
-            # --- instruction "DIV" ---
-            elif instruction_subtype_f3 == 4:
-                dividend = interpret_as_32_bit_signed_value(source_reg_1_val)
-                divisor  = interpret_as_32_bit_signed_value(source_reg_2_val)
+    dividend = interpret_as_32_bit_signed_value(x[source_reg_1])
+    divisor  = interpret_as_32_bit_signed_value(x[source_reg_2])
 
-                # TODO: Handle division by zero
-                # TODO: Handle signed overflow
-                if dividend == -1:
-                    # To make output more aligned with implementations writen in C
-                    result = 0
-                else:
-                    result = dividend // divisor
+    # TODO: Handle division by zero
+    # TODO: Handle signed overflow
+    if dividend == -1:
+        # To make output more aligned with implementations writen in C
+        result = -1
+    else:
+        result = dividend % divisor
 
-                # TODO: Could I just replace convert_to_32_bit_unsigned_value() with (result & 0xFFFFFFFF)??
-                registers.x[destination_reg] = convert_to_32_bit_unsigned_value(result)
+    # TODO: Could I just replace convert_to_32_bit_unsigned_value() with (result & 0xFFFFFFFF)??
+    x[destination_reg] = convert_to_32_bit_unsigned_value(result)
 
-                logger.register_executed_instruction(f"div x{destination_reg}, x{source_reg_1}, x{source_reg_2}  (Division - Signed)")
-                pass
+    return False
 
-            # --- instruction "DIVU" ---
-            elif instruction_subtype_f3 == 5:
-                dividend = source_reg_1_val
-                divisor  = source_reg_2_val
 
-                # TODO: Handle division by zero
-                result = dividend // divisor
+# --- instruction "REMU" ---
+def execute_REMU(cpu, instruction, operands):
+    x = cpu.registers.x
+    destination_reg, source_reg_1, source_reg_2 = operands
 
-                registers.x[destination_reg] = result
+    # TODO: Handle division by zero
+    x[destination_reg] = x[source_reg_1] % x[source_reg_2]
 
-                logger.register_executed_instruction(f"divu x{destination_reg}, x{source_reg_1}, x{source_reg_2}  (Division - Usigned)")
-                pass
+    return False
 
-            # --- instruction "REM" ---
-            elif instruction_subtype_f3 == 6:
-                dividend = interpret_as_32_bit_signed_value(source_reg_1_val)
-                divisor  = interpret_as_32_bit_signed_value(source_reg_2_val)
 
-                # TODO: Handle division by zero
-                # TODO: Handle signed overflow
-                if dividend == -1:
-                    # To make output more aligned with implementations writen in C
-                    result = -1
-                else:
-                    result = dividend % divisor
+# ============================================================================================================
+#  RV32A Atomic instructions
+# ============================================================================================================
 
-                # TODO: Could I just replace convert_to_32_bit_unsigned_value() with (result & 0xFFFFFFFF)??
-                registers.x[destination_reg] = convert_to_32_bit_unsigned_value(result)
+# --- instruction "LR.W" ---
+def execute_LR_W(cpu, instruction, operands):
+    registers = cpu.registers
+    destination_reg, source_reg_1, source_reg_2 = operands
 
-                logger.register_executed_instruction(f"rem x{destination_reg}, x{source_reg_1}, x{source_reg_2}  (Remainder - Signed)")
-                pass
+    address_to_load = registers.x[source_reg_1]
 
-            # --- instruction "REMU" ---
-            elif instruction_subtype_f3 == 7:
-                dividend = source_reg_1_val
-                divisor  = source_reg_2_val
+    value_at_address = cpu.memory.get_4_bytes__little_endian(address_to_load)
 
-                # TODO: Handle division by zero
-                result = dividend % divisor
+    registers.atomic_load_reserved__address = address_to_load
 
-                registers.x[destination_reg] = result
+    registers.x[destination_reg] = value_at_address
 
-                logger.register_executed_instruction(f"remu x{destination_reg}, x{source_reg_1}, x{source_reg_2}  (Remainder - Usigned)")
-                pass
+    return False
 
-            else:
-                report_unimplemented_instruction(instruction, registers.instruction_pointer, registers.executed_instruction_counter)
-            pass
 
-        elif instruction_subtype_f7 == 0x20:
+# --- instruction "SC.W" ---
+def execute_SC_W(cpu, instruction, operands):
+    registers = cpu.registers
+    destination_reg, source_reg_1, source_reg_2 = operands
 
-            # --- instruction "SUB" ---
-            if instruction_subtype_f3 == 0x0:
-                result = source_reg_1_val - source_reg_2_val
+    address_to_store = registers.x[source_reg_1]
 
-                # Make sure that the result is limited to only first 32 bits of the value
-                result = result & 0xFFFFFFFF
+    value_to_store = registers.x[source_reg_2]
 
-                registers.x[destination_reg] = result
+    if address_to_store == registers.atomic_load_reserved__address:
+        condition_result = 0
 
-                logger.register_executed_instruction(f"sub x{destination_reg}, x{source_reg_1}, x{source_reg_2}  (Subtraction )")
-                pass
+        cpu.memory.write_4_bytes__little_endian(address_to_store, value_to_store)
+    else:
+        condition_result = 1
 
-            # --- instruction "SRA" ---
-            elif instruction_subtype_f3 == 5:
-                value_to_be_shifted = interpret_as_32_bit_signed_value(source_reg_1_val)
-                shift_amount = source_reg_2_val & 0b11111  # Get only the lower 5 bits of the register rs2
+    registers.atomic_load_reserved__address = -1
+    registers.x[destination_reg] = condition_result
 
-                # Python's shift operator is arithmetic shift operator so it should automatically sign-extend the value
-                result = value_to_be_shifted >> shift_amount
+    return False
 
-                registers.x[destination_reg] = result & 0xFFFFFFFF
 
-                logger.register_executed_instruction(f"sra x{destination_reg}, x{source_reg_1}, x{source_reg_2}  (Shift Right Arithmeticly)")
-                pass
+# --- instruction "AMO_SWAP.W" ---
+def execute_AMOSWAP_W(cpu, instruction, operands):
+    x, memory = cpu.registers.x, cpu.memory
+    destination_reg, source_reg_1, source_reg_2 = operands
 
-            else:
-                report_unimplemented_instruction(instruction, registers.instruction_pointer, registers.executed_instruction_counter)
-            pass
+    address = x[source_reg_1]
+    source_reg_2_val = x[source_reg_2]
 
-        else:
-            print(f"[ERROR] Instruction not implemented: 0x{instruction:08x} !!")
-            raise Exception("Unimplemented instruction")
-        pass
+    # Old mem. value ends up in reg 'rd', then new value is set in memory
+    x[destination_reg] = memory.get_4_bytes__little_endian(address)
+    memory.write_4_bytes__little_endian(address, source_reg_2_val)
 
-    # --- instruction "LUI" ---
-    elif opcode == 0x37:
+    return False
 
-        destination_reg, immediate_val = Instruction_parser.decode_U_type(instruction)
 
-        registers.x[destination_reg] = (immediate_val << 12)
+# --- instruction "AMO_ADD.W" ---
+def execute_AMOADD_W(cpu, instruction, operands):
+    x, memory = cpu.registers.x, cpu.memory
+    destination_reg, source_reg_1, source_reg_2 = operands
 
-        logger.register_executed_instruction(f"lui x{destination_reg}, {interpret_as_20_bit_signed_value(immediate_val)}  (Load Upper Immediate)")
-        pass
+    address = x[source_reg_1]
+    source_reg_2_val = x[source_reg_2]
 
-    # --- Branch instructions ---
-    elif opcode == 0x63:
+    # destination_reg <-- memory(source_reg_1_val)
+    old_value_in_memory = memory.get_4_bytes__little_endian(address)
+    x[destination_reg] = old_value_in_memory
 
-        instruction_subtype, source_reg_1, source_reg_2, immediate_val = Instruction_parser.decode_B_type(instruction)
+    new_value_in_memory = (old_value_in_memory + source_reg_2_val) & 0xFFFFFFFF  # Shorten the value to 32 bits
+    memory.write_4_bytes__little_endian(address, new_value_in_memory)
 
-        source_reg_1_value = registers.x[source_reg_1]
-        source_reg_2_value = registers.x[source_reg_2]
+    return False
 
-        source_reg_1_value_signed = interpret_as_32_bit_signed_value(source_reg_1_value)
-        source_reg_2_value_signed = interpret_as_32_bit_signed_value(source_reg_2_value)
 
-        # The 12-bit B-immediate encodes SIGNED offsets in MULTIPLES of 2, and is added to the
-        # current instruction pointer value. The conditional branch range is ±4 KiB.
-        # In practice this means that decoded value is 13-bit with last bit set to zero
-        jump_offset = interpret_as_13_bit_signed_value(immediate_val)
+# --- instruction "AMO_OR.W" ---
+def execute_AMOOR_W(cpu, instruction, operands):
+    x, memory = cpu.registers.x, cpu.memory
+    destination_reg, source_reg_1, source_reg_2 = operands
 
-        # --- instruction "BEQ" ---
-        if instruction_subtype == 0:
+    address = x[source_reg_1]
+    source_reg_2_val = x[source_reg_2]
 
-            if source_reg_1_value_signed == source_reg_2_value_signed:
-                registers.instruction_pointer = registers.instruction_pointer + jump_offset
-                instruction_pointer_updated = True
+    # destination_reg <-- memory(source_reg_1_val)
+    old_value_in_memory = memory.get_4_bytes__little_endian(address)
+    x[destination_reg] = old_value_in_memory
 
-            logger.register_executed_instruction(f"beq x{source_reg_1}, x{source_reg_2}, {immediate_val}  (Branch if EQual)")
+    # memory(source_reg_1_val) <-- memory(source_reg_1_val) | source_reg_2_val
+    memory.write_4_bytes__little_endian(address, old_value_in_memory | source_reg_2_val)
 
-        # --- instruction "BNE" ---
-        elif instruction_subtype == 1:
+    return False
 
-            if source_reg_1_value_signed != source_reg_2_value_signed:
-                registers.instruction_pointer = registers.instruction_pointer + jump_offset
-                instruction_pointer_updated = True
 
-            logger.register_executed_instruction(f"bne x{source_reg_1}, x{source_reg_2}, {immediate_val}  (Branch if Not Equal)")
+# --- instruction "AMO_AND.W" ---
+def execute_AMOAND_W(cpu, instruction, operands):
+    x, memory = cpu.registers.x, cpu.memory
+    destination_reg, source_reg_1, source_reg_2 = operands
 
-        # --- instruction "BLT" ---
-        elif instruction_subtype == 4:
+    address = x[source_reg_1]
+    source_reg_2_val = x[source_reg_2]
 
-            if source_reg_1_value_signed < source_reg_2_value_signed:
-                registers.instruction_pointer = registers.instruction_pointer + jump_offset
-                instruction_pointer_updated = True
+    # destination_reg <-- memory(source_reg_1_val)
+    old_value_in_memory = memory.get_4_bytes__little_endian(address)
+    x[destination_reg] = old_value_in_memory
 
-            logger.register_executed_instruction(f"blt x{source_reg_1}, x{source_reg_2}, {immediate_val}  (Branch if Less Than)")
+    # memory(source_reg_1_val) <-- memory(source_reg_1_val) & source_reg_2_val
+    memory.write_4_bytes__little_endian(address, old_value_in_memory & source_reg_2_val)
 
-        # --- instruction "BGE" ---
-        elif instruction_subtype == 5:
+    return False
 
-            if source_reg_1_value_signed >= source_reg_2_value_signed:
-                registers.instruction_pointer = registers.instruction_pointer + jump_offset
-                instruction_pointer_updated = True
 
-            logger.register_executed_instruction(f"bge x{source_reg_1}, x{source_reg_2}, {immediate_val}  (Branch if Greater than or Equal)")
+# ============================================================================================================
+#  Branch and jump instructions
+# ============================================================================================================
 
-        # --- instruction "BLTU" ---
-        elif instruction_subtype == 6:
+# The 12-bit B-immediate encodes SIGNED offsets in MULTIPLES of 2, and is added to the current instruction pointer
+# value. The conditional branch range is ±4 KiB.
 
-            if source_reg_1_value < source_reg_2_value:
-                registers.instruction_pointer = registers.instruction_pointer + jump_offset
-                instruction_pointer_updated = True
+# --- instruction "BEQ" ---
+def execute_BEQ(cpu, instruction, operands):
+    registers = cpu.registers
+    source_reg_1, source_reg_2, jump_offset = operands
 
-            logger.register_executed_instruction(f"bltu x{source_reg_1}, x{source_reg_2}, {immediate_val}  (Branch if Less Than - Unsigned)")
+    # Registers always hold 32-bit unsigned values, so comparing them as signed or as unsigned values gives the same
+    # result when checking for equality
+    if registers.x[source_reg_1] == registers.x[source_reg_2]:
+        registers.instruction_pointer = registers.instruction_pointer + jump_offset
+        return True
 
-        # --- instruction "BGEU" ---
-        elif instruction_subtype == 7:
+    return False
 
-            if source_reg_1_value >= source_reg_2_value:
-                registers.instruction_pointer = registers.instruction_pointer + jump_offset
-                instruction_pointer_updated = True
 
-            logger.register_executed_instruction(f"bge x{source_reg_1}, x{source_reg_2}, {immediate_val}  (Branch if Greater than or Equal - Unsigned)")
+# --- instruction "BNE" ---
+def execute_BNE(cpu, instruction, operands):
+    registers = cpu.registers
+    source_reg_1, source_reg_2, jump_offset = operands
 
-        else:
-            print(f"[ERROR] Instruction not implemented: 0x{instruction:08x} !!")
-            raise Exception("Unimplemented instruction")
-        pass
+    if registers.x[source_reg_1] != registers.x[source_reg_2]:
+        registers.instruction_pointer = registers.instruction_pointer + jump_offset
+        return True
 
-    # --- instruction "JALR" ---
-    elif opcode == 0x67:
-        # Instruction_parser.print_I_type_instruction(instruction)
+    return False
 
-        instruction_subtype, destination_reg, source_reg, immediate_val = Instruction_parser.decode_I_type(instruction)
 
-        # for this instruction the immediate is a signed value
-        immediate_val = interpret_as_12_bit_signed_value(immediate_val)
+# --- instruction "BLT" ---
+def execute_BLT(cpu, instruction, operands):
+    registers = cpu.registers
+    source_reg_1, source_reg_2, jump_offset = operands
 
-        # Calculate the address of the next instruction in memory after the location of "jal(r)"
-        # This is the "link" part of the instruction, and is usually used (after jumping into functions/procedures)
-        # to jump back and continue execution of code physically after the location of "jal(r)" instruction
-        address_of_next_instruction = registers.instruction_pointer + 4
+    if interpret_as_32_bit_signed_value(registers.x[source_reg_1]) < interpret_as_32_bit_signed_value(registers.x[source_reg_2]):
+        registers.instruction_pointer = registers.instruction_pointer + jump_offset
+        return True
 
-        # Calculate new instruction address and update the instruction_pointer
-        # This is the "jump" part of the instruction
-        # jalr instruction calculates new instruction address by adding together
-        # immediate value and value from source register
-        jump_address = registers.x[source_reg] + immediate_val
+    return False
 
-        registers.instruction_pointer = jump_address
 
-        # Destination register must be updated last, in case the instruction uses the same reg as source and destination
-        registers.x[destination_reg] = address_of_next_instruction
+# --- instruction "BGE" ---
+def execute_BGE(cpu, instruction, operands):
+    registers = cpu.registers
+    source_reg_1, source_reg_2, jump_offset = operands
 
-        instruction_pointer_updated = True
+    if interpret_as_32_bit_signed_value(registers.x[source_reg_1]) >= interpret_as_32_bit_signed_value(registers.x[source_reg_2]):
+        registers.instruction_pointer = registers.instruction_pointer + jump_offset
+        return True
 
-        logger.register_executed_instruction(f"jalr x{destination_reg}, x{source_reg} + {immediate_val}  (Jump and Link Register)")
-        pass
+    return False
 
-    # --- instruction "JAL" ---
-    elif opcode == 0x6f:
-        # Instruction_parser.print_J_type_instruction(instruction)
 
-        destination_reg, immediate_val = Instruction_parser.decode_J_type(instruction)
+# --- instruction "BLTU" ---
+def execute_BLTU(cpu, instruction, operands):
+    registers = cpu.registers
+    source_reg_1, source_reg_2, jump_offset = operands
 
-        # for this instruction the immediate is a signed value
-        immediate_val = interpret_as_21_bit_signed_value(immediate_val)
+    if registers.x[source_reg_1] < registers.x[source_reg_2]:
+        registers.instruction_pointer = registers.instruction_pointer + jump_offset
+        return True
 
-        # Calculate the address of the next instruction in memory after the location of "jal(r)"
-        # This is the "link" part of the instruction, and is usually used (after jumping into functions/procedures)
-        # to jump back and continue execution of code physically after the location of "jal(r)" instruction
-        address_of_next_instruction = registers.instruction_pointer + 4
+    return False
 
-        # Calculate new instruction address and update the instruction_pointer
-        # This is the "jump" part of the instruction
-        # jal instruction calculates new instruction address by adding together
-        # current instruction pointer and the immediate value
-        jump_address = registers.instruction_pointer + immediate_val
 
-        registers.instruction_pointer = jump_address
-        registers.x[destination_reg] = address_of_next_instruction
+# --- instruction "BGEU" ---
+def execute_BGEU(cpu, instruction, operands):
+    registers = cpu.registers
+    source_reg_1, source_reg_2, jump_offset = operands
 
-        instruction_pointer_updated = True
+    if registers.x[source_reg_1] >= registers.x[source_reg_2]:
+        registers.instruction_pointer = registers.instruction_pointer + jump_offset
+        return True
 
-        logger.register_executed_instruction(f"jal x{destination_reg}, {immediate_val}  (Jump and Link)")
-        pass
+    return False
 
-    # --- CSR & ECALL/EBREAK instructions ---
-    elif opcode == 0x73:
-        # Instruction_parser.print_I_type_instruction(instruction)
 
-        instruction_subtype, destination_reg, source_reg, immediate_val = Instruction_parser.decode_I_type(instruction)
+# --- instruction "JALR" ---
+def execute_JALR(cpu, instruction, operands):
+    registers = cpu.registers
+    destination_reg, source_reg, immediate_val = operands
 
-        # In immediate field of the instruction an CSR address value is encoded
-        CSR_address = immediate_val
+    # Calculate the address of the next instruction in memory after the location of "jal(r)"
+    # This is the "link" part of the instruction, and is usually used (after jumping into functions/procedures)
+    # to jump back and continue execution of code physically after the location of "jal(r)" instruction
+    address_of_next_instruction = registers.instruction_pointer + 4
 
-        # --- ECALL/EBREAK/RET instructions ---
-        if instruction_subtype == 0x0:
+    # Calculate new instruction address and update the instruction_pointer
+    # This is the "jump" part of the instruction
+    # jalr instruction calculates new instruction address by adding together
+    # immediate value and value from source register
+    registers.instruction_pointer = registers.x[source_reg] + immediate_val
 
-            # --- Instruction "ECALL" ---
-            if immediate_val == 0:
-                cause = 8  # Environment call from U-mode #TODO: Convert into enum
-                trap_and_interrupt_handler.enter_interrupt(cause)
+    # Destination register must be updated last, in case the instruction uses the same reg as source and destination
+    registers.x[destination_reg] = address_of_next_instruction
 
-                instruction_pointer_updated = True  # enter_interrupt() updates the instruction pointer
+    return True
 
-                logger.register_executed_instruction(f"ecall (Environment/System Call)")
-                pass
 
-            # --- Instruction "EBREAK" ---
-            elif immediate_val == 1:
-                # ebreak is only relevant for debuggers
-                # Used by debuggers to cause control to be transferred back to a debugging environment.
-                logger.register_executed_instruction(f"ebreak (Ignored instruction)")
-                pass
+# --- instruction "JAL" ---
+def execute_JAL(cpu, instruction, operands):
+    registers = cpu.registers
+    destination_reg, immediate_val = operands
 
-            # --- Instruction "WFI" ---
-            elif immediate_val == 0x105:
+    # Calculate the address of the next instruction in memory after the location of "jal(r)"
+    # This is the "link" part of the instruction, and is usually used (after jumping into functions/procedures)
+    # to jump back and continue execution of code physically after the location of "jal(r)" instruction
+    address_of_next_instruction = registers.instruction_pointer + 4
 
-                # TODO: For now it is just ignored, needs full implementation
-                logger.register_executed_instruction(f"wfi (Wait For Interrupt)")
-                pass
+    # Calculate new instruction address and update the instruction_pointer
+    # This is the "jump" part of the instruction
+    # jal instruction calculates new instruction address by adding together
+    # current instruction pointer and the immediate value
+    registers.instruction_pointer = registers.instruction_pointer + immediate_val
+    registers.x[destination_reg] = address_of_next_instruction
 
-            # Instruction "MRET"
-            elif immediate_val == 0x302:
-                trap_and_interrupt_handler.return_from_interrupt()
-                instruction_pointer_updated = True
-                logger.register_executed_instruction(f"mret (machine trap/interrupt return)")
+    return True
 
-            else:
-                report_unimplemented_instruction(instruction, registers.instruction_pointer, registers.executed_instruction_counter)
-            pass
 
-        # --- Instruction "CSRRW" ---
-        elif instruction_subtype == 0x1:
-            old_value = CSR_registers.read_from_register(CSR_address)
-            new_value = registers.x[source_reg]
+# ============================================================================================================
+#  CSR & ECALL/EBREAK instructions
+# ============================================================================================================
 
-            CSR_registers.write_to_register(CSR_address, new_value)
-            registers.x[destination_reg] = old_value
+# --- Instruction 'FENCE' ---
+def execute_FENCE(cpu, instruction, operands):
+    # Fence is only relevant for more complex CPU implementations
+    return False
 
-            logger.register_executed_instruction(f"csr-rw x{destination_reg}, 0x{CSR_address:03x}, x{source_reg}  (Control and Status Register Read-Write)")
-            pass
 
-        # --- Instruction "CSRRS" ---
-        elif instruction_subtype == 0x2:
-            old_value = CSR_registers.read_from_register(CSR_address)
-            source_reg_value = registers.x[source_reg]
+# --- Instruction "ECALL" ---
+def execute_ECALL(cpu, instruction, operands):
+    cause = 8  # Environment call from U-mode #TODO: Convert into enum
+    cpu.trap_and_interrupt_handler.enter_interrupt(cause)
 
-            new_value = old_value | source_reg_value
+    return True  # enter_interrupt() updates the instruction pointer
 
-            registers.x[destination_reg] = old_value
-            CSR_registers.write_to_register(CSR_address, new_value)
 
-            logger.register_executed_instruction(f"csr-rs x{destination_reg}, 0x{CSR_address:03x}, x{source_reg}  (Control and Status Register Read-Set)")
-            pass
+# --- Instruction "EBREAK" ---
+def execute_EBREAK(cpu, instruction, operands):
+    # ebreak is only relevant for debuggers
+    # Used by debuggers to cause control to be transferred back to a debugging environment.
+    return False
 
-        # --- Instruction "CSRRC" ---
-        elif instruction_subtype == 0x3:
-            old_value = CSR_registers.read_from_register(CSR_address)
-            source_reg_value = registers.x[source_reg]
 
-            new_value = old_value & (~source_reg_value)
+# --- Instruction "WFI" ---
+def execute_WFI(cpu, instruction, operands):
+    # The CPU waits until one of the interrupts enabled in "mie" is pending (even if the interrupts are globally
+    # disabled, the kernel's idle loop runs WFI that way). If one is already pending, WFI does nothing
+    trap_and_interrupt_handler = cpu.trap_and_interrupt_handler
+    MTIE_bit_mask = 1 << 7
 
-            registers.x[destination_reg] = old_value
-            CSR_registers.write_to_register(CSR_address, new_value)
+    if trap_and_interrupt_handler.CSR_mip & trap_and_interrupt_handler.CSR_mie == 0:
+        # Console input that arrived since the last check raises the UART interrupt now, instead of after the idle time
+        cpu.device_UART_8250.check_input()
 
-            logger.register_executed_instruction(f"csr-rc x{destination_reg}, 0x{CSR_address:03x}, x{source_reg}  (Control and Status Register Read-Clear)")
-            pass
+        if trap_and_interrupt_handler.CSR_mip & trap_and_interrupt_handler.CSR_mie == 0 \
+                and trap_and_interrupt_handler.CSR_mie & MTIE_bit_mask:
+            cpu.device_timer_CLINT.wait_for_timer_interrupt()
 
-        # --- Instruction "CSRRWI" ---
-        elif instruction_subtype == 0x5:
-            # Immediate value is in this case encoded into bit field that
-            # usually holds source register number (RS bit field)
-            immediate_val = source_reg
+    return False
 
-            registers.x[destination_reg] = CSR_registers.read_from_register(CSR_address)
-            CSR_registers.write_to_register(CSR_address, immediate_val)
 
-            logger.register_executed_instruction(f"csr-rwi x{destination_reg}, 0x{CSR_address:03x}, {immediate_val}  (Control and Status Register Read-Write Immediate)")
-            pass
+# --- Instruction "MRET" ---
+def execute_MRET(cpu, instruction, operands):
+    cpu.trap_and_interrupt_handler.return_from_interrupt()
 
-        # --- Instruction "CSRRSI" ---
-        elif instruction_subtype == 0x6:
-            # Immediate value is in this case encoded into bit field that
-            # usually holds source register number (RS bit field)
-            immediate_val = source_reg
+    return True
 
-            old_value = CSR_registers.read_from_register(CSR_address)
 
-            new_value = old_value | immediate_val
+# --- Instruction "CSRRW" ---
+def execute_CSRRW(cpu, instruction, operands):
+    registers, CSR_registers = cpu.registers, cpu.CSR_registers
+    destination_reg, source_reg, CSR_address = operands
 
-            registers.x[destination_reg] = old_value
-            CSR_registers.write_to_register(CSR_address, new_value)
+    old_value = CSR_registers.read_from_register(CSR_address)
+    new_value = registers.x[source_reg]
 
-            logger.register_executed_instruction(f"csr-rsi x{destination_reg}, 0x{CSR_address:03x}, {immediate_val}  (Control and Status Register Read-Set Immediate)")
-            pass
+    CSR_registers.write_to_register(CSR_address, new_value)
+    registers.x[destination_reg] = old_value
 
-        # --- Instruction "CSRRCI" ---
-        elif instruction_subtype == 0x7:
-            # Immediate value is in this case encoded into bit field that
-            # usually holds source register number (RS bit field)
-            immediate_val = source_reg
+    return False
 
-            old_value = CSR_registers.read_from_register(CSR_address)
 
-            new_value = old_value & (~immediate_val)
+# --- Instruction "CSRRS" ---
+def execute_CSRRS(cpu, instruction, operands):
+    registers, CSR_registers = cpu.registers, cpu.CSR_registers
+    destination_reg, source_reg, CSR_address = operands
 
-            registers.x[destination_reg] = old_value
-            CSR_registers.write_to_register(CSR_address, new_value)
+    old_value = CSR_registers.read_from_register(CSR_address)
+    source_reg_value = registers.x[source_reg]
 
-            logger.register_executed_instruction(f"csr-rci x{destination_reg}, 0x{CSR_address:03x}, {immediate_val}  (Control and Status Register Read-Clear immediate)")
-            pass
-        else:
-            report_unimplemented_instruction(instruction, registers.instruction_pointer, registers.executed_instruction_counter)
-        pass
-    else:
-        report_unimplemented_instruction(instruction, registers.instruction_pointer, registers.executed_instruction_counter)
+    new_value = old_value | source_reg_value
 
-    registers.executed_instruction_counter += 1
+    registers.x[destination_reg] = old_value
+    CSR_registers.write_to_register(CSR_address, new_value)
 
-    return instruction_pointer_updated
+    return False
+
+
+# --- Instruction "CSRRC" ---
+def execute_CSRRC(cpu, instruction, operands):
+    registers, CSR_registers = cpu.registers, cpu.CSR_registers
+    destination_reg, source_reg, CSR_address = operands
+
+    old_value = CSR_registers.read_from_register(CSR_address)
+    source_reg_value = registers.x[source_reg]
+
+    new_value = old_value & (~source_reg_value)
+
+    registers.x[destination_reg] = old_value
+    CSR_registers.write_to_register(CSR_address, new_value)
+
+    return False
+
+
+# For the "immediate" CSR instructions the immediate value is encoded into bit field that usually holds
+# source register number (RS bit field)
+
+# --- Instruction "CSRRWI" ---
+def execute_CSRRWI(cpu, instruction, operands):
+    registers, CSR_registers = cpu.registers, cpu.CSR_registers
+    destination_reg, immediate_val, CSR_address = operands
+
+    registers.x[destination_reg] = CSR_registers.read_from_register(CSR_address)
+    CSR_registers.write_to_register(CSR_address, immediate_val)
+
+    return False
+
+
+# --- Instruction "CSRRSI" ---
+def execute_CSRRSI(cpu, instruction, operands):
+    registers, CSR_registers = cpu.registers, cpu.CSR_registers
+    destination_reg, immediate_val, CSR_address = operands
+
+    old_value = CSR_registers.read_from_register(CSR_address)
+
+    new_value = old_value | immediate_val
+
+    registers.x[destination_reg] = old_value
+    CSR_registers.write_to_register(CSR_address, new_value)
+
+    return False
+
+
+# --- Instruction "CSRRCI" ---
+def execute_CSRRCI(cpu, instruction, operands):
+    registers, CSR_registers = cpu.registers, cpu.CSR_registers
+    destination_reg, immediate_val, CSR_address = operands
+
+    old_value = CSR_registers.read_from_register(CSR_address)
+
+    new_value = old_value & (~immediate_val)
+
+    registers.x[destination_reg] = old_value
+    CSR_registers.write_to_register(CSR_address, new_value)
+
+    return False
+
+
+# Unknown instructions are reported only if the CPU really tries to execute them
+def execute_unimplemented_instruction(cpu, instruction, operands):
+    report_unimplemented_instruction(instruction, cpu.registers.instruction_pointer, cpu.registers.executed_instruction_counter)
 
 
 def report_unimplemented_instruction(instruction, instruction_pointer, executed_instruction_counter):
     print(f"\n[ERROR] Instruction not implemented: 0x{instruction:08x} (Address: {instruction_pointer:08x} / Counter: {executed_instruction_counter})")
     raise Exception("Unimplemented instruction")
+
+
+# ============================================================================================================
+#  Operand decoders
+#
+#  Extract the operands of the instruction, in the order in which the handler expects them. Immediate values are
+#  already sign-extended (and shifted) here, so handlers can use them as they are
+# ============================================================================================================
+
+# rd, rs1, imm (signed)
+def decode_I_type_operands(instruction):
+    instruction_subtype, destination_reg, source_reg, immediate_val = Instruction_parser.decode_I_type(instruction)
+
+    return destination_reg, source_reg, interpret_as_12_bit_signed_value(immediate_val)
+
+
+# rd, rs1, imm (sign-extended to 32-bit unsigned value)
+def decode_I_type_sign_extended_operands(instruction):
+    instruction_subtype, destination_reg, source_reg, immediate_val = Instruction_parser.decode_I_type(instruction)
+
+    # SIGN-EXTEND THE IMMEDIATE
+    # ADDI, XORI, ORI and ANDI interpret 12-bit immediate as signed value. Before making the arithmetic/logic
+    # operation on 32-bit register, we need to "sign extend" the immediate to 32-bit length
+    # If the last (12th) bit of the immediate is set to '1', it means that the value is negative (if we
+    # interpreted it as signed value)
+    # When loading this 12-bit long value into a 32-bit long register, we want to keep that value as negative
+    # number (and as the exactly same negative value) we need to extend '1's to all additional bits
+    # For example:
+    #   1111 is -1 as a 4-bit value. But as a 8-bit value 00001111 it is 15 when we interpret it as signed value
+    #   If we want to keep -1 when expanding 4-bit value into 8-bit space, we need to add '1's -> 11111111
+    return destination_reg, source_reg, sign_extend_12_bit_value(immediate_val)
+
+
+# rd, rs1, imm (as encoded)
+def decode_I_type_unsigned_operands(instruction):
+    instruction_subtype, destination_reg, source_reg, immediate_val = Instruction_parser.decode_I_type(instruction)
+
+    return destination_reg, source_reg, immediate_val
+
+
+# rd, rs1, shift amount
+def decode_shift_immediate_operands(instruction):
+    # For 'SLLI', 'SRLI' and 'SRAI' the "immediate value filed" actually consists of two encoded fields - type and value
+    #
+    #                      Shift instruction type     encoded value
+    # Immediate bit no. |  12 11 10 09 08 07 06 05 | 04 03 02 01 00
+    #                   |  ty ty ty ty ty ty ty ty | im im im im im
+    #
+    # Shift instruction type is the same bit field as funct7 and is already used to find the instruction handler
+    instruction_subtype, destination_reg, source_reg, immediate_val = Instruction_parser.decode_I_type(instruction)
+
+    # There are only 32 bits in registers so the valid immediate values are up to 2**5
+    shift_amount = immediate_val & 0b00000000011111
+
+    return destination_reg, source_reg, shift_amount
+
+
+# rs1, rs2, imm (signed)
+def decode_S_type_operands(instruction):
+    instruction_subtype, source_reg_1, source_reg_2, immediate_val = Instruction_parser.decode_S_type(instruction)
+
+    return source_reg_1, source_reg_2, interpret_as_12_bit_signed_value(immediate_val)
+
+
+# rs1, rs2, jump offset (signed)
+def decode_B_type_operands(instruction):
+    instruction_subtype, source_reg_1, source_reg_2, immediate_val = Instruction_parser.decode_B_type(instruction)
+
+    # In practice B-immediate is a 13-bit value with the last bit set to zero
+    return source_reg_1, source_reg_2, interpret_as_13_bit_signed_value(immediate_val)
+
+
+# rd, rs1, rs2
+def decode_R_type_operands(instruction):
+    instruction_subtype_f3, instruction_subtype_f7, source_reg_1, source_reg_2, destination_reg = Instruction_parser.decode_R_type(instruction)
+
+    return destination_reg, source_reg_1, source_reg_2
+
+
+# rd, imm (moved into bits [31:12])
+def decode_U_type_operands(instruction):
+    destination_reg, immediate_val = Instruction_parser.decode_U_type(instruction)
+
+    return destination_reg, immediate_val << 12
+
+
+# rd, imm (signed and moved into bits [31:12])
+def decode_U_type_signed_operands(instruction):
+    destination_reg, immediate_val = Instruction_parser.decode_U_type(instruction)
+
+    return destination_reg, interpret_as_20_bit_signed_value(immediate_val) << 12
+
+
+# rd, imm (signed)
+def decode_J_type_operands(instruction):
+    destination_reg, immediate_val = Instruction_parser.decode_J_type(instruction)
+
+    return destination_reg, interpret_as_21_bit_signed_value(immediate_val)
+
+
+# rd, rs1 (or 5-bit immediate), CSR address
+def decode_CSR_operands(instruction):
+    instruction_subtype, destination_reg, source_reg, immediate_val = Instruction_parser.decode_I_type(instruction)
+
+    # In immediate field of the instruction an CSR address value is encoded
+    return destination_reg, source_reg, immediate_val
+
+
+def decode_no_operands(instruction):
+    return ()
+
+
+# ECALL, EBREAK, WFI and MRET differ only in the immediate field, so here we return also the handler
+def decode_environment_instruction(instruction):
+    immediate_val = Instruction_parser.get_hardcoded_number__immediate_i(instruction)
+
+    if immediate_val == 0:
+        return execute_ECALL, ()
+    elif immediate_val == 1:
+        return execute_EBREAK, ()
+    elif immediate_val == 0x105:
+        return execute_WFI, ()
+    elif immediate_val == 0x302:
+        return execute_MRET, ()
+
+    return execute_unimplemented_instruction, ()
+
+
+# ============================================================================================================
+#  Dispatch table
+# ============================================================================================================
+
+ANY = None
+
+DISPATCH_TABLE = [(execute_unimplemented_instruction, decode_no_operands)] * (1 << 17)
+
+
+# Puts an instruction into DISPATCH_TABLE. Bit fields that are not used to identify the instruction (for example
+# funct7 of "addi", which is a part of the immediate value) are passed as ANY, and the instruction is put into every
+# entry of the table that matches the rest of the bit fields
+def register_instruction(handler, decode_operands, opcode, funct3=ANY, funct7=ANY):
+    funct3_values = range(8) if funct3 is ANY else (funct3,)
+    funct7_values = range(128) if funct7 is ANY else (funct7,)
+
+    for funct3_value in funct3_values:
+        for funct7_value in funct7_values:
+            DISPATCH_TABLE[opcode | (funct3_value << 7) | (funct7_value << 10)] = (handler, decode_operands)
+
+
+# Atomic instructions use only upper 5 bits of funct7 (funct5). The lower 2 bits are "aq" and "rl" bits, which we
+# ignore (see Instruction_parser.decode_R_type_atomic)
+def register_atomic_instruction(handler, funct5):
+    for aq_rl_bits in range(4):
+        register_instruction(handler, decode_R_type_operands, 0x2f, funct3=0x2, funct7=(funct5 << 2) | aq_rl_bits)
+
+
+#                    handler            operand decoder                        opcode  funct3  funct7
+register_instruction(execute_LB,        decode_I_type_operands,                0x03,   0x0)
+register_instruction(execute_LH,        decode_I_type_operands,                0x03,   0x1)
+register_instruction(execute_LW,        decode_I_type_operands,                0x03,   0x2)
+register_instruction(execute_LBU,       decode_I_type_operands,                0x03,   0x4)
+register_instruction(execute_LHU,       decode_I_type_operands,                0x03,   0x5)
+
+register_instruction(execute_FENCE,     decode_no_operands,                    0x0f)
+
+register_instruction(execute_ADDI,      decode_I_type_sign_extended_operands,  0x13,   0x0)
+register_instruction(execute_SLLI,      decode_shift_immediate_operands,       0x13,   0x1,    0x00)
+register_instruction(execute_SLTIU,     decode_I_type_unsigned_operands,       0x13,   0x3)
+register_instruction(execute_XORI,      decode_I_type_sign_extended_operands,  0x13,   0x4)
+register_instruction(execute_SRLI,      decode_shift_immediate_operands,       0x13,   0x5,    0x00)
+register_instruction(execute_SRAI,      decode_shift_immediate_operands,       0x13,   0x5,    0x20)
+register_instruction(execute_ORI,       decode_I_type_sign_extended_operands,  0x13,   0x6)
+register_instruction(execute_ANDI,      decode_I_type_sign_extended_operands,  0x13,   0x7)
+
+register_instruction(execute_AUIPC,     decode_U_type_signed_operands,         0x17)
+
+register_instruction(execute_SB,        decode_S_type_operands,                0x23,   0x0)
+register_instruction(execute_SH,        decode_S_type_operands,                0x23,   0x1)
+register_instruction(execute_SW,        decode_S_type_operands,                0x23,   0x2)
+
+register_atomic_instruction(execute_AMOADD_W,  funct5=0x00)
+register_atomic_instruction(execute_AMOSWAP_W, funct5=0x01)
+register_atomic_instruction(execute_LR_W,      funct5=0x02)
+register_atomic_instruction(execute_SC_W,      funct5=0x03)
+register_atomic_instruction(execute_AMOOR_W,   funct5=0x08)
+register_atomic_instruction(execute_AMOAND_W,  funct5=0x0C)
+
+register_instruction(execute_ADD,       decode_R_type_operands,                0x33,   0x0,    0x00)
+register_instruction(execute_SUB,       decode_R_type_operands,                0x33,   0x0,    0x20)
+register_instruction(execute_SLL,       decode_R_type_operands,                0x33,   0x1,    0x00)
+register_instruction(execute_SLT,       decode_R_type_operands,                0x33,   0x2,    0x00)
+register_instruction(execute_SLTU,      decode_R_type_operands,                0x33,   0x3,    0x00)
+register_instruction(execute_XOR,       decode_R_type_operands,                0x33,   0x4,    0x00)
+register_instruction(execute_SRL,       decode_R_type_operands,                0x33,   0x5,    0x00)
+register_instruction(execute_SRA,       decode_R_type_operands,                0x33,   0x5,    0x20)
+register_instruction(execute_OR,        decode_R_type_operands,                0x33,   0x6,    0x00)
+register_instruction(execute_AND,       decode_R_type_operands,                0x33,   0x7,    0x00)
+
+register_instruction(execute_MUL,       decode_R_type_operands,                0x33,   0x0,    0x01)
+register_instruction(execute_MULH,      decode_R_type_operands,                0x33,   0x1,    0x01)
+register_instruction(execute_MULHU,     decode_R_type_operands,                0x33,   0x3,    0x01)
+register_instruction(execute_DIV,       decode_R_type_operands,                0x33,   0x4,    0x01)
+register_instruction(execute_DIVU,      decode_R_type_operands,                0x33,   0x5,    0x01)
+register_instruction(execute_REM,       decode_R_type_operands,                0x33,   0x6,    0x01)
+register_instruction(execute_REMU,      decode_R_type_operands,                0x33,   0x7,    0x01)
+
+register_instruction(execute_LUI,       decode_U_type_operands,                0x37)
+
+register_instruction(execute_BEQ,       decode_B_type_operands,                0x63,   0x0)
+register_instruction(execute_BNE,       decode_B_type_operands,                0x63,   0x1)
+register_instruction(execute_BLT,       decode_B_type_operands,                0x63,   0x4)
+register_instruction(execute_BGE,       decode_B_type_operands,                0x63,   0x5)
+register_instruction(execute_BLTU,      decode_B_type_operands,                0x63,   0x6)
+register_instruction(execute_BGEU,      decode_B_type_operands,                0x63,   0x7)
+
+register_instruction(execute_JALR,      decode_I_type_operands,                0x67,   0x0)
+register_instruction(execute_JAL,       decode_J_type_operands,                0x6f)
+
+register_instruction(None,              decode_environment_instruction,        0x73,   0x0)
+register_instruction(execute_CSRRW,     decode_CSR_operands,                   0x73,   0x1)
+register_instruction(execute_CSRRS,     decode_CSR_operands,                   0x73,   0x2)
+register_instruction(execute_CSRRC,     decode_CSR_operands,                   0x73,   0x3)
+register_instruction(execute_CSRRWI,    decode_CSR_operands,                   0x73,   0x5)
+register_instruction(execute_CSRRSI,    decode_CSR_operands,                   0x73,   0x6)
+register_instruction(execute_CSRRCI,    decode_CSR_operands,                   0x73,   0x7)
+
+
+# ============================================================================================================
+#  Trace formats
+#
+#  Used only when the executed instructions are printed out by the logger. Operands are passed to str.format() in
+#  the same order as returned by the operand decoders. Two additional conversions are supported:
+#     !i - immediate value as a signed 32-bit value
+#     !u - upper immediate value of LUI/AUIPC (bits [31:12]) as a signed 20-bit value
+# ============================================================================================================
+
+INSTRUCTION_TRACE_FORMATS = {
+    execute_LB:        "lb x{0}, {2}(x{1})  (Load Byte, 8-bit - With sign extension)",
+    execute_LH:        "lh x{0}, {2}(x{1})  (Load Half-word, 16-bit - With sign extension)",
+    execute_LW:        "lw x{0}, {2}(x{1})  (Load Word, 32-bit)",
+    execute_LBU:       "lbu x{0}, {2}(x{1})  (Load Byte, 8-bit - Unsigned)",
+    execute_LHU:       "lhu x{0}, {2}(x{1})  (Load Half-word, 16-bit - Unsigned)",
+
+    execute_SB:        "sb x{1}, {2}(x{0})  (Store Byte, 8-bit)",
+    execute_SH:        "sh x{1}, {2}(x{0})  (Store Half-word, 16-bit)",
+    execute_SW:        "sw x{1}, {2}(x{0})  (Store Word, 32-bit)",
+
+    execute_ADDI:      "addi x{0}, x{1}, {2!i}  (Add immediate)",
+    execute_SLLI:      "slli x{0}, x{1}, {2}  (Shift Left Logical - Immediate)",
+    execute_SLTIU:     "sltiu x{0}, x{1}, {2}  (Set Less Than - Immediate Unsigned)",
+    execute_XORI:      "xori x{0}, x{1}, {2!i}  (bitwise XOR - Immediate)",
+    execute_SRLI:      "srli x{0}, x{1}, {2}  (Shift Right Logical - Immediate)",
+    execute_SRAI:      "srai x{0}, x{1}, {2}  (Shift Right Arithmeticly - Immediate)",
+    execute_ORI:       "ori x{0}, x{1}, {2!i}  (bitwise OR - Immediate)",
+    execute_ANDI:      "andi x{0}, x{1}, {2!i}  (bitwise AND - Immediate)",
+    execute_LUI:       "lui x{0}, {1!u}  (Load Upper Immediate)",
+    execute_AUIPC:     "auipc x{0}, {1!u}  (Add Upper Immediate to PC)",
+
+    execute_ADD:       "add x{0}, x{1}, x{2}  (Addition)",
+    execute_SUB:       "sub x{0}, x{1}, x{2}  (Subtraction )",
+    execute_SLL:       "sll x{0}, x{1}, x{2}  (Shift Left Logical)",
+    execute_SLT:       "slt x{0}, x{1}, x{2}  (Set Less Than - Signed)",
+    execute_SLTU:      "sltu x{0}, x{1}, x{2}  (Set Less Than - Unsigned)",
+    execute_XOR:       "xor x{0}, x{1}, x{2}  (Bitwise XOR)",
+    execute_SRL:       "srl x{0}, x{1}, x{2}  (Shift Right Logical)",
+    execute_SRA:       "sra x{0}, x{1}, x{2}  (Shift Right Arithmeticly)",
+    execute_OR:        "or x{0}, x{1}, x{2}  (Bitwise OR)",
+    execute_AND:       "and x{0}, x{1}, x{2}  (Bitwise AND)",
+
+    execute_MUL:       "mul x{0}, x{1}, x{2}  (Signed Multiplication )",
+    execute_MULH:      "mulh x{0}, x{1}, x{2}  (Signed Multiplication - Higher-order bits)",
+    execute_MULHU:     "mulhu x{0}, x{1}, x{2}  (Unsigned Multiplication - Higher-order bits)",
+    execute_DIV:       "div x{0}, x{1}, x{2}  (Division - Signed)",
+    execute_DIVU:      "divu x{0}, x{1}, x{2}  (Division - Usigned)",
+    execute_REM:       "rem x{0}, x{1}, x{2}  (Remainder - Signed)",
+    execute_REMU:      "remu x{0}, x{1}, x{2}  (Remainder - Usigned)",
+
+    execute_LR_W:      "lr.w x{0}, x{1}  (Load Reserved - Atomic)",
+    execute_SC_W:      "sc.w x{0}, x{2}, (x{1})  (Store Conditional - Atomic)",
+    execute_AMOSWAP_W: "amo-swap.w x{0}, x{2}, (x{1})  (Atomic SWAP)",
+    execute_AMOADD_W:  "amo-add.w x{0}, x{2}, (x{1})  (Atomic ADD)",
+    execute_AMOOR_W:   "amo-or.w x{0}, x{2}, (x{1})  (Atomic OR)",
+    execute_AMOAND_W:  "amo-and.w x{0}, x{2}, (x{1})  (Atomic AND)",
+
+    execute_BEQ:       "beq x{0}, x{1}, {2}  (Branch if EQual)",
+    execute_BNE:       "bne x{0}, x{1}, {2}  (Branch if Not Equal)",
+    execute_BLT:       "blt x{0}, x{1}, {2}  (Branch if Less Than)",
+    execute_BGE:       "bge x{0}, x{1}, {2}  (Branch if Greater than or Equal)",
+    execute_BLTU:      "bltu x{0}, x{1}, {2}  (Branch if Less Than - Unsigned)",
+    execute_BGEU:      "bgeu x{0}, x{1}, {2}  (Branch if Greater than or Equal - Unsigned)",
+    execute_JALR:      "jalr x{0}, x{1} + {2}  (Jump and Link Register)",
+    execute_JAL:       "jal x{0}, {1}  (Jump and Link)",
+
+    execute_FENCE:     "fence (Ignored instruction)",
+    execute_ECALL:     "ecall (Environment/System Call)",
+    execute_EBREAK:    "ebreak (Ignored instruction)",
+    execute_WFI:       "wfi (Wait For Interrupt)",
+    execute_MRET:      "mret (machine trap/interrupt return)",
+    execute_CSRRW:     "csr-rw x{0}, 0x{2:03x}, x{1}  (Control and Status Register Read-Write)",
+    execute_CSRRS:     "csr-rs x{0}, 0x{2:03x}, x{1}  (Control and Status Register Read-Set)",
+    execute_CSRRC:     "csr-rc x{0}, 0x{2:03x}, x{1}  (Control and Status Register Read-Clear)",
+    execute_CSRRWI:    "csr-rwi x{0}, 0x{2:03x}, {1}  (Control and Status Register Read-Write Immediate)",
+    execute_CSRRSI:    "csr-rsi x{0}, 0x{2:03x}, {1}  (Control and Status Register Read-Set Immediate)",
+    execute_CSRRCI:    "csr-rci x{0}, 0x{2:03x}, {1}  (Control and Status Register Read-Clear immediate)",
+}
+
+
+class Instruction_trace_formatter(Formatter):
+
+    def convert_field(self, value, conversion):
+        if conversion == 'i':
+            return interpret_as_32_bit_signed_value(value)
+        if conversion == 'u':
+            return interpret_as_20_bit_signed_value((value >> 12) & 0xFFFFF)
+        return super().convert_field(value, conversion)
+
+
+INSTRUCTION_TRACE_FORMATTER = Instruction_trace_formatter()
+
+
+def format_executed_instruction(handler, operands):
+    trace_format = INSTRUCTION_TRACE_FORMATS.get(handler)
+
+    if trace_format is None:
+        return f"{handler.__name__} {operands}"
+
+    return INSTRUCTION_TRACE_FORMATTER.format(trace_format, *operands)
@@ -1,6 +1,4 @@
-from config import START_ADDRESS_OF_RAM, TTY_OUTPUT_ENABLED, TEST_UART_INPUT
-
-from utils.read_keyboard import read_key
+from config import START_ADDRESS_OF_RAM
 
 # TODO: Rename "register.py" to "CPU_registers.py".
 # TODO: Move CSR stuff into "CSR_registers.py" if it grows to big after fully implementing CSR registers
@@ -33,6 +31,19 @@ class Registers:
         # Just counts the number of instructions executed so far. We need this for implementing deterministic timer
         self.executed_instruction_counter = 0
 
+    # Used by snapshots (see emulator_management/snapshot.py)
+    def get_state(self):
+        return {"instruction_pointer": self.instruction_pointer,
+                "x": list(self.x),
+                "atomic_load_reserved__address": self.atomic_load_reserved__address,
+                "executed_instruction_counter": self.executed_instruction_counter}
+
+    def set_state(self, state):
+        self.instruction_pointer = state["instruction_pointer"]
+        # List is modified in place, compiled blocks and other code can hold a reference to it
+        self.x[:] = state["x"]
+        self.atomic_load_reserved__address = state["atomic_load_reserved__address"]
+        self.executed_instruction_counter = state["executed_instruction_counter"]
 
     def print_register_values(self):
         # just to shorten the variable name
@@ -59,94 +70,58 @@ class Registers:
 
 
 class CSR_Registers:
-    def __init__(self, trap_and_interrupt_handler, logger):
+    def __init__(self, trap_and_interrupt_handler, logger, console):
         self.trap_and_interrupt_handler = trap_and_interrupt_handler
         self.logger = logger
 
+        # Xen hvc0 console (see emulator_management/console.py)
+        self.console = console
+
         # CSR registers
         self.CSR_mscratch = 0
 
-        self.test_UART_input = TEST_UART_INPUT
+        # Written value is only stored, pending interrupts are tracked by the trap handler (CSR_mip there)
+        self.CSR_mip = 0
+
+    def get_state(self):
+        return {"CSR_mscratch": self.CSR_mscratch,
+                "CSR_mip": self.CSR_mip}
+
+    def set_state(self, state):
+        self.CSR_mscratch = state["CSR_mscratch"]
+        self.CSR_mip = state["CSR_mip"]
 
     def read_from_register(self, register_num):
         ret_val = 0
 
-        if register_num == 0x139:
-            # This name variables should be a table/dict from which we fetch the string
-            register_short_name = "hvc0"
-            register_long_name = "Xen hypervisor console out"
-        elif register_num == 0x140:
+        if register_num == 0x140:
             # TODO: Looks like this is a part of Xen console implementation (to read keypress)
-            register_short_name = "sscratch / Xen input"
-            register_long_name = "Scratch register for supervisor trap handlers"
-            if len(self.test_UART_input) > 0 and self.logger.instruction_counter > 62700000:
-                char = self.test_UART_input[0]
-                self.test_UART_input = self.test_UART_input[1:] # remove first char
-                ret_val = ord(char)
-            else:
-                ret_val = read_key()
-            #ret_val = 0xffffffff  # Just return "no keypress" for now
+            ret_val = self.console.read_input()
         elif register_num == 0x300:
-            register_short_name = "mstatus"
-            register_long_name = "Machine status register"
             ret_val = self.trap_and_interrupt_handler.get_register_mstatus()
         elif register_num == 0x304:
-            register_short_name = "mie"
-            register_long_name = "Machine Interrupt Enable"
             ret_val = self.trap_and_interrupt_handler.CSR_mie
         elif register_num == 0x305:
-            register_short_name = "mtvec"
-            register_long_name = "Machine trap-handler base address"
             ret_val = self.trap_and_interrupt_handler.get_trap_handler_address()
         elif register_num == 0x340:
-            register_short_name = "mscratch"
-            register_long_name = "Scratch register"
             ret_val = self.CSR_mscratch
         elif register_num == 0x341:
-            register_short_name = "mepc"
-            register_long_name = "Machine exception PC / Instruction pointer"
             ret_val = self.trap_and_interrupt_handler.CSR_mepc
         elif register_num == 0x342:
-            register_short_name = "mcause"
-            register_long_name = "Machine trap cause"
             ret_val = self.trap_and_interrupt_handler.CSR_mcause
         elif register_num == 0x343:
-            register_short_name = "mtval"
-            register_long_name = "Machine bad address or instruction"
             ret_val = self.trap_and_interrupt_handler.CSR_mtval
         elif register_num == 0x344:
-            register_short_name = "mip"
-            register_long_name = "Machine Interrupt Pending"
             ret_val = self.trap_and_interrupt_handler.CSR_mip
-        elif register_num == 0x3a0:
-            register_short_name = "pmpcfg0"
-            register_long_name = "Physical memory protection configuration"
-        elif register_num == 0x3b0:
-            register_short_name = "pmpaddr0"
-            register_long_name = "Physical memory protection address register"
         elif register_num == 0xF11:
-            register_short_name = "mvendorid"
-            register_long_name = "Machine Vendor ID"
             ret_val = 0xff0ff0ff  # Number returned by original C emulator
-        elif register_num == 0xF11:
-            register_short_name = "mvendorid"
-            register_long_name = "Machine Vendor ID"
-        elif register_num == 0xF12:
-            register_short_name = "marchid"
-            register_long_name = "Machine Architecture ID"
-        elif register_num == 0xF13:
-            register_short_name = "mimpid"
-            register_long_name = "Machine Implementation ID"
-        elif register_num == 0xF14:
-            register_short_name = "mhartid"
-            register_long_name = "Hardware thread ID"
-            ret_val = 0  # First and only CPU core
-        else:
+        elif register_num not in CSR_REGISTER_NAMES:
             print(f"[ERROR] Tried to read unknown CSR register -> CSR[0x{register_num:x}]")
             exit()
 
-        message = f"Read  CSR[0x{register_num:x}], old value = {ret_val:08x} (register '{register_short_name}': {register_long_name})"
-        self.logger.register_CSR_register_usage(message)
+        # All other known registers (hvc0, pmpcfg0, pmpaddr0, marchid, mimpid, mhartid) read as zero
+
+        self.logger.register_CSR_register_read(register_num, ret_val)
         return ret_val
 
     def write_to_register(self, register_num, new_value):
@@ -154,72 +129,55 @@ class CSR_Registers:
             # This is Xen hypervisor console
             # Because device tree has set "console=hvc0" in Kernel bootargs/cmdargs, the kernel switches
             # from UART to Xen console
-            register_short_name = "hvc0"
-            register_long_name = "Xen hypervisor console"
-            if TTY_OUTPUT_ENABLED:
-                char = chr(new_value)  # Convert value to ASCII character
-                print(char, end='', flush=True)
+            self.console.write_output(new_value)
         elif register_num == 0x140:
-            register_short_name = "sscratch / Xen input"
-            register_long_name = "Scratch register for supervisor trap handlers"
             if new_value != 0xffffffff:
                 #print(f"Trying to set 'sscratch' to {new_value}")
                 #exit(-1)
                 pass
         elif register_num == 0x300:
-            register_short_name = "mstatus"
-            register_long_name = "Machine status register"
             self.trap_and_interrupt_handler.set_register_mstatus(new_value)
         elif register_num == 0x304:
-            register_short_name = "mie"
-            register_long_name = "Machine Interrupt Enable"
-            self.trap_and_interrupt_handler.CSR_mie = new_value
+            self.trap_and_interrupt_handler.set_CSR_mie(new_value)
         elif register_num == 0x305:
-            register_short_name = "mtvec"
-            register_long_name = "Machine trap-handler base address"
             self.trap_and_interrupt_handler.set_trap_handler_address(new_value)
         elif register_num == 0x340:
-            register_short_name = "mscratch"
-            register_long_name = "Scratch register"
             self.CSR_mscratch = new_value
         elif register_num == 0x341:
-            register_short_name = "mepc"
-            register_long_name = "Machine exception PC / Instruction pointer"
             self.trap_and_interrupt_handler.CSR_mepc = new_value
         elif register_num == 0x342:
-            register_short_name = "mcause"
-            register_long_name = "Machine trap cause"
             self.trap_and_interrupt_handler.CSR_mcause = new_value  # TODO: This probably should not be settable
         elif register_num == 0x343:
-            register_short_name = "mtval"
-            register_long_name = "Machine bad address or instruction"
             self.trap_and_interrupt_handler.CSR_mtval = new_value  # Specs say this can be set by software
         elif register_num == 0x344:
-            register_short_name = "mip"
-            register_long_name = "Machine Interrupt Pending"
             self.CSR_mip = new_value
-        elif register_num == 0x3a0:
-            register_short_name = "pmpcfg0"
-            register_long_name = "Physical memory protection configuration"
-        elif register_num == 0x3b0:
-            register_short_name = "pmpaddr0"
-            register_long_name = "Physical memory protection address register"
-        elif register_num == 0xF11:
-            register_short_name = "mvendorid"
-            register_long_name = "Machine Vendor ID"
-        elif register_num == 0xF12:
-            register_short_name = "marchid"
-            register_long_name = "Machine Architecture ID"
-        elif register_num == 0xF13:
-            register_short_name = "mimpid"
-            register_long_name = "Machine Implementation ID"
-        elif register_num == 0xF14:
-            register_short_name = "mhartid"
-            register_long_name = "Hardware thread ID"
-        else:
+        elif register_num not in CSR_REGISTER_NAMES:
             print(f"[ERROR] Tried to write unknown CSR register -> CSR[0x{register_num:x}] = 0x{new_value:x} \n")
             exit()
 
-        message = f"Write CSR[0x{register_num:x}], new value = {new_value:08x} (register '{register_short_name}': {register_long_name})\n"
-        self.logger.register_CSR_register_usage(message)
+        # Writes to all other known registers (pmpcfg0, pmpaddr0, mvendorid, ...) are ignored
+
+        self.logger.register_CSR_register_write(register_num, new_value)
         pass
+
+
+# Register number -> (short name, long name)
+# Used for checking if the register is implemented and for logging of CSR register access
+CSR_REGISTER_NAMES = {
+    0x139: ("hvc0", "Xen hypervisor console"),
+    0x140: ("sscratch / Xen input", "Scratch register for supervisor trap handlers"),
+    0x300: ("mstatus", "Machine status register"),
+    0x304: ("mie", "Machine Interrupt Enable"),
+    0x305: ("mtvec", "Machine trap-handler base address"),
+    0x340: ("mscratch", "Scratch register"),
+    0x341: ("mepc", "Machine exception PC / Instruction pointer"),
+    0x342: ("mcause", "Machine trap cause"),
+    0x343: ("mtval", "Machine bad address or instruction"),
+    0x344: ("mip", "Machine Interrupt Pending"),
+    0x3a0: ("pmpcfg0", "Physical memory protection configuration"),
+    0x3b0: ("pmpaddr0", "Physical memory protection address register"),
+    0xF11: ("mvendorid", "Machine Vendor ID"),
+    0xF12: ("marchid", "Machine Architecture ID"),
+    0xF13: ("mimpid", "Machine Implementation ID"),
+    0xF14: ("mhartid", "Hardware thread ID"),
+}
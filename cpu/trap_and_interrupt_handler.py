@@ -33,8 +33,37 @@ class Trap_And_Interrupt_Handler:
         self.CSR_mtval = 0
 
         self.CPU_privilege_mode = MACHINE_MODE
+
+        # True if an interrupt is pending (MIP), enabled (MIE) and interrupts are globally enabled (mstatus.MIE), so
+        # the CPU has to take it before the next instruction. It's checked by the CPU loop after every instruction,
+        # so instead of computing it there every time, it's computed only when one of these three changes. That's why
+        # CSR_mip, CSR_mie and interrupts_global_enable must be changed only through their set_ functions
+        self.interrupt_deliverable = False
         pass
 
+    # Names of all fields that make the state of the trap handler. Used by snapshots
+    STATE_FIELDS = ("interrupts_global_enable", "MPIE__Previous_Interrupt_Enable", "MPP__Previous_Privilege_Mode",
+                    "CSR_mtvec", "CSR_mip", "CSR_mie", "CSR_mepc", "CSR_mcause", "CSR_mtval", "CPU_privilege_mode")
+
+    def get_state(self):
+        return {name: getattr(self, name) for name in self.STATE_FIELDS}
+
+    def set_state(self, state):
+        for name in self.STATE_FIELDS:
+            setattr(self, name, state[name])
+        self.update_interrupt_deliverable()
+
+    def update_interrupt_deliverable(self):
+        self.interrupt_deliverable = self.CSR_mip & self.CSR_mie != 0 and self.interrupts_global_enable
+
+    def set_CSR_mip(self, new_value):
+        self.CSR_mip = new_value
+        self.update_interrupt_deliverable()
+
+    def set_CSR_mie(self, new_value):
+        self.CSR_mie = new_value
+        self.update_interrupt_deliverable()
+
     def set_trap_handler_address(self, address):
         self.CSR_mtvec = address
         pass
@@ -49,7 +78,7 @@ class Trap_And_Interrupt_Handler:
 
         # Set pending interrupt bit for timer
         # TODO: The problem is, MIP should be read from the controller if we want to be precise
-        self.CSR_mip = (1 << MTIP_bit_position)
+        self.set_CSR_mip(self.CSR_mip | (1 << MTIP_bit_position))
         # print(f"({self.executed_instruction_counter}) Called signal_timer_interrupt: CSR_mip = {self.CSR_mip:x}, CSR_mie = {self.CSR_mie:x}, CSR_mstatus = {self.CSR_mstatus:x}")
         pass
 
@@ -57,9 +86,22 @@ class Trap_And_Interrupt_Handler:
         # Machine Timer Interupt bit
         MTIP_bit_position = 7
 
-        # TODO: There are no other interrupts at the moment, so just clear all
-        self.CSR_mip = 0
+        self.set_CSR_mip(self.CSR_mip & ~(1 << MTIP_bit_position))
+
+    # External interrupts come from the interrupt controller (PLIC, see devices/device_PLIC.py)
+    def signal_external_interrupt(self):
+        # Machine External Interrupt bit
+        MEIP_bit_position = 11
+
+        self.set_CSR_mip(self.CSR_mip | (1 << MEIP_bit_position))
+
+    def clear_external_interrupt(self):
+        # Machine External Interrupt bit
+        MEIP_bit_position = 11
+
+        self.set_CSR_mip(self.CSR_mip & ~(1 << MEIP_bit_position))
 
+    # Called by the CPU loop only when interrupt_deliverable is set
     def update(self):
         # Check if there are any pending interrupts (MIP), and if the pending interrupts are enabled (MIE)
         enabled_pending_interrupts = self.CSR_mip & self.CSR_mie
@@ -67,9 +109,15 @@ class Trap_And_Interrupt_Handler:
         # Replace "self.CSR_mstatus & 8 == 8" with are_interrupts_enabled() from Class interrupt_controller
         if enabled_pending_interrupts != 0 and self.get_interrupts_global_enable_state():
             # TODO: Make a enum for EXCCODEs
+            # When more interrupts are pending, the external one is taken first (privileged spec, "mip" register)
+            # 11 is the "exception code" (EXCCODE) for the "Machine external interrupt"
             # 7 is the "exception code" (EXCCODE) for the "Machine timer interrupt"
             # 0x8.. is a bit that denotes that the trap was caused by an interrupt
-            cause = 0x80000000 + 7
+            MEIP_bit_position = 11
+            if enabled_pending_interrupts & (1 << MEIP_bit_position):
+                cause = 0x80000000 + 11
+            else:
+                cause = 0x80000000 + 7
             self.enter_interrupt(cause)
         pass
 
@@ -124,7 +172,7 @@ class Trap_And_Interrupt_Handler:
         self.set_MPP__Previous_Privilege_Mode(old_privilege)
 
     def set_MPIE__Previous_Interrupt_Enable(self, new_value: bool):
-        self.logger.register_CSR_register_usage(f"[CPU Control] Setting MPIE__Previous_Interrupt_Enable to {new_value}")
+        self.logger.register_CSR_register_usage("[CPU Control] Setting MPIE__Previous_Interrupt_Enable to {}", new_value)
         self.MPIE__Previous_Interrupt_Enable = new_value
 
 
@@ -132,7 +180,7 @@ class Trap_And_Interrupt_Handler:
         if new_value > 3:
             raise Exception("Trying to set Privilege mode above 3: There are only 0-3 privilage modes")
 
-        self.logger.register_CSR_register_usage(f"  [CPU Control] Setting MPP__Previous_Privilege_Mode to {new_value}")
+        self.logger.register_CSR_register_usage("  [CPU Control] Setting MPP__Previous_Privilege_Mode to {}", new_value)
 
         self.MPP__Previous_Privilege_Mode = new_value
 
@@ -160,6 +208,7 @@ class Trap_And_Interrupt_Handler:
 
     def set_interrupts_global_enable_state(self, new_state: bool):
         self.interrupts_global_enable = new_state
+        self.update_interrupt_deliverable()
 
 
     ### CSR registers implementation
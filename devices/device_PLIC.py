@@ -0,0 +1,186 @@
+
+# Platform-Level Interrupt Controller (PLIC) collects the interrupts of the devices (UART, ...) and signals them to
+# the CPU as one "machine external interrupt" (bit MEIP of the register "mip")
+#
+#   Specification: https://github.com/riscv/riscv-plic-spec/blob/master/riscv-plic.adoc
+#
+# Every device has its own interrupt source (see UART_INTERRUPT_SOURCE in config.py). Sources are level-triggered:
+# the device keeps its interrupt line high as long as it needs the attention of the kernel (set_interrupt_level).
+#
+# The machine has one hart, and the kernel runs in machine mode, so there is only one context (context 0). Registers:
+#   0x000000 + 4 * source - priority of the source (0 = never interrupts)
+#   0x001000              - pending bits (read only)
+#   0x002000              - enable bits of the sources for context 0
+#   0x200000              - priority threshold of context 0, only sources with a bigger priority interrupt
+#   0x200004              - claim/complete of context 0:
+#                             read  (claim)    - returns the pending source with the highest priority, and marks it as
+#                                                being handled, so it doesn't interrupt again until completed
+#                             write (complete) - the kernel is done with the source
+#
+# All registers are 32-bit, but the address space accesses the devices byte by byte (4-byte access is done as 4 byte
+# accesses from the lowest address, see memory/address_space.py). So the claim is done when the lowest byte is read,
+# and the complete when the highest byte is written.
+
+# Sources 1..31, so all of the pending and enable bits fit into one 32-bit register (source 0 means "no source")
+PLIC_NUMBER_OF_SOURCES = 31
+
+# Size of the registers in the address space (the usual size, as on other RISC-V machines)
+PLIC_MMIO_SIZE = 0x4000000
+
+PRIORITY_BASE = 0x000000
+PENDING_BASE = 0x001000
+ENABLE_BASE = 0x002000
+THRESHOLD = 0x200000
+CLAIM_COMPLETE = 0x200004
+
+
+class Device_PLIC:
+
+    def __init__(self, logger, trap_and_interrupt_handler):
+        self.logger = logger
+        self.trap_and_interrupt_handler = trap_and_interrupt_handler
+
+        self.priorities = [0] * (PLIC_NUMBER_OF_SOURCES + 1)
+        self.enabled_sources = 0
+        self.threshold = 0
+
+        # Bit per source: interrupt line of the device is high
+        self.interrupt_lines = 0
+
+        # Bit per source: claimed by the kernel and not completed yet
+        self.claimed_sources = 0
+
+        # Source returned by the last claim (bytes 1-3 of the claim register are read after the claim is done)
+        self.last_claimed_source = 0
+
+        # Bytes of the claim/complete register written so far
+        self.complete_value = 0
+
+        self.external_interrupt_signalled = False
+        pass
+
+    STATE_FIELDS = ("priorities", "enabled_sources", "threshold", "interrupt_lines", "claimed_sources",
+                    "last_claimed_source", "complete_value")
+
+    def get_state(self):
+        return {name: getattr(self, name) for name in self.STATE_FIELDS}
+
+    def set_state(self, state):
+        for name in self.STATE_FIELDS:
+            setattr(self, name, state[name])
+        self.external_interrupt_signalled = False
+        self.update()
+
+    # Size in address space
+    @staticmethod
+    def get_mmio_size():
+        return PLIC_MMIO_SIZE - 1
+
+    # Called by the devices whenever their interrupt condition changes
+    def set_interrupt_level(self, source, level):
+        if level:
+            self.interrupt_lines |= 1 << source
+        else:
+            self.interrupt_lines &= ~(1 << source)
+        self.update()
+
+    # Sources that wait to be claimed. A claimed source isn't pending until it's completed, even if its line is high
+    def get_pending_sources(self):
+        return self.interrupt_lines & ~self.claimed_sources
+
+    # Returns the enabled pending source with the highest priority (the lowest number of those with the same
+    # priority), or 0 if no source can interrupt
+    def get_highest_priority_source(self):
+        candidates = self.get_pending_sources() & self.enabled_sources
+        best_source = 0
+        best_priority = self.threshold
+        source = 1
+        candidates >>= 1
+        while candidates:
+            if candidates & 1 and self.priorities[source] > best_priority:
+                best_source = source
+                best_priority = self.priorities[source]
+            candidates >>= 1
+            source += 1
+        return best_source
+
+    # MEIP is set as long as there is a source that can interrupt
+    def update(self):
+        interrupt = self.get_highest_priority_source() != 0
+        if interrupt != self.external_interrupt_signalled:
+            self.external_interrupt_signalled = interrupt
+            if interrupt:
+                self.trap_and_interrupt_handler.signal_external_interrupt()
+            else:
+                self.trap_and_interrupt_handler.clear_external_interrupt()
+
+    def claim(self):
+        source = self.get_highest_priority_source()
+        if source != 0:
+            self.claimed_sources |= 1 << source
+            self.update()
+        self.logger.register_device_usage("[PLIC] Claim: source {}", source)
+        return source
+
+    def complete(self, source):
+        self.logger.register_device_usage("[PLIC] Complete: source {}", source)
+        if 0 < source <= PLIC_NUMBER_OF_SOURCES:
+            self.claimed_sources &= ~(1 << source)
+            self.update()
+
+    def read_register(self, address):
+        register = address & ~3
+        byte_shift = (address & 3) * 8
+
+        if register == CLAIM_COMPLETE:
+            if byte_shift == 0:
+                self.last_claimed_source = self.claim()
+            return (self.last_claimed_source >> byte_shift) & 0xFF
+
+        if PRIORITY_BASE < register <= PRIORITY_BASE + 4 * PLIC_NUMBER_OF_SOURCES:
+            value = self.priorities[(register - PRIORITY_BASE) // 4]
+        elif register == PRIORITY_BASE:
+            value = 0  # Source 0 doesn't exist
+        elif register == PENDING_BASE:
+            value = self.get_pending_sources()
+        elif register == ENABLE_BASE:
+            value = self.enabled_sources
+        elif register == THRESHOLD:
+            value = self.threshold
+        else:
+            print(f"[ERROR] PLIC: Unknown/unimplemented register read attempt ({address:08x})")
+            raise Exception("PLIC: Unknown/unimplemented register read attempt")
+
+        return (value >> byte_shift) & 0xFF
+
+    def write_register(self, address, value):
+        register = address & ~3
+        byte_shift = (address & 3) * 8
+        byte_mask = 0xFF << byte_shift
+
+        if register == CLAIM_COMPLETE:
+            self.complete_value = (self.complete_value & ~byte_mask) | (value << byte_shift)
+            if byte_shift == 24:
+                self.complete(self.complete_value)
+            return
+
+        if PRIORITY_BASE < register <= PRIORITY_BASE + 4 * PLIC_NUMBER_OF_SOURCES:
+            source = (register - PRIORITY_BASE) // 4
+            self.priorities[source] = (self.priorities[source] & ~byte_mask) | (value << byte_shift)
+        elif register == PRIORITY_BASE or register == PENDING_BASE:
+            pass  # Source 0 doesn't exist, pending bits are read only
+        elif register == ENABLE_BASE:
+            # Bit 0 (source 0) is hardwired to zero
+            self.enabled_sources = ((self.enabled_sources & ~byte_mask) | (value << byte_shift)) & ~1
+        elif register == THRESHOLD:
+            self.threshold = (self.threshold & ~byte_mask) | (value << byte_shift)
+        else:
+            print(f"[ERROR] PLIC: Unknown/unimplemented register write attempt ({address:08x})")
+            raise Exception("PLIC: Unknown/unimplemented register write attempt")
+
+        self.update()
+
+
+if __name__ == '__main__':
+    print(f"\nExecuting:\n\t{__file__} \n")
+    print("Hopefully here we will have tests for functions in this file")
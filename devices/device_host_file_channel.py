@@ -0,0 +1,121 @@
+
+# Host file channel - a paravirtual device (it exists only in this emulator) that moves whole buffers between the
+# memory of the guest and files of the host. Meant for staging inputs of guest programs and getting their results out,
+# which would otherwise go through the console, one character per CSR access.
+#
+# Guest can only use the files listed in HOST_FILE_CHANNEL_FILES, and refers to them by their index (handle):
+#   "r" - file is opened for reading
+#   "w" - file is created (or truncated) when the emulator starts, and can be written and read
+#
+# The kernel has no driver for it. There is no MMU, so a program in the guest can access the registers directly, and
+# the address of its buffer is also the address in RAM. Registers (32-bit):
+#   0x00 HANDLE        - index of the file
+#   0x04 ADDRESS       - address of the buffer in RAM
+#   0x08 LENGTH        - number of bytes
+#   0x0C OFFSET_LOW    - position in the file
+#   0x10 OFFSET_HIGH
+#   0x14 COMMAND       - writing a command does the whole transfer, before the next instruction:
+#                          1 = read (file -> RAM), 2 = write (RAM -> file), 3 = get size of the file
+#   0x18 RESULT        - number of transferred bytes (less than LENGTH at the end of the file), or the size of the file
+#                        (low 32 bits). RESULT_ERROR if the command failed
+#
+# Data is copied between the file and RAM in one step (see Address_Space.read_file_into_RAM), so a megabyte costs
+# about as much as reading it from a host file, instead of a million emulated instructions.
+#
+# The address space accesses the devices byte by byte (4-byte access goes from the lowest address), so a command is
+# done when the highest byte of COMMAND is written.
+
+COMMAND_READ = 1
+COMMAND_WRITE = 2
+COMMAND_GET_SIZE = 3
+
+RESULT_ERROR = 0xFFFFFFFF
+
+REGISTER_HANDLE = 0x00
+REGISTER_ADDRESS = 0x04
+REGISTER_LENGTH = 0x08
+REGISTER_OFFSET_LOW = 0x0C
+REGISTER_OFFSET_HIGH = 0x10
+REGISTER_COMMAND = 0x14
+REGISTER_RESULT = 0x18
+
+
+class Device_Host_File_Channel:
+
+    def __init__(self, logger, address_space, files):
+        self.logger = logger
+        self.address_space = address_space
+
+        # Handle -> (file, can be written)
+        self.files = []
+        for path, mode in files:
+            if mode not in ("r", "w"):
+                raise Exception(f"Host file channel: mode of '{path}' must be 'r' or 'w'")
+            # Unbuffered, so a transfer is a single read()/write() of the OS directly from/into RAM
+            self.files.append((open(path, 'rb' if mode == "r" else 'w+b', buffering=0), mode == "w"))
+
+        # Register offset -> value
+        self.registers = {REGISTER_HANDLE: 0, REGISTER_ADDRESS: 0, REGISTER_LENGTH: 0, REGISTER_OFFSET_LOW: 0,
+                          REGISTER_OFFSET_HIGH: 0, REGISTER_COMMAND: 0, REGISTER_RESULT: 0}
+        pass
+
+    # Position in the files isn't a part of the state, every command gives its own offset
+    def get_state(self):
+        return {"registers": list(self.registers.items())}
+
+    def set_state(self, state):
+        self.registers = dict(state["registers"])
+
+    # Size in address space
+    @staticmethod
+    def get_mmio_size():
+        return REGISTER_RESULT + 3
+
+    def read_register(self, address):
+        register = address & ~3
+        return (self.registers[register] >> ((address & 3) * 8)) & 0xFF
+
+    def write_register(self, address, value):
+        register = address & ~3
+        byte_shift = (address & 3) * 8
+
+        if register == REGISTER_RESULT:
+            return  # Read only
+
+        self.registers[register] = (self.registers[register] & ~(0xFF << byte_shift)) | (value << byte_shift)
+
+        if register == REGISTER_COMMAND and byte_shift == 24:
+            self.registers[REGISTER_RESULT] = self.execute_command(self.registers[REGISTER_COMMAND])
+
+    def execute_command(self, command):
+        registers = self.registers
+        handle = registers[REGISTER_HANDLE]
+        address = registers[REGISTER_ADDRESS]
+        length = registers[REGISTER_LENGTH]
+        offset = (registers[REGISTER_OFFSET_HIGH] << 32) | registers[REGISTER_OFFSET_LOW]
+
+        self.logger.register_device_usage("[HOST_FILE_CHANNEL] Command {} handle {}: {} bytes at {:08x}",
+                                          command, handle, length, address)
+
+        if handle >= len(self.files) or command not in (COMMAND_READ, COMMAND_WRITE, COMMAND_GET_SIZE):
+            return RESULT_ERROR
+        file, writable = self.files[handle]
+
+        if command == COMMAND_GET_SIZE:
+            return file.seek(0, 2) & 0xFFFFFFFF
+
+        if not self.address_space.is_RAM_block(address, length):
+            return RESULT_ERROR
+
+        file.seek(offset)
+        if command == COMMAND_READ:
+            return self.address_space.read_file_into_RAM(file, address, length)
+
+        if not writable:
+            return RESULT_ERROR
+        return self.address_space.write_RAM_into_file(file, address, length)
+
+
+if __name__ == '__main__':
+    print(f"\nExecuting:\n\t{__file__} \n")
+    print("Hopefully here we will have tests for functions in this file")
@@ -3,18 +3,40 @@
 # I've decided not to give the module ambiguous name device_CLINT.py but also name it after the timer functionality
 
 # The CLINT has 3 registers:
-#   mtime - counts time (one tick is one microsecond in our case)
+#   mtime - counts time (TIMER_FREQUENCY ticks per second, one tick is one microsecond by default)
 #   mtimeCmp - OS can set the timer value at/after which interrupt is triggered
 #   msip - generates machine mode software interrupts when set
 #
 #   More info: https://chromitem-soc.readthedocs.io/en/latest/clint.html#register-map
+#
+# Source of mtime depends on TIMEBASE:
+#   Timebase.INSTRUCTION_COUNT - number of executed instructions (so the emulation is deterministic), plus the time
+#                                that the CPU skipped while it was idle (see wait_for_timer_interrupt)
+#   Timebase.WALL_CLOCK        - time of the host since the CLINT was created. While the guest is idle (WFI), the
+#                                emulator sleeps until the timer interrupt or until there is console input
+#
+# The timer interrupt bit changes only when mtime reaches mtimecmp, or when mtimecmp is written. So update() isn't
+# called before every instruction, the CLINT schedules it for the instruction no. when mtime reaches mtimecmp, and
+# for the next instruction after every write of mtimecmp (see cpu/event_scheduler.py). Host time can't be converted
+# into an instruction no., so with the wall clock update() is scheduled every WALL_CLOCK_TIMER_CHECK_INTERVAL
+# instructions instead
+
+from time import monotonic_ns
+
+from config import Timebase, TIMEBASE, TIMER_FREQUENCY, WALL_CLOCK_TIMER_CHECK_INTERVAL, WFI_SKIPS_IDLE_TIME
+
+NANOSECONDS_PER_SECOND = 1000000000
 
 
 class Device_Timer_CLINT:
 
-    def __init__(self, logger, registers, trap_and_interrupt_handler):
+    def __init__(self, logger, registers, trap_and_interrupt_handler, event_scheduler, console):
         self.logger = logger
         self.registers = registers
+        self.event_scheduler = event_scheduler
+
+        # Console input wakes up the idle CPU (Timebase.WALL_CLOCK)
+        self.console = console
 
         # TODO: I don't like this one bit. Device_Timer_CLINT just need a
         #       function to notify a timer interrupt /bit change
@@ -22,31 +44,85 @@ class Device_Timer_CLINT:
 
         self.timer_compare_value = 0
         self.MSIP_bit = 0
+
+        self.timebase = TIMEBASE
+        self.start_time_ns = monotonic_ns()
+
+        # mtime = time from the timebase + mtime_offset. Offset is the sum of all time skips done by the WFI
+        # instruction, or it makes mtime continue from the value saved in a snapshot
+        self.mtime_offset = 0
         pass
 
+    # mtime is saved, not the offset, so a snapshot continues with the same mtime with both timebases
+    def get_state(self):
+        return {"timer_compare_value": self.timer_compare_value, "MSIP_bit": self.MSIP_bit,
+                "mtime": self.get_mtime()}
+
+    # Instruction counter is restored before the devices
+    def set_state(self, state):
+        self.timer_compare_value = state["timer_compare_value"]
+        self.MSIP_bit = state["MSIP_bit"]
+        self.mtime_offset = state["mtime"] - self.get_timebase_ticks()
+
+        # Instruction counter is restored too, so the scheduled time of the interrupt must be computed again
+        self.event_scheduler.schedule_event("CLINT", self.update)
+
     # Size in address space
     @staticmethod
     def get_mmio_size():
         return 0xBFFF
 
-    def get_mtime(self):
+    def get_timebase_ticks(self):
+        if self.timebase == Timebase.WALL_CLOCK:
+            return (monotonic_ns() - self.start_time_ns) * TIMER_FREQUENCY // NANOSECONDS_PER_SECOND
         return self.registers.executed_instruction_counter
 
+    def get_mtime(self):
+        return self.get_timebase_ticks() + self.mtime_offset
+
+    # Called by WFI when no interrupt is pending. The timer is the only source of interrupts that wakes up the CPU
+    # (console input is polled by the kernel on timer ticks too), so nothing can happen until mtime reaches mtimecmp:
+    #   - with the instruction count timebase, instead of executing the idle loop of the kernel until then, mtime
+    #     jumps straight to mtimecmp and the timer interrupt becomes pending right away
+    #   - with the wall clock, the emulator sleeps until then. Console input ends the sleep early, so the guest gets
+    #     the input without a delay once it can be signalled by an interrupt
+    def wait_for_timer_interrupt(self):
+        if self.timer_compare_value == 0:
+            return
+
+        remaining_ticks = self.timer_compare_value - self.get_mtime()
+        if remaining_ticks > 0:
+            if self.timebase == Timebase.WALL_CLOCK:
+                self.console.wait_for_input(remaining_ticks / TIMER_FREQUENCY)
+            elif WFI_SKIPS_IDLE_TIME:
+                self.mtime_offset += remaining_ticks
+                self.logger.register_device_usage("[CLINT/TIMER] WFI: skipped {} ticks of idle time", remaining_ticks)
+
+        self.update()
+
     def update(self):
         if self.timer_compare_value != 0 and self.get_mtime() >= self.timer_compare_value:
-            # self.logger.register_device_usage(f"[CLINT/TIMER] mTime ({self.get_mtime()}) bigger than mTimeCmp ({self.timer_compare_value}) !!!")
+            # self.logger.register_device_usage("[CLINT/TIMER] mTime ({}) bigger than mTimeCmp ({}) !!!", self.get_mtime(), self.timer_compare_value)
 
+            # Interrupt stays pending until mtimecmp is written
             self.trap_and_interrupt_handler.signal_timer_interrupt()
-            pass
+            self.event_scheduler.cancel_event("CLINT")
         else:
-            # TODO: I think this should be called only when timer register is read, but I will leave it here for now
             self.trap_and_interrupt_handler.clear_timer_interrupt()
-            pass
+
+            if self.timer_compare_value != 0:
+                if self.timebase == Timebase.WALL_CLOCK:
+                    check_at_instruction_no = self.registers.executed_instruction_counter + WALL_CLOCK_TIMER_CHECK_INTERVAL
+                else:
+                    check_at_instruction_no = self.registers.executed_instruction_counter + self.timer_compare_value - self.get_mtime()
+                self.event_scheduler.schedule_event("CLINT", self.update, check_at_instruction_no)
+            else:
+                self.event_scheduler.cancel_event("CLINT")
 
     # Implements register "mtime"
     # TODO: Replace hardcoded address with const/enum
     def read_register(self, address):
-        # self.logger.register_device_usage(f"[CLINT/TIMER] Read at {address:08x}")
+        # self.logger.register_device_usage("[CLINT/TIMER] Read at {:08x}", address)
 
         # Reading the timer clears the interrupt flag
         # self.trap_and_interrupt_handler.clear_timer_interrupt()
@@ -55,7 +131,7 @@ class Device_Timer_CLINT:
 
         # TODO: it would be easier to just have functions read/write 32 bit and than per byte access just wraps these functions
         if address == 0xBFF8:  # Register "mtime"
-            self.logger.register_device_usage(f"[CLINT/TIMER] Read at {address:08x}: {timer_val}")
+            self.logger.register_device_usage("[CLINT/TIMER] Read at {:08x}: {}", address, timer_val)
             return timer_val & 0xFF
         elif address == 0xBFF9:
             return (timer_val >> 8) & 0xFF
@@ -64,7 +140,7 @@ class Device_Timer_CLINT:
         elif address == 0xBFFB:
             return (timer_val >> 24) & 0xFF
         elif address == 0xBFFC:
-            self.logger.register_device_usage(f"[CLINT/TIMER] Read at {address:08x}: {timer_val}")
+            self.logger.register_device_usage("[CLINT/TIMER] Read at {:08x}: {}", address, timer_val)
             return (timer_val >> 32) & 0xFF
         elif address == 0xBFFD:
             return (timer_val >> 40) & 0xFF
@@ -80,12 +156,12 @@ class Device_Timer_CLINT:
     # Implements registers "msip" and "mtimecmp"
     # TODO: Replace hardcoded addresses with const/enum
     def write_register(self, address, value):
-        # self.logger.register_device_usage(f"[CLINT/TIMER] Write at {address:08x}: {value:08x}")
+        # self.logger.register_device_usage("[CLINT/TIMER] Write at {:08x}: {:08x}", address, value)
 
         if address == 0:  # Register "msip"
             bit_value = value & 0b00000001
             self.MSIP_bit = bit_value
-            self.logger.register_device_usage(f"[CLINT/TIMER] Write at {address:08x}: {value:08x}")
+            self.logger.register_device_usage("[CLINT/TIMER] Write at {:08x}: {:08x}", address, value)
         elif 1 <= address <= 7:
             # Only 1 bit of 32-bit MSIP Register is implemented. All other bits are hardwired to zero
             pass
@@ -113,8 +189,13 @@ class Device_Timer_CLINT:
         elif address == 0x4007:
             self.timer_compare_value &= 0x00FFFFFFFFFFFFFF
             self.timer_compare_value |= value << 56
-            self.logger.register_device_usage(f"[CLINT/TIMER] Write at {address:08x}: {self.timer_compare_value}")
+            self.logger.register_device_usage("[CLINT/TIMER] Write at {:08x}: {}", address, self.timer_compare_value)
         else:
             print(f"[ERROR] CLINT/TIMER: Unknown/unimplemented register write attempt ({address:08x})")
             raise Exception("CLINT/TIMER: Unknown/unimplemented register write attempt")
+
+        # New mtimecmp takes effect before the next instruction (same as when update() was called before every
+        # instruction)
+        if 0x4000 <= address <= 0x4007:
+            self.event_scheduler.schedule_event("CLINT", self.update)
         pass
@@ -1,66 +1,292 @@
 # Wikipedia
 #   https://en.wikipedia.org/wiki/8250_UART
 #   https://en.wikipedia.org/wiki/16550_UART
-from config import TTY_OUTPUT_ENABLED
 
 
 # Registers
 #   https://www.lammertbies.nl/comm/info/serial-uart
+#
+# 16550 UART (the 8250 with 16-byte FIFOs), driven by the "ns16550a" driver of the kernel (ttyS0). Registers:
+#   0 - RBR (read) / THR (write) - received / transmitted byte. DLL (divisor latch, low byte) when LCR.DLAB is set
+#   1 - IER - interrupt enable. DLM (divisor latch, high byte) when LCR.DLAB is set
+#   2 - IIR (read) - source of the interrupt / FCR (write) - FIFO control
+#   3 - LCR - line control (word length, parity, ... only stored). Bit 7 is DLAB
+#   4 - MCR - modem control. Bit 4 is the loopback mode
+#   5 - LSR - line status
+#   6 - MSR - modem status
+#   7 - SCR - scratch register
+#
+# Receiving: bytes come from the console (the same one that is used by the hvc0 console). The kernel doesn't have to
+# poll LSR, the UART raises its interrupt (through the PLIC) when there is data in the receive FIFO. The console is
+# checked for new input every UART_INPUT_CHECK_INTERVAL instructions and on every WFI, but only while the receive
+# interrupt is enabled (so nothing is taken from the console while ttyS0 isn't used).
+#
+# Transmitting: bytes go to the console right away, so the transmitter is always empty (LSR.THRE and LSR.TEMT are
+# always set) and the transmit FIFO never holds any data. After every transmitted byte the "THR empty" interrupt
+# becomes pending again, same as on a real UART when its FIFO drains.
+
+from collections import deque
+
+from config import UART_INTERRUPT_SOURCE, UART_INPUT_CHECK_INTERVAL
+
+FIFO_SIZE = 16
+
+# Bits of IER
+IER_RECEIVED_DATA = 0b0001
+IER_TRANSMITTER_EMPTY = 0b0010
+IER_LINE_STATUS = 0b0100
+IER_MODEM_STATUS = 0b1000
+
+# Values of IIR (bits 0-3), from the highest priority
+IIR_NO_INTERRUPT = 0b0001
+IIR_RECEIVED_DATA = 0b0100
+IIR_CHARACTER_TIMEOUT = 0b1100
+IIR_TRANSMITTER_EMPTY = 0b0010
+IIR_FIFOS_ENABLED = 0b11000000
+
+# Bits of LSR
+LSR_DATA_AVAILABLE = 0b00000001
+LSR_TRANSMIT_BUFFER_IS_EMPTY = 0b00100000
+LSR_TRANSMIT_LINE_IS_IDLE = 0b01000000
+
+# Bits of FCR
+FCR_ENABLE_FIFOS = 0b00000001
+FCR_CLEAR_RECEIVE_FIFO = 0b00000010
+
+LCR_DLAB = 0b10000000
+MCR_LOOPBACK = 0b00010000
+
+# Receive FIFO fill level that triggers the "received data" interrupt, selected by FCR bits 6-7
+RECEIVE_TRIGGER_LEVELS = (1, 4, 8, 14)
+
+# MSR: carrier, "data set ready" and "clear to send" - the other side of the line is always there and ready
+MSR_LINE_CONNECTED = 0b10110000
+
 
 class Device_UART_8250:
 
-    def __init__(self, logger):
+    def __init__(self, logger, registers, console, PLIC, event_scheduler):
         self.logger = logger
-        self.test_UART_input = "uname -a\13"
+        self.registers = registers
+        self.console = console
+        self.PLIC = PLIC
+        self.event_scheduler = event_scheduler
+
+        self.IER = 0
+        self.LCR = 0
+        self.MCR = 0
+        self.SCR = 0
+        self.divisor_latch = 0
+
+        self.FIFOs_enabled = False
+        self.receive_trigger_level = 1
+        self.receive_FIFO = deque()
+
+        # THR became empty, and the kernel didn't read IIR or write THR since then
+        self.transmitter_empty_interrupt_pending = False
+
+        # Last level of the interrupt line that was given to the PLIC
+        self.interrupt_line = False
         pass
 
+    STATE_FIELDS = ("IER", "LCR", "MCR", "SCR", "divisor_latch", "FIFOs_enabled", "receive_trigger_level",
+                    "transmitter_empty_interrupt_pending")
+
+    # Input waiting in the console is not a part of the state, but the bytes already in the receive FIFO are
+    def get_state(self):
+        state = {name: getattr(self, name) for name in self.STATE_FIELDS}
+        state["receive_FIFO"] = list(self.receive_FIFO)
+        return state
+
+    def set_state(self, state):
+        for name in self.STATE_FIELDS:
+            setattr(self, name, state[name])
+        self.receive_FIFO = deque(state["receive_FIFO"])
+
+        self.interrupt_line = False
+        self.update_interrupt()
+        if self.IER & IER_RECEIVED_DATA:
+            self.event_scheduler.schedule_event("UART", self.check_input)
+
     # Size in address space
     @staticmethod
     def get_mmio_size():
         return 8
 
-    def read_register(self, address):
-        self.logger.register_device_usage(f"[UART] Read at {address:08x}")
+    def get_receive_FIFO_size(self):
+        return FIFO_SIZE if self.FIFOs_enabled else 1
+
+    # Moves console input into the receive FIFO (in the loopback mode the UART receives only what it transmits)
+    def receive_console_input(self):
+        if self.MCR & MCR_LOOPBACK:
+            return
+        receive_FIFO_size = self.get_receive_FIFO_size()
+        while len(self.receive_FIFO) < receive_FIFO_size and self.console.has_input():
+            self.receive_FIFO.append(self.console.read_input())
+
+    # Called every UART_INPUT_CHECK_INTERVAL instructions while the receive interrupt is enabled, and by WFI
+    def check_input(self):
+        if self.IER & IER_RECEIVED_DATA == 0:
+            return
+
+        self.receive_console_input()
+        self.update_interrupt()
 
-        # TODO:
-        #   - add "if address == 0" for reading the RBR receiver buffer
-        #   - As a test, just add hardcoded "uname -a" triggered at specific instruction count
-        #     - this is also a nice excuse to play with py generators
-        #     - don't forget to tell Linux to read the RX (return 0x61 from reg 5)
+        check_at_instruction_no = self.registers.executed_instruction_counter + UART_INPUT_CHECK_INTERVAL
+        self.event_scheduler.schedule_event("UART", self.check_input, check_at_instruction_no)
 
-        # receiver buffer reg (RBR)
+    # Returns the bits 0-3 of IIR - the pending interrupt with the highest priority
+    def get_interrupt_identification(self):
+        if self.IER & IER_RECEIVED_DATA and self.receive_FIFO:
+            # Real UART raises the timeout interrupt when the data stays below the trigger level for 4 character
+            # times. Here the line is always idle after the received data, so the timeout is immediate
+            if len(self.receive_FIFO) >= self.receive_trigger_level:
+                return IIR_RECEIVED_DATA
+            return IIR_CHARACTER_TIMEOUT
+
+        if self.IER & IER_TRANSMITTER_EMPTY and self.transmitter_empty_interrupt_pending:
+            return IIR_TRANSMITTER_EMPTY
+
+        # Line status (no errors on the line) and modem status (it never changes) interrupts are never raised
+        return IIR_NO_INTERRUPT
+
+    def update_interrupt(self):
+        interrupt_line = self.get_interrupt_identification() != IIR_NO_INTERRUPT
+        if interrupt_line != self.interrupt_line:
+            self.interrupt_line = interrupt_line
+            self.PLIC.set_interrupt_level(UART_INTERRUPT_SOURCE, interrupt_line)
+
+    def read_register(self, address):
+        self.logger.register_device_usage("[UART] Read at {:08x}", address)
+
+        # Receiver buffer register (RBR)
         if address == 0:
-            if len(self.test_UART_input) > 0 and self.logger.instruction_counter > 62740000:
-                char = self.test_UART_input[0]
-                self.test_UART_input = self.test_UART_input[1:] # remove sent char
-                return char
-            else:
-                return 0
+            if self.LCR & LCR_DLAB:
+                return self.divisor_latch & 0xFF
 
-        # Line Status Register (LSR)
-        if address == 5:
-            TRANSMIT_BUFFER_IS_EMPTY = 0b00100000
-            TRANSMIT_LINE_IS_IDLE = 0b01000000
-            DATA_AVAILABLE = 0b00000001
+            # LSR reports the data waiting in the console as received, so it's received when it's read
+            if not self.receive_FIFO:
+                self.receive_console_input()
+            value = self.receive_FIFO.popleft() if self.receive_FIFO else 0
+
+            self.update_interrupt()
+            return value
+
+        # Interrupt enable register (IER)
+        if address == 1:
+            if self.LCR & LCR_DLAB:
+                return self.divisor_latch >> 8
+            return self.IER
 
-            retVal = TRANSMIT_BUFFER_IS_EMPTY + TRANSMIT_LINE_IS_IDLE
+        # Interrupt identification register (IIR)
+        if address == 2:
+            interrupt_identification = self.get_interrupt_identification()
 
-            if len(self.test_UART_input) > 0 and self.logger.instruction_counter > 62740000:
-                retVal += DATA_AVAILABLE
+            # Reading IIR acknowledges the "THR empty" interrupt
+            if interrupt_identification == IIR_TRANSMITTER_EMPTY:
+                self.transmitter_empty_interrupt_pending = False
+                self.update_interrupt()
 
+            if self.FIFOs_enabled:
+                return interrupt_identification | IIR_FIFOS_ENABLED
+            return interrupt_identification
+
+        if address == 3:
+            return self.LCR
+
+        if address == 4:
+            return self.MCR
+
+        # Line Status Register (LSR)
+        if address == 5:
             # If software asks about status, we always tell that TX line is ready for transmission
+            retVal = LSR_TRANSMIT_BUFFER_IS_EMPTY + LSR_TRANSMIT_LINE_IS_IDLE
+
+            # Without the receive interrupt, the console isn't moved into the FIFO until RBR is read, so a kernel that
+            # only polls (early console) doesn't take the input of the hvc0 console
+            if self.receive_FIFO or (self.MCR & MCR_LOOPBACK == 0 and self.console.has_input()):
+                retVal += LSR_DATA_AVAILABLE
+
             return retVal
 
+        # Modem Status Register (MSR)
+        if address == 6:
+            if self.MCR & MCR_LOOPBACK:
+                # Outputs of MCR are connected to the inputs of MSR: DTR -> DSR, RTS -> CTS, OUT1 -> RI, OUT2 -> DCD
+                return ((self.MCR & 0b0001) << 5) | ((self.MCR & 0b0010) << 3) | ((self.MCR & 0b0100) << 4) \
+                    | ((self.MCR & 0b1000) << 4)
+            return MSR_LINE_CONNECTED
+
+        if address == 7:
+            return self.SCR
+
         return 0
 
     def write_register(self, address, value):
-        self.logger.register_device_usage(f"[UART] Write at {address:08x}: {value:08x}")
+        self.logger.register_device_usage("[UART] Write at {:08x}: {:08x}", address, value)
 
-        # transmitter buffer register - THR (if DLAB=0 which we don't check)
+        # Transmitter holding register (THR)
         # Everything that is put into this register should be outputted by UART as data
-        if address == 0 and TTY_OUTPUT_ENABLED:
-            char = chr(value)  # Convert value to ASCII character
-            print(char, end='')
-            pass
+        if address == 0:
+            if self.LCR & LCR_DLAB:
+                self.divisor_latch = (self.divisor_latch & 0xFF00) | value
+                return
+
+            if self.MCR & MCR_LOOPBACK:
+                if len(self.receive_FIFO) < self.get_receive_FIFO_size():
+                    self.receive_FIFO.append(value)
+            else:
+                self.console.write_output(value)
+
+            # Byte is transmitted immediately, THR is empty again
+            self.transmitter_empty_interrupt_pending = True
+            self.update_interrupt()
+
+        # Interrupt enable register (IER)
+        elif address == 1:
+            if self.LCR & LCR_DLAB:
+                self.divisor_latch = (self.divisor_latch & 0x00FF) | (value << 8)
+                return
+
+            changed_bits = self.IER ^ value
+            self.IER = value & 0x0F
+
+            # Enabling the "THR empty" interrupt while THR is empty raises it right away
+            if changed_bits & IER_TRANSMITTER_EMPTY:
+                self.transmitter_empty_interrupt_pending = bool(self.IER & IER_TRANSMITTER_EMPTY)
+
+            if changed_bits & IER_RECEIVED_DATA:
+                if self.IER & IER_RECEIVED_DATA:
+                    self.event_scheduler.schedule_event("UART", self.check_input)
+                else:
+                    self.event_scheduler.cancel_event("UART")
+
+            self.update_interrupt()
+
+        # FIFO control register (FCR)
+        elif address == 2:
+            FIFOs_enabled = bool(value & FCR_ENABLE_FIFOS)
+
+            # Enabling or disabling FIFOs clears them
+            if FIFOs_enabled != self.FIFOs_enabled or value & FCR_CLEAR_RECEIVE_FIFO:
+                self.receive_FIFO.clear()
+
+            self.FIFOs_enabled = FIFOs_enabled
+            self.receive_trigger_level = RECEIVE_TRIGGER_LEVELS[value >> 6]
+            self.update_interrupt()
+
+        elif address == 3:
+            self.LCR = value
+
+        elif address == 4:
+            self.MCR = value & 0x1F
+
+        elif address == 7:
+            self.SCR = value
 
         pass
+
+
+if __name__ == '__main__':
+    print(f"\nExecuting:\n\t{__file__} \n")
+    print("Hopefully here we will have tests for functions in this file")
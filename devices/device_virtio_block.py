@@ -0,0 +1,363 @@
+
+# Block device (disk) with the virtio-mmio interface
+#
+#   Specification: https://docs.oasis-open.org/virtio/virtio/v1.2/virtio-v1.2.html
+#     - 4.2   "Virtio Over MMIO" (registers, version 2 - the "modern" interface)
+#     - 2.7   "Split Virtqueues" (how requests are passed between the driver and the device)
+#     - 5.2   "Block Device"
+#
+# Disk is a file (VIRTIO_BLOCK_IMAGE_PATH) that is memory mapped on the host. The data of a request is copied between
+# guest RAM and the mapping with one slice assignment per buffer (see Address_Space.read_RAM_block/write_RAM_block),
+# so the guest reads and writes the disk at the speed of memcpy. The OS writes the changed pages into the file.
+#
+# Driver passes requests through one virtqueue (queue 0), which consists of three tables in guest RAM:
+#   descriptor table - buffers (address, length, flags, index of the next descriptor of the same request)
+#   available ring   - driver puts the first descriptor of every new request here, and increments its index
+#   used ring        - device puts the finished requests here, and increments its index
+# Request is a chain of descriptors: 16-byte header (type, sector), data buffers, and a 1-byte status at the end.
+#
+# Driver writes the queue number into QueueNotify when it adds requests. They are done right away, during that write,
+# then the device raises its interrupt (through the PLIC) until the driver acknowledges it in InterruptACK.
+#
+# All registers are 32-bit, and the driver must access them as 32-bit values. The address space accesses the devices
+# byte by byte (from the lowest address), so a write takes effect when its highest byte is written.
+
+import mmap
+import os
+from struct import Struct
+
+from config import VIRTIO_BLOCK_INTERRUPT_SOURCE
+
+MAGIC_VALUE = 0x74726976  # "virt"
+VERSION = 2
+DEVICE_ID_BLOCK = 2
+VENDOR_ID = 0             # Not used by Linux
+
+# Features (bits of DeviceFeatures/DriverFeatures)
+VIRTIO_BLK_F_RO = 1 << 5
+VIRTIO_BLK_F_FLUSH = 1 << 9
+VIRTIO_F_VERSION_1 = 1 << 32
+
+# Registers
+REGISTER_MAGIC_VALUE = 0x000
+REGISTER_VERSION = 0x004
+REGISTER_DEVICE_ID = 0x008
+REGISTER_VENDOR_ID = 0x00C
+REGISTER_DEVICE_FEATURES = 0x010
+REGISTER_DEVICE_FEATURES_SEL = 0x014
+REGISTER_DRIVER_FEATURES = 0x020
+REGISTER_DRIVER_FEATURES_SEL = 0x024
+REGISTER_QUEUE_SEL = 0x030
+REGISTER_QUEUE_NUM_MAX = 0x034
+REGISTER_QUEUE_NUM = 0x038
+REGISTER_QUEUE_READY = 0x044
+REGISTER_QUEUE_NOTIFY = 0x050
+REGISTER_INTERRUPT_STATUS = 0x060
+REGISTER_INTERRUPT_ACK = 0x064
+REGISTER_STATUS = 0x070
+REGISTER_QUEUE_DESC_LOW = 0x080
+REGISTER_QUEUE_DESC_HIGH = 0x084
+REGISTER_QUEUE_DRIVER_LOW = 0x090
+REGISTER_QUEUE_DRIVER_HIGH = 0x094
+REGISTER_QUEUE_DEVICE_LOW = 0x0A0
+REGISTER_QUEUE_DEVICE_HIGH = 0x0A4
+REGISTER_CONFIG_GENERATION = 0x0FC
+CONFIG_SPACE = 0x100
+
+# Size of the registers in the address space (as in the device tree, the usual size of a virtio-mmio device)
+VIRTIO_MMIO_SIZE = 0x1000
+
+# Configuration space (struct virtio_blk_config) starts at CONFIG_SPACE. Only "capacity" (number of sectors, the first
+# 8 bytes) is used with the features above, the rest reads as zeros
+CAPACITY_SIZE = 8
+
+# Maximal number of requests in the queue (must be a power of 2)
+QUEUE_NUM_MAX = 128
+
+SECTOR_SIZE = 512
+
+# Flags of descriptors
+VIRTQ_DESC_F_NEXT = 1
+VIRTQ_DESC_F_WRITE = 2
+
+# Flag of the available ring: driver doesn't want an interrupt for the used requests
+VIRTQ_AVAIL_F_NO_INTERRUPT = 1
+
+# Bit of InterruptStatus: used ring was updated
+INTERRUPT_USED_BUFFER = 1
+
+# Request types and statuses
+VIRTIO_BLK_T_IN = 0
+VIRTIO_BLK_T_OUT = 1
+VIRTIO_BLK_T_FLUSH = 4
+VIRTIO_BLK_S_OK = 0
+VIRTIO_BLK_S_IOERR = 1
+VIRTIO_BLK_S_UNSUPP = 2
+
+# Little endian structures in guest RAM
+DESCRIPTOR = Struct('<QIHH')     # address, length, flags, next
+REQUEST_HEADER = Struct('<IIQ')  # type, reserved, sector
+RING_INDEX = Struct('<H')
+USED_ELEMENT = Struct('<II')     # index of the first descriptor, number of bytes written into the buffers
+
+
+class Device_Virtio_Block:
+
+    def __init__(self, logger, address_space, PLIC, image_path, read_only):
+        self.logger = logger
+        self.address_space = address_space
+        self.PLIC = PLIC
+        self.read_only = read_only
+
+        # Whole image is mapped, the guest sees only whole sectors of it
+        with open(image_path, 'rb' if read_only else 'r+b') as file:
+            size = os.fstat(file.fileno()).st_size
+            if size < SECTOR_SIZE:
+                raise Exception(f"Virtio block: disk image '{image_path}' must have at least {SECTOR_SIZE} bytes")
+            self.image = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ if read_only else mmap.ACCESS_WRITE)
+        self.capacity = size // SECTOR_SIZE
+
+        self.device_features = VIRTIO_F_VERSION_1 | VIRTIO_BLK_F_FLUSH
+        if read_only:
+            self.device_features |= VIRTIO_BLK_F_RO
+
+        # Bytes of the register that is being written
+        self.write_value = 0
+
+        self.reset()
+        pass
+
+    # Writing 0 into Status resets the device
+    def reset(self):
+        self.status = 0
+        self.device_features_sel = 0
+        self.driver_features = 0
+        self.driver_features_sel = 0
+        self.interrupt_status = 0
+
+        # Only queue 0 exists. QueueNumMax of the others reads as 0, which tells the driver that they don't exist
+        self.queue_selected = 0
+        self.queue_num = QUEUE_NUM_MAX
+        self.queue_ready = 0
+        self.queue_descriptor_table_address = 0
+        self.queue_available_ring_address = 0
+        self.queue_used_ring_address = 0
+
+        # Index (in the available ring) of the next request that will be done. It's also the index of the used ring,
+        # as all requests are done in the order they come
+        self.next_available_index = 0
+
+        self.update_interrupt()
+
+    STATE_FIELDS = ("status", "device_features_sel", "driver_features", "driver_features_sel", "interrupt_status",
+                    "queue_selected", "queue_num", "queue_ready", "queue_descriptor_table_address", "queue_available_ring_address",
+                    "queue_used_ring_address", "next_available_index", "write_value")
+
+    # Content of the disk is not a part of the state, it's in the image file
+    def get_state(self):
+        return {name: getattr(self, name) for name in self.STATE_FIELDS}
+
+    def set_state(self, state):
+        for name in self.STATE_FIELDS:
+            setattr(self, name, state[name])
+        self.update_interrupt()
+
+    # Size in address space
+    @staticmethod
+    def get_mmio_size():
+        return VIRTIO_MMIO_SIZE - 1
+
+    def update_interrupt(self):
+        self.PLIC.set_interrupt_level(VIRTIO_BLOCK_INTERRUPT_SOURCE, self.interrupt_status != 0)
+
+    def read_register(self, address):
+        register = address & ~3
+        byte_shift = (address & 3) * 8
+
+        if address >= CONFIG_SPACE:
+            # Capacity is a 64-bit value, the driver can read it with any access size
+            if address < CONFIG_SPACE + CAPACITY_SIZE:
+                return (self.capacity >> ((address - CONFIG_SPACE) * 8)) & 0xFF
+            return 0
+
+        if register == REGISTER_MAGIC_VALUE:
+            value = MAGIC_VALUE
+        elif register == REGISTER_VERSION:
+            value = VERSION
+        elif register == REGISTER_DEVICE_ID:
+            value = DEVICE_ID_BLOCK
+        elif register == REGISTER_VENDOR_ID:
+            value = VENDOR_ID
+        elif register == REGISTER_DEVICE_FEATURES:
+            value = (self.device_features >> (32 * self.device_features_sel)) & 0xFFFFFFFF
+        elif register == REGISTER_QUEUE_NUM_MAX:
+            value = QUEUE_NUM_MAX if self.queue_selected == 0 else 0
+        elif register == REGISTER_QUEUE_READY:
+            value = self.queue_ready if self.queue_selected == 0 else 0
+        elif register == REGISTER_INTERRUPT_STATUS:
+            value = self.interrupt_status
+        elif register == REGISTER_STATUS:
+            value = self.status
+        elif register == REGISTER_CONFIG_GENERATION:
+            value = 0
+        else:
+            # Write-only registers and registers of a queue that doesn't exist
+            value = 0
+
+        return (value >> byte_shift) & 0xFF
+
+    def write_register(self, address, value):
+        if address >= CONFIG_SPACE:
+            return  # Configuration space is read only
+
+        byte_shift = (address & 3) * 8
+        self.write_value = (self.write_value & ~(0xFF << byte_shift)) | (value << byte_shift)
+        if byte_shift == 24:
+            self.write_word(address & ~3, self.write_value)
+
+    def write_word(self, register, value):
+        self.logger.register_device_usage("[VIRTIO_BLOCK] Write at {:08x}: {:08x}", register, value)
+
+        if register == REGISTER_DEVICE_FEATURES_SEL:
+            self.device_features_sel = value
+        elif register == REGISTER_DRIVER_FEATURES:
+            if self.driver_features_sel < 2:
+                shift = 32 * self.driver_features_sel
+                self.driver_features = (self.driver_features & ~(0xFFFFFFFF << shift)) | (value << shift)
+        elif register == REGISTER_DRIVER_FEATURES_SEL:
+            self.driver_features_sel = value
+        elif register == REGISTER_QUEUE_SEL:
+            self.queue_selected = value
+        elif self.queue_selected != 0 and register in (REGISTER_QUEUE_NUM, REGISTER_QUEUE_READY, REGISTER_QUEUE_DESC_LOW,
+                                                       REGISTER_QUEUE_DRIVER_LOW, REGISTER_QUEUE_DEVICE_LOW):
+            pass
+        elif register == REGISTER_QUEUE_NUM:
+            self.queue_num = value
+        elif register == REGISTER_QUEUE_READY:
+            self.queue_ready = value & 1
+        elif register == REGISTER_QUEUE_NOTIFY:
+            if value == 0 and self.queue_ready:
+                self.process_requests()
+        elif register == REGISTER_INTERRUPT_ACK:
+            self.interrupt_status &= ~value
+            self.update_interrupt()
+        elif register == REGISTER_STATUS:
+            if value == 0:
+                self.reset()
+            else:
+                self.status = value
+        elif register == REGISTER_QUEUE_DESC_LOW:
+            self.queue_descriptor_table_address = value
+        elif register == REGISTER_QUEUE_DRIVER_LOW:
+            self.queue_available_ring_address = value
+        elif register == REGISTER_QUEUE_DEVICE_LOW:
+            self.queue_used_ring_address = value
+        elif register in (REGISTER_QUEUE_DESC_HIGH, REGISTER_QUEUE_DRIVER_HIGH, REGISTER_QUEUE_DEVICE_HIGH):
+            pass  # Addresses are 32-bit
+        else:
+            print(f"[ERROR] VIRTIO_BLOCK: Unknown/unimplemented register write attempt ({register:08x})")
+            raise Exception("VIRTIO_BLOCK: Unknown/unimplemented register write attempt")
+
+    # Does all requests that the driver added to the available ring since the last notification
+    def process_requests(self):
+        RAM = self.address_space.RAM
+        RAM_offset = self.address_space.get_RAM_offset
+
+        # Available ring: flags, index, ring of "queue_num" descriptor indexes
+        available_ring = self.queue_available_ring_address
+        available_flags, = RING_INDEX.unpack_from(RAM, RAM_offset(available_ring, 2))
+        available_index, = RING_INDEX.unpack_from(RAM, RAM_offset(available_ring + 2, 2))
+
+        used_ring = self.queue_used_ring_address
+        processed_requests = 0
+
+        while self.next_available_index != available_index:
+            ring_position = self.next_available_index % self.queue_num
+            first_descriptor, = RING_INDEX.unpack_from(RAM, RAM_offset(available_ring + 4 + 2 * ring_position, 2))
+
+            written_bytes = self.process_request(first_descriptor)
+
+            # Used ring: flags, index, ring of "queue_num" used elements
+            self.address_space.write_RAM_block(used_ring + 4 + 8 * ring_position,
+                                               USED_ELEMENT.pack(first_descriptor, written_bytes))
+            self.next_available_index = (self.next_available_index + 1) & 0xFFFF
+            processed_requests += 1
+
+        if processed_requests:
+            # Index is updated after the elements, the driver may look at it any time
+            self.address_space.write_RAM_block(used_ring + 2, RING_INDEX.pack(self.next_available_index))
+
+            if available_flags & VIRTQ_AVAIL_F_NO_INTERRUPT == 0:
+                self.interrupt_status |= INTERRUPT_USED_BUFFER
+                self.update_interrupt()
+
+    # Returns the number of bytes written into the buffers of the request (data read from the disk and the status)
+    def process_request(self, descriptor_index):
+        RAM = self.address_space.RAM
+        RAM_offset = self.address_space.get_RAM_offset
+
+        # Collect the chain: (address, length, device can write into it)
+        buffers = []
+        while True:
+            if len(buffers) == self.queue_num:
+                raise Exception("VIRTIO_BLOCK: Descriptor chain has a loop")
+            address, length, flags, next_index = DESCRIPTOR.unpack_from(
+                RAM, RAM_offset(self.queue_descriptor_table_address + DESCRIPTOR.size * descriptor_index, DESCRIPTOR.size))
+            buffers.append((address, length, flags & VIRTQ_DESC_F_WRITE != 0))
+            if flags & VIRTQ_DESC_F_NEXT == 0:
+                break
+            descriptor_index = next_index
+
+        # Header is the first buffer, the status is the last byte of the last buffer, data buffers are in between
+        header_address, header_length, _ = buffers[0]
+        status_address, status_length, status_writable = buffers[-1]
+        data_buffers = buffers[1:-1]
+        if len(buffers) < 2 or header_length < REQUEST_HEADER.size or status_length < 1 or not status_writable:
+            raise Exception("VIRTIO_BLOCK: Request doesn't have the expected layout (header, data, status)")
+
+        request_type, _, sector = REQUEST_HEADER.unpack_from(RAM, RAM_offset(header_address, REQUEST_HEADER.size))
+
+        status, data_bytes = self.transfer_data(request_type, sector, data_buffers)
+
+        self.address_space.write_RAM_block(status_address + status_length - 1, bytes([status]))
+        self.logger.register_device_usage("[VIRTIO_BLOCK] Request type {} sector {}: {} bytes, status {}",
+                                          request_type, sector, data_bytes, status)
+
+        if request_type == VIRTIO_BLK_T_IN:
+            return data_bytes + 1
+        return 1
+
+    # Returns (status, number of transferred bytes)
+    def transfer_data(self, request_type, sector, data_buffers):
+        if request_type == VIRTIO_BLK_T_FLUSH:
+            if not self.read_only:
+                self.image.flush()
+            return VIRTIO_BLK_S_OK, 0
+
+        if request_type not in (VIRTIO_BLK_T_IN, VIRTIO_BLK_T_OUT):
+            return VIRTIO_BLK_S_UNSUPP, 0
+
+        disk_offset = sector * SECTOR_SIZE
+        total_length = sum(length for address, length, writable in data_buffers)
+        if disk_offset + total_length > self.capacity * SECTOR_SIZE:
+            return VIRTIO_BLK_S_IOERR, 0
+        if request_type == VIRTIO_BLK_T_OUT and self.read_only:
+            return VIRTIO_BLK_S_IOERR, 0
+        for address, length, writable in data_buffers:
+            if not self.address_space.is_RAM_block(address, length):
+                return VIRTIO_BLK_S_IOERR, 0
+
+        with memoryview(self.image) as image_view:
+            for address, length, writable in data_buffers:
+                if request_type == VIRTIO_BLK_T_IN:
+                    self.address_space.write_RAM_block(address, image_view[disk_offset:disk_offset + length])
+                else:
+                    self.address_space.read_RAM_block(address, image_view[disk_offset:disk_offset + length])
+                disk_offset += length
+
+        return VIRTIO_BLK_S_OK, total_length
+
+
+if __name__ == '__main__':
+    print(f"\nExecuting:\n\t{__file__} \n")
+    print("Hopefully here we will have tests for functions in this file")
@@ -0,0 +1,88 @@
+# Headless automation of the guest's console, in the style of the "expect" tool. Script is a list of steps:
+#
+#   ("expect", text)           - run the CPU until the text shows up in the console output
+#   ("expect", text, timeout)  - same, but with a different timeout (number of executed instructions)
+#   ("send", text)             - type the text into the console
+#
+# For example:
+#   [("expect", "~ # "), ("send", "uname -a\r"), ("expect", "~ # ")]
+#
+# "expect" only searches the output that was printed after the text matched by the previous "expect", so the same
+# prompt can be expected again after every command. Input is sent only when the guest is really waiting for it,
+# no matter how long it takes to get there, and the emulation stops as soon as the script is done.
+
+# Number of instructions executed between two checks of the console output
+CONSOLE_CHECK_INTERVAL = 10000
+
+
+# Collects the guest's console output and looks for the expected texts in it
+class Console_expecter:
+
+    def __init__(self, console):
+        # Characters printed by the guest since the last search
+        self.new_output = []
+
+        # Output that was already searched, but not matched yet
+        self.unmatched_output = ""
+
+        console.output_listeners.append(self.new_output.append)
+
+    def get_unmatched_output(self):
+        if self.new_output:
+            self.unmatched_output += "".join(self.new_output)
+            self.new_output.clear()
+
+        return self.unmatched_output
+
+    # Returns the output up to and including the text, or None if the text isn't in the output (yet)
+    def search(self, text):
+        position = self.get_unmatched_output().find(text)
+        if position == -1:
+            return None
+
+        end = position + len(text)
+        matched_output = self.unmatched_output[:end]
+        self.unmatched_output = self.unmatched_output[end:]
+        return matched_output
+
+    # Runs the CPU until the text shows up in the output. Returns the output up to and including the text, or None if
+    # that doesn't happen in instruction_limit instructions.
+    #
+    # run_CPU_until(instruction_no) must run the CPU until the given number of instructions is executed (see main.py)
+    def expect(self, text, cpu, run_CPU_until, instruction_limit):
+        registers = cpu.registers
+        stop_at_instruction_no = registers.executed_instruction_counter + instruction_limit
+
+        while True:
+            matched_output = self.search(text)
+            if matched_output is not None:
+                return matched_output
+
+            if registers.executed_instruction_counter >= stop_at_instruction_no:
+                return None
+
+            run_CPU_until(registers.executed_instruction_counter + CONSOLE_CHECK_INTERVAL)
+
+
+def run_automation_script(script, cpu, console, run_CPU_until, default_timeout):
+    expecter = Console_expecter(console)
+
+    for step in script:
+        action, text = step[0], step[1]
+        timeout = step[2] if len(step) > 2 else default_timeout
+
+        if action == "expect":
+            if expecter.expect(text, cpu, run_CPU_until, timeout) is None:
+                print(f"\n [EMULATOR] Automation: '{text}' didn't show up in {timeout} instructions")
+                raise Exception("Automation: timeout")
+        elif action == "send":
+            console.send_input(text)
+        else:
+            raise Exception(f"Automation: unknown step '{action}'")
+
+    print(f"\n [EMULATOR] Automation: script finished at instruction no. {cpu.registers.executed_instruction_counter}")
+
+
+if __name__ == '__main__':
+    print(f"\nExecuting:\n\t{__file__} \n")
+    print("Hopefully here we will have tests for functions in this file")
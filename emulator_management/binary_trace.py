@@ -0,0 +1,302 @@
+import lzma
+import sys
+import zlib
+from array import array
+from collections import Counter, deque
+from struct import Struct
+
+from config import LINKER_MAP_FILE_PATH
+from cpu.instruction_executer import decode_instruction, format_executed_instruction
+from emulator_management.symbol_index import Symbol_index
+
+# NumPy is needed only for the analysis of big traces, the emulator itself never uses it
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Binary trace of the executed instructions (ReportType.BINARY_TRACE). Text reports (SHORT_REPORT, LONG_REPORT, ...)
+# format and print every instruction, which makes them slower than the emulation itself. Here every executed
+# instruction is just a fixed-width record:
+#   number      - number of instructions executed before this one (registers.executed_instruction_counter), 64-bit
+#   pc          - address of the instruction
+#   instruction - value of the instruction
+#   rd_value    - value of the destination register after the instruction was executed. 0 for the instructions
+#                 without one (stores, branches) and for writes into x0
+#
+# Records are kept in columns, one array per field, so recording is only a few appends, and the reader can turn the
+# columns into NumPy arrays without any conversion. Columns are cut into chunks of BINARY_TRACE_CHUNK_SIZE records:
+#   - with BINARY_TRACE_RING_SIZE = None every chunk is compressed and written into the file right away, so the trace
+#     can be as long as the disk allows
+#   - with BINARY_TRACE_RING_SIZE = N only the chunks with the last N records are kept in memory (older chunks are
+#     dropped), and written into the file when the emulator exits. Useful for "what happened just before the crash"
+#
+# The block compiler writes the trace too: a compiled block appends the value of the destination register after each
+# of its instructions, and records the numbers, addresses and values of its instructions when it exits (they are
+# known at compile time). Records are the same as from the interpreter, only interrupts are taken between blocks.
+#
+# File: BINARY_TRACE_MAGIC, one byte with the compression (see COMPRESSION_IDS), then chunks:
+#   CHUNK_HEADER (number of records, size of the compressed data) + compressed columns, one after another,
+#   little endian
+#
+# Analysis (numbers of executed instructions per kernel function, listing of the records):
+#   python3 -m emulator_management.binary_trace <trace file> [functions [<count>] | list <first record> <count>]
+#
+# From Python, read_binary_trace() returns the columns (NumPy arrays if NumPy is installed), so the records can be
+# filtered with NumPy, and get_symbol_names() gives the kernel function of every record.
+
+BINARY_TRACE_MAGIC = b"RVTRACE1"
+CHUNK_HEADER = Struct('<II')
+
+# Compression -> id in the file header
+COMPRESSION_IDS = {None: 0, "zlib": 1, "lzma": 2}
+
+# Name and array type code of the columns, in the order in which they are stored in a chunk
+COLUMNS = (("number", 'Q'), ("pc", 'I'), ("instruction", 'I'), ("rd_value", 'I'))
+
+# Stores (opcode 0x23) and branches (opcode 0x63) have a part of the immediate value where other instructions have rd
+NO_DESTINATION_REGISTER_OPCODES = (0x23, 0x63)
+
+
+class Binary_trace:
+
+    def __init__(self, path, ring_size, compression, chunk_size, start_at_instruction_no, stop_at_instruction_no):
+        if compression not in COMPRESSION_IDS:
+            raise Exception(f"Binary trace: unknown compression '{compression}', use one of {list(COMPRESSION_IDS)}")
+
+        self.path = path
+        self.ring_size = ring_size
+        self.compression = compression
+        self.chunk_size = chunk_size
+
+        # Same range as for the text reports of the logger, which counts the instructions from 1. The interpreter is
+        # checked by the logger, the compiled blocks here (whole blocks in or out)
+        self.start_at_instruction_no = start_at_instruction_no
+        self.stop_at_instruction_no = stop_at_instruction_no
+
+        self.new_chunk()
+
+        # Destination register of the instruction recorded by record_instruction(), its value is recorded after the
+        # instruction is executed
+        self.registers = None
+        self.destination_register = 0
+
+        self.file = None
+        self.ring_chunks = None
+        if ring_size is None:
+            self.file = open(path, 'wb')
+            self.write_file_header(self.file)
+        else:
+            # Enough full chunks to hold the last ring_size records, plus the last (partial) chunk added by close()
+            self.ring_chunks = deque(maxlen=-(-ring_size // chunk_size) + 1)
+
+        self.recorded_instructions = 0
+
+    # Compiled blocks look up rd_values every time they run, so the columns can be simply replaced by new arrays
+    def new_chunk(self):
+        self.numbers = array('Q')
+        self.pcs = array('I')
+        self.instructions = array('I')
+        self.rd_values = array('I')
+
+    # Interpreter: called before the instruction is executed ...
+    def record_instruction(self, registers, instruction):
+        self.numbers.append(registers.executed_instruction_counter)
+        self.pcs.append(registers.instruction_pointer)
+        self.instructions.append(instruction)
+
+        self.registers = registers
+        if instruction & 0x7F in NO_DESTINATION_REGISTER_OPCODES:
+            self.destination_register = 0
+        else:
+            self.destination_register = (instruction >> 7) & 0x1F
+
+    # ... and this after it
+    def record_destination_value(self):
+        destination_register = self.destination_register
+        self.rd_values.append(self.registers.x[destination_register] if destination_register else 0)
+
+        if len(self.rd_values) >= self.chunk_size:
+            self.end_chunk()
+
+    # Compiled block: called when the block exits, after it executed its first executed_instructions instructions
+    # (and appended their rd values). number is the number of the first of them
+    def record_block(self, number, pc, instructions, executed_instructions):
+        if not self.start_at_instruction_no <= number + 1 <= self.stop_at_instruction_no:
+            del self.rd_values[len(self.rd_values) - executed_instructions:]
+            return
+
+        self.numbers.extend(range(number, number + executed_instructions))
+        self.pcs.extend(range(pc, pc + 4 * executed_instructions, 4))
+        self.instructions.extend(instructions[:executed_instructions])
+
+        if len(self.rd_values) >= self.chunk_size:
+            self.end_chunk()
+
+    def end_chunk(self):
+        columns = (self.numbers, self.pcs, self.instructions, self.rd_values)
+        self.new_chunk()
+
+        # The last instruction may have no rd value, if the emulator was stopped while executing it
+        record_count = min(len(column) for column in columns)
+        for column in columns:
+            del column[record_count:]
+
+        if record_count == 0:
+            return
+        self.recorded_instructions += record_count
+
+        if self.file is not None:
+            self.write_chunk(self.file, columns)
+        else:
+            self.ring_chunks.append(columns)
+
+    # Writes the rest of the trace, called when the emulator exits
+    def close(self):
+        self.end_chunk()
+
+        if self.ring_chunks is not None:
+            # Chunks hold a bit more than ring_size records, the oldest ones are left out
+            records_to_skip = sum(len(columns[0]) for columns in self.ring_chunks) - self.ring_size
+            with open(self.path, 'wb') as file:
+                self.write_file_header(file)
+                for columns in self.ring_chunks:
+                    if records_to_skip >= len(columns[0]):
+                        records_to_skip -= len(columns[0])
+                        continue
+                    if records_to_skip > 0:
+                        for column in columns:
+                            del column[:records_to_skip]
+                        records_to_skip = 0
+                    self.write_chunk(file, columns)
+            self.recorded_instructions = min(self.recorded_instructions, self.ring_size)
+            self.ring_chunks.clear()
+        else:
+            self.file.close()
+
+        print(f" [EMULATOR] Binary trace: {self.recorded_instructions} instructions written to '{self.path}'")
+
+    def write_file_header(self, file):
+        file.write(BINARY_TRACE_MAGIC + bytes([COMPRESSION_IDS[self.compression]]))
+
+    def write_chunk(self, file, columns):
+        if sys.byteorder == 'big':
+            for column in columns:
+                column.byteswap()
+
+        data = b"".join(column.tobytes() for column in columns)
+
+        # Fastest settings, the trace is written while the emulator runs
+        if self.compression == "zlib":
+            data = zlib.compress(data, 1)
+        elif self.compression == "lzma":
+            data = lzma.compress(data, preset=0)
+
+        file.write(CHUNK_HEADER.pack(len(columns[0]), len(data)))
+        file.write(data)
+
+
+# Returns a dict: name of the column (see COLUMNS) -> NumPy array, or array.array if NumPy isn't installed
+def read_binary_trace(path):
+    chunks = {name: [] for name, type_code in COLUMNS}
+
+    with open(path, 'rb') as file:
+        header = file.read(len(BINARY_TRACE_MAGIC) + 1)
+        if header[:len(BINARY_TRACE_MAGIC)] != BINARY_TRACE_MAGIC:
+            raise Exception(f"Binary trace: '{path}' is not a binary trace")
+        compression = header[-1]
+
+        while True:
+            chunk_header = file.read(CHUNK_HEADER.size)
+            if len(chunk_header) < CHUNK_HEADER.size:
+                break
+            record_count, data_size = CHUNK_HEADER.unpack(chunk_header)
+
+            data = file.read(data_size)
+            if compression == COMPRESSION_IDS["zlib"]:
+                data = zlib.decompress(data)
+            elif compression == COMPRESSION_IDS["lzma"]:
+                data = lzma.decompress(data)
+
+            offset = 0
+            for name, type_code in COLUMNS:
+                column = array(type_code)
+                column_size = record_count * column.itemsize
+                column.frombytes(data[offset:offset + column_size])
+                offset += column_size
+                chunks[name].append(column)
+
+    columns = {}
+    for name, type_code in COLUMNS:
+        if numpy is not None:
+            dtype = numpy.dtype(type_code).newbyteorder('<')
+            columns[name] = numpy.concatenate([numpy.frombuffer(column, dtype=dtype) for column in chunks[name]]
+                                              or [numpy.zeros(0, dtype=dtype)])
+        else:
+            columns[name] = array(type_code)
+            for column in chunks[name]:
+                if sys.byteorder == 'big':
+                    column.byteswap()
+                columns[name].extend(column)
+    return columns
+
+
+# Returns the name of the kernel symbol (function) of every address, as a NumPy array of strings (if addresses is
+# a NumPy array) or as a list
+def get_symbol_names(addresses, symbols):
+    if not symbols.loaded:
+        symbols.load()
+
+    if numpy is not None and isinstance(addresses, numpy.ndarray):
+        # Addresses below the first symbol get the name of the first symbol, same as in get_symbol_name()
+        indices = numpy.searchsorted(numpy.array(symbols.addresses), addresses, side='right') - 1
+        return numpy.array(symbols.names)[numpy.maximum(indices, 0)]
+
+    return [symbols.find_symbol(address) for address in addresses]
+
+
+# Number of executed instructions per kernel function. Each distinct address is looked up only once
+def count_instructions_per_function(pcs, symbols):
+    if numpy is not None and isinstance(pcs, numpy.ndarray):
+        addresses, counts = numpy.unique(pcs, return_counts=True)
+    else:
+        address_counts = Counter(pcs)
+        addresses, counts = list(address_counts.keys()), list(address_counts.values())
+
+    function_counts = Counter()
+    for name, count in zip(get_symbol_names(addresses, symbols), counts):
+        function_counts[str(name)] += int(count)
+    return function_counts
+
+
+def print_functions(columns, symbols, top_count):
+    record_count = len(columns["pc"])
+    if record_count == 0:
+        print("Binary trace is empty")
+        return
+
+    print(f"{record_count} instructions, numbers {columns['number'][0]} - {columns['number'][-1]}")
+    print(f"    {'Function':<40} {'Instructions':>12} {'Share':>8}")
+    for name, count in count_instructions_per_function(columns["pc"], symbols).most_common(top_count):
+        print(f"    {name:<40} {count:>12} {100 * count / record_count:>7.2f}%")
+
+
+# Same format as ReportType.SHORT_REPORT, plus the value of the destination register
+def print_records(columns, symbols, first_record, record_count):
+    for index in range(first_record, min(first_record + record_count, len(columns["pc"]))):
+        pc = int(columns["pc"][index])
+        instruction = int(columns["instruction"][index])
+        message = format_executed_instruction(*decode_instruction(instruction))
+        print(f"({columns['number'][index]})  PC: {pc:08x} [{instruction:08x}]   -> {message}"
+              f"   rd = {int(columns['rd_value'][index]):08x}   [{symbols.find_symbol(pc)}()]")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 2 or (len(sys.argv) in (3, 4) and sys.argv[2] == "functions"):
+        print_functions(read_binary_trace(sys.argv[1]), Symbol_index(LINKER_MAP_FILE_PATH),
+                        int(sys.argv[3]) if len(sys.argv) == 4 else 25)
+    elif len(sys.argv) == 5 and sys.argv[2] == "list":
+        print_records(read_binary_trace(sys.argv[1]), Symbol_index(LINKER_MAP_FILE_PATH), int(sys.argv[3]),
+                      int(sys.argv[4]))
+    else:
+        print(f"Usage:\n\tpython3 -m emulator_management.binary_trace <trace file> [functions [<count>] | list <first record> <count>]")
@@ -0,0 +1,211 @@
+import os
+import queue
+import sys
+import threading
+from collections import deque
+from time import monotonic
+
+from config import TTY_OUTPUT_ENABLED, CONSOLE_OUTPUT_BUFFER_SIZE, CONSOLE_OUTPUT_FLUSH_INTERVAL, \
+    CONSOLE_INPUT_CHUNK_SIZE, CONSOLE_INPUT_MAX_CHUNKS
+from utils.read_keyboard import read_key_blocking
+
+# Value returned to the guest when there is no input character
+NO_INPUT = 0xffffffff
+
+
+# Connects the consoles of the emulated machine (Xen hvc0 console implemented by CSR registers, UART) with the host.
+#
+# Output of the guest is printed to the terminal (if enabled) and passed to every output listener, so other parts of
+# the emulator (fork server, automation, ...) can see what the guest prints. Printing every character separately
+# would be one write syscall per character, so the output is buffered (see CONSOLE_OUTPUT_BUFFER_SIZE).
+#
+# Input comes first from the input queue (text sent by the emulator itself), then from the input stream (file, pipe
+# or stdin, see Input_stream), and then from the keyboard (if enabled). The guest polls for input all the time, so
+# the keyboard isn't checked on every poll. A background thread waits for the keys and puts them into the keyboard
+# queue, and a poll only checks if that queue is empty
+class Console:
+
+    def __init__(self):
+        self.tty_output_enabled = TTY_OUTPUT_ENABLED
+        self.keyboard_input_enabled = True
+
+        # Characters waiting to be read by the guest
+        self.input_queue = deque()
+
+        # Set by open_input_stream()
+        self.input_stream = None
+
+        # Keys pressed on the keyboard, filled by the keyboard thread. Keys are moved into the input queue only while
+        # the keyboard input is enabled
+        self.keyboard_queue = deque()
+        self.keyboard_thread = None
+
+        # Set by the keyboard thread and the input stream thread, when they get new input
+        self.input_arrived = threading.Event()
+
+        # Functions that are called with every character the guest outputs
+        self.output_listeners = []
+
+        # Characters waiting to be printed, and the time when the oldest of them was buffered
+        self.output_buffer = []
+        self.output_buffered_at = 0
+
+    # Can be called from other threads (console server)
+    def send_input(self, text):
+        self.input_queue.extend(text)
+        self.input_arrived.set()
+
+    # Path of a file or a named pipe, or "-" for stdin. Keyboard reads stdin too, so it's disabled for "-"
+    def open_input_stream(self, path):
+        if path == "-":
+            self.keyboard_input_enabled = False
+            self.input_stream = Input_stream(sys.stdin.fileno(), self.input_arrived)
+        else:
+            self.input_stream = Input_stream(os.open(path, os.O_RDONLY | getattr(os, 'O_BINARY', 0)), self.input_arrived)
+
+    def has_input(self):
+        # Guest polls for input also when it waits for the user, so it's a good moment to print the rest of the output
+        if self.output_buffer and monotonic() - self.output_buffered_at >= CONSOLE_OUTPUT_FLUSH_INTERVAL:
+            self.flush_output()
+
+        if self.input_queue:
+            return True
+
+        if self.input_stream is not None and self.input_stream.has_data():
+            return True
+
+        # Key pressed on the keyboard is moved into the input queue, so it can be checked without being consumed
+        if self.keyboard_input_enabled:
+            if self.keyboard_thread is None:
+                self.start_keyboard_thread()
+            if self.keyboard_queue:
+                self.input_queue.append(self.keyboard_queue.popleft())
+
+        return len(self.input_queue) > 0
+
+    # Thread is started when the guest polls for input for the first time, so there is no thread when the keyboard
+    # input is disabled from the start (automation, benchmarks, ...). It's a daemon thread, it doesn't keep the
+    # emulator running when the main thread ends
+    def start_keyboard_thread(self):
+        self.keyboard_thread = threading.Thread(target=self.read_keyboard, name="Console keyboard", daemon=True)
+        self.keyboard_thread.start()
+
+    def read_keyboard(self):
+        while True:
+            key = read_key_blocking()
+            if key is None:
+                # End of input (stdin is not a terminal and has no more data)
+                return
+
+            self.keyboard_queue.append(chr(key))
+            self.input_arrived.set()
+
+    # Blocks until there is input, or until the timeout (in seconds)
+    def wait_for_input(self, timeout):
+        # Nothing is printed while the emulator sleeps
+        self.flush_output()
+
+        # Cleared before the check, so input that comes right after the check still ends the wait
+        self.input_arrived.clear()
+        if self.has_input():
+            return
+
+        self.input_arrived.wait(timeout)
+
+    # Returns the character code, or NO_INPUT
+    def read_input(self):
+        if self.has_input():
+            if self.input_queue:
+                return ord(self.input_queue.popleft())
+            return self.input_stream.read_byte()
+
+        return NO_INPUT
+
+    def write_output(self, value):
+        char = chr(value)  # Convert value to ASCII character
+
+        if self.tty_output_enabled:
+            if not self.output_buffer:
+                self.output_buffered_at = monotonic()
+            self.output_buffer.append(char)
+
+            if char == '\n' or len(self.output_buffer) >= CONSOLE_OUTPUT_BUFFER_SIZE \
+                    or monotonic() - self.output_buffered_at >= CONSOLE_OUTPUT_FLUSH_INTERVAL:
+                self.flush_output()
+
+        for listener in self.output_listeners:
+            listener(char)
+
+    def flush_output(self):
+        if self.output_buffer:
+            sys.stdout.write(''.join(self.output_buffer))
+            sys.stdout.flush()
+            self.output_buffer.clear()
+
+
+# Streams bytes from a file descriptor (file, pipe, stdin) to the guest. A background thread reads the data in chunks
+# into a bounded queue, so reading never blocks the emulator (pipes and stdin can wait for data), and the data is
+# read only as fast as the guest takes it. When the queue is full the thread waits, and so does the program that
+# writes into the pipe. The guest sees data only when there is some (UART's LSR data ready bit, hvc0 NO_INPUT), so
+# it can't be overrun.
+#
+# Guest reads one byte at a time from the current chunk, so the cost of a byte doesn't depend on the size of the input
+class Input_stream:
+
+    def __init__(self, file_descriptor, input_arrived):
+        self.file_descriptor = file_descriptor
+
+        # Event that is set when a new chunk is read (wakes up the idle emulator, see Console.wait_for_input)
+        self.input_arrived = input_arrived
+
+        # Chunks of bytes waiting for the guest, None marks the end of the stream
+        self.chunks = queue.Queue(maxsize=CONSOLE_INPUT_MAX_CHUNKS)
+
+        # Chunk that is being read by the guest
+        self.chunk = b""
+        self.position = 0
+        self.finished = False
+
+        self.thread = threading.Thread(target=self.read_chunks, name="Console input stream", daemon=True)
+        self.thread.start()
+
+    def read_chunks(self):
+        while True:
+            # Returns what is available (pipes), at most one chunk. Empty result means the end of the stream
+            chunk = os.read(self.file_descriptor, CONSOLE_INPUT_CHUNK_SIZE)
+            if not chunk:
+                self.chunks.put(None)
+                return
+            self.chunks.put(chunk)
+            self.input_arrived.set()
+
+    def has_data(self):
+        if self.position < len(self.chunk):
+            return True
+
+        if self.finished:
+            return False
+
+        try:
+            chunk = self.chunks.get_nowait()
+        except queue.Empty:
+            return False
+
+        if chunk is None:
+            self.finished = True
+            return False
+
+        self.chunk = chunk
+        self.position = 0
+        return True
+
+    # Must be called only after has_data() returned True
+    def read_byte(self):
+        value = self.chunk[self.position]
+        self.position += 1
+        return value
+
+
+if __name__ == '__main__':
+    print(f"\nExecuting:\n\t{__file__} \n")
+    print("Hopefully here we will have tests for functions in this file")
@@ -0,0 +1,205 @@
+import asyncio
+import os
+import socket
+import sys
+import threading
+from collections import deque
+
+from config import CONSOLE_SERVER_ADDRESS, CONSOLE_SERVER_CLIENT_BUFFER_SIZE, CONSOLE_SERVER_HISTORY_SIZE, \
+    CONSOLE_SERVER_SEND_INTERVAL
+from utils.read_keyboard import read_key_blocking, tty_prepare, tty_release
+
+# Console server makes the console of the guest (hvc0 and UART) available on a local socket, so the emulator can run
+# headless and operators attach to it only when they need to, from any terminal:
+#   python3 -m emulator_management.console_server [address]
+#
+# Address is a path of a Unix socket, or (host, port) for TCP (use "127.0.0.1", the server has no authentication).
+#
+# Clients:
+#   - writer  - the first client that connects (when there is no writer). Its input goes to the guest
+#   - watcher - all other clients, they only see the output. Their input is ignored
+# Every client first gets the last CONSOLE_SERVER_HISTORY_SIZE bytes of the output, so it sees the current prompt.
+#
+# Server runs an asyncio event loop in its own thread. The CPU loop only appends the output of the guest into a queue
+# (see Console.output_listeners), and the server thread sends it to the clients every CONSOLE_SERVER_SEND_INTERVAL
+# seconds. Nothing in the CPU loop waits for the clients: if a client doesn't read its output fast enough and its
+# send buffer grows over CONSOLE_SERVER_CLIENT_BUFFER_SIZE, new output for that client is dropped (and the client is
+# told how much was dropped).
+
+
+class Console_client:
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.dropped_bytes = 0
+
+
+class Console_server:
+
+    def __init__(self, console, address):
+        self.console = console
+        self.address = address
+
+        # Characters printed by the guest, waiting to be sent to the clients. Filled by the CPU thread
+        self.pending_output = deque()
+
+        # Last part of the output, for newly connected clients
+        self.history = bytearray()
+
+        self.clients = []
+        self.writer_client = None
+
+        self.loop = None
+        self.start_error = None
+
+        console.output_listeners.append(self.pending_output.append)
+
+    # Returns when the server listens on its address
+    def start(self):
+        server_ready = threading.Event()
+        thread = threading.Thread(target=self.run_event_loop, args=(server_ready,), name="Console server", daemon=True)
+        thread.start()
+        server_ready.wait()
+
+        if self.start_error is not None:
+            raise Exception(f"Console server: can't listen on {self.address}: {self.start_error}")
+
+        print(f" [EMULATOR] Console server: listening on {self.address}")
+
+    def run_event_loop(self, server_ready):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+        try:
+            self.loop.run_until_complete(self.start_listening())
+        except OSError as error:
+            self.start_error = error
+            server_ready.set()
+            return
+
+        server_ready.set()
+        self.loop.call_soon(self.send_pending_output)
+        self.loop.run_forever()
+
+    async def start_listening(self):
+        if isinstance(self.address, str):
+            if os.path.exists(self.address):
+                os.unlink(self.address)
+            await asyncio.start_unix_server(self.handle_client, path=self.address)
+        else:
+            host, port = self.address
+            await asyncio.start_server(self.handle_client, host, port)
+
+    async def handle_client(self, reader, writer):
+        client = Console_client(writer)
+
+        if self.writer_client is None:
+            self.writer_client = client
+            role = "writer"
+        else:
+            role = "watcher (read-only)"
+
+        writer.write(f"[console server: attached as {role}]\r\n".encode())
+        writer.write(bytes(self.history))
+        self.clients.append(client)
+
+        try:
+            while True:
+                data = await reader.read(4096)
+                if not data:
+                    break
+                if client is self.writer_client:
+                    self.console.send_input(data.decode('latin-1'))
+        except ConnectionError:
+            pass
+        finally:
+            self.clients.remove(client)
+            if client is self.writer_client:
+                self.writer_client = None
+            writer.close()
+
+    # Runs in the server thread, every CONSOLE_SERVER_SEND_INTERVAL seconds
+    def send_pending_output(self):
+        if self.pending_output:
+            characters = []
+            while self.pending_output:
+                characters.append(self.pending_output.popleft())
+
+            # Guest outputs bytes, each of them was turned into one character
+            data = ''.join(characters).encode('latin-1')
+
+            self.history += data
+            del self.history[:-CONSOLE_SERVER_HISTORY_SIZE]
+
+            for client in self.clients:
+                self.send_to_client(client, data)
+
+        self.loop.call_later(CONSOLE_SERVER_SEND_INTERVAL, self.send_pending_output)
+
+    @staticmethod
+    def send_to_client(client, data):
+        transport = client.writer.transport
+        if transport.is_closing():
+            return
+
+        # Write never blocks, data is buffered by the transport. Bytes that don't fit into the client's buffer are
+        # dropped
+        if transport.get_write_buffer_size() + len(data) > CONSOLE_SERVER_CLIENT_BUFFER_SIZE:
+            client.dropped_bytes += len(data)
+            return
+
+        if client.dropped_bytes:
+            client.writer.write(f"\r\n[console server: {client.dropped_bytes} bytes of output dropped]\r\n".encode())
+            client.dropped_bytes = 0
+
+        client.writer.write(data)
+
+
+# Client for the terminal: keys go to the server, output of the server is printed. Ctrl+C ends the client
+def attach(address):
+    if isinstance(address, str):
+        client_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    else:
+        client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    client_socket.connect(address)
+
+    def send_keys():
+        while True:
+            key = read_key_blocking()
+            if key is None:
+                return
+            client_socket.sendall(bytes([key]))
+
+    tty_prepare()
+    try:
+        threading.Thread(target=send_keys, daemon=True).start()
+        while True:
+            data = client_socket.recv(4096)
+            if not data:
+                break
+            sys.stdout.buffer.write(data)
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        tty_release()
+        client_socket.close()
+
+
+# "host:port" for TCP, anything else is a path of a Unix socket
+def parse_address(text):
+    host, separator, port = text.rpartition(":")
+    if separator and port.isdigit():
+        return host, int(port)
+    return text
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2:
+        print(f"Usage:\n\tpython3 -m emulator_management.console_server [<socket path> | <host>:<port>]")
+    elif len(sys.argv) == 2:
+        attach(parse_address(sys.argv[1]))
+    elif CONSOLE_SERVER_ADDRESS is not None:
+        attach(CONSOLE_SERVER_ADDRESS)
+    else:
+        print("Console server: no address given, and CONSOLE_SERVER_ADDRESS is not set in config.py")
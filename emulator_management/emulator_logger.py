@@ -1,5 +1,12 @@
+from time import perf_counter_ns
+
 from config import LOGGER_PRINT_DEVICE_ACTIVITY, LOGGER_PRINT_CSR_REGISTER_ACTIVITY, EXIT_EMULATOR_AT_INSTRUCTION_NO, \
-    BREAKPOINT_AT_INSTRUCTION_NO, ReportType, LINKER_MAP_FILE_PATH
+    BREAKPOINT_AT_INSTRUCTION_NO, ReportType, LINKER_MAP_FILE_PATH, INSTRUCTION_MIX_REPORT_INTERVAL, BINARY_TRACE_PATH, \
+    BINARY_TRACE_RING_SIZE, BINARY_TRACE_COMPRESSION, BINARY_TRACE_CHUNK_SIZE
+from cpu.instruction_executer import format_executed_instruction
+from cpu.registers import CSR_REGISTER_NAMES
+from emulator_management.symbol_index import Symbol_index
+from emulator_management.binary_trace import Binary_trace
 
 
 class Emulator_logger:
@@ -11,30 +18,59 @@ class Emulator_logger:
         self.last_report_at_instruction_no = 0
         self.report_type = report_type
 
-        # Map file parsing
-        self.symbols = []
+        # Executed instructions are reported to the logger only if something is done with them. Otherwise the CPU
+        # doesn't even call register_executed_instruction()
+        self.instruction_events_enabled = report_type in (ReportType.SHORT_REPORT, ReportType.LONG_REPORT, ReportType.BINARY_TRACE) \
+            or EXIT_EMULATOR_AT_INSTRUCTION_NO is not None or BREAKPOINT_AT_INSTRUCTION_NO is not None
+
+        # Kernel symbols, the map file is parsed only when the first symbol is needed
+        self.symbols = Symbol_index(LINKER_MAP_FILE_PATH)
         self.last_instruction_address = None
 
+        # Instruction mix report (ReportType.INSTRUCTION_MIX_REPORT)
+        # Handler of the instruction -> [number of executions, host time spent in nanoseconds]
+        self.instruction_mix = {}
+        self.last_step_handler = None
+        self.last_step_time = 0
+
+        # Binary trace (ReportType.BINARY_TRACE), also written by the compiled blocks (see cpu/block_compiler.py)
+        self.binary_trace = None
+        if report_type == ReportType.BINARY_TRACE:
+            self.binary_trace = Binary_trace(BINARY_TRACE_PATH, BINARY_TRACE_RING_SIZE, BINARY_TRACE_COMPRESSION,
+                                             BINARY_TRACE_CHUNK_SIZE, start_traceout_at_instruction_no,
+                                             stop_traceout_at_instruction_no)
+
         print(" [EMULATOR] Kernel memory map file:", LINKER_MAP_FILE_PATH)
 
-        # TODO: Handle "no file" exception
-        with open(LINKER_MAP_FILE_PATH, 'r') as file:
-            file_content = file.read()
-            self.symbols = parse_linker_map_file(file_content)
-        pass
+    # Used by snapshots. Instruction counter of the logger gates some test inputs, so it must be restored too
+    def get_state(self):
+        return {"instruction_counter": self.instruction_counter,
+                "last_report_at_instruction_no": self.last_report_at_instruction_no}
+
+    def set_state(self, state):
+        self.instruction_counter = state["instruction_counter"]
+        self.last_report_at_instruction_no = state["last_report_at_instruction_no"]
 
-    def register_one_CPU_step(self, instruction_value, registers, CSR_registers, memory, trap_and_interrupt_handler):
+    def register_one_CPU_step(self, instruction_value, registers, CSR_registers, memory, trap_and_interrupt_handler, handler=None):
         self.instruction_counter += 1
 
         if self.report_type == ReportType.NONE:
             return
 
+        if self.report_type == ReportType.INSTRUCTION_MIX_REPORT:
+            self.register_instruction_mix(handler)
+            return
+
         if self.instruction_counter < self.start_traceout_at_instruction_no:
             return
 
         if self.instruction_counter > self.stop_traceout_at_instruction_no:
             return
 
+        if self.report_type == ReportType.BINARY_TRACE:
+            self.binary_trace.record_instruction(registers, instruction_value)
+            return
+
         self.last_instruction_address = registers.instruction_pointer
 
         if self.report_type == ReportType.SHORT_REPORT:
@@ -71,8 +107,61 @@ class Emulator_logger:
         else:
             pass
 
-    # TODO: Currently ordinary string is passed, should be replaced with something structured
-    def register_executed_instruction(self, message):
+    # Called by the block compiler engine after it executes a whole block of instructions. Compiled blocks are not
+    # traced instruction-by-instruction, only the progress report and the binary trace (written by the blocks
+    # themselves) are supported
+    def register_executed_block(self, instruction_count, registers):
+        self.instruction_counter += instruction_count
+
+        if EXIT_EMULATOR_AT_INSTRUCTION_NO is not None and self.instruction_counter >= EXIT_EMULATOR_AT_INSTRUCTION_NO:
+            print('[EMULATOR] Exited by emulator')
+            raise Exception("Exited by emulator")
+
+        if self.report_type == ReportType.ONLY_PROGRESS_REPORT:
+            if self.instruction_counter - self.last_report_at_instruction_no >= 250000:
+                self.last_report_at_instruction_no = self.instruction_counter
+                current_function = get_symbol_name(registers.instruction_pointer, self.symbols)
+                print(f" [EMULATOR] Executed {self.instruction_counter} instructions -> CPU executing: {current_function}")
+
+    # Host time between two CPU steps is attributed to the instruction of the previous step. That time includes also
+    # the timer and interrupt handling done between the instructions, but that is the same small overhead for every
+    # instruction
+    def register_instruction_mix(self, handler):
+        now = perf_counter_ns()
+
+        if self.last_step_handler is not None:
+            statistics = self.instruction_mix.get(self.last_step_handler)
+            if statistics is None:
+                statistics = [0, 0]
+                self.instruction_mix[self.last_step_handler] = statistics
+            statistics[0] += 1
+            statistics[1] += now - self.last_step_time
+
+        self.last_step_handler = handler
+
+        if self.instruction_counter - self.last_report_at_instruction_no >= INSTRUCTION_MIX_REPORT_INTERVAL:
+            self.last_report_at_instruction_no = self.instruction_counter
+            self.print_instruction_mix_report()
+
+        # Don't count the time spent on printing the report
+        self.last_step_time = perf_counter_ns()
+
+    def print_instruction_mix_report(self):
+        total_count = sum(count for count, time_ns in self.instruction_mix.values())
+        total_time_ns = sum(time_ns for count, time_ns in self.instruction_mix.values())
+
+        print(f"\n [EMULATOR] Instruction mix after {self.instruction_counter} instructions:")
+        print(f"    {'Instruction':<14} {'Count':>12} {'Share':>8} {'ns/instr.':>10} {'Time share':>11}")
+
+        for handler, (count, time_ns) in sorted(self.instruction_mix.items(), key=lambda item: item[1][0], reverse=True):
+            name = handler.__name__.replace("execute_", "")
+            print(f"    {name:<14} {count:>12} {100 * count / total_count:>7.2f}% {time_ns / count:>10.0f} {100 * time_ns / total_time_ns:>10.2f}%")
+
+        print(f"    {'Total':<14} {total_count:>12} {'':>8} {total_time_ns / total_count:>10.0f}\n")
+
+    # Instead of a ready-made message, CPU passes the handler and the operands of the executed instruction. These are
+    # turned into text only when the instruction is really printed out
+    def register_executed_instruction(self, handler, operands):
 
         if self.instruction_counter == EXIT_EMULATOR_AT_INSTRUCTION_NO:
             print('[EMULATOR] Exited by emulator')
@@ -94,49 +183,49 @@ class Emulator_logger:
         if self.instruction_counter > self.stop_traceout_at_instruction_no:
             return
 
-        if self.report_type == ReportType.SHORT_REPORT:
+        if self.report_type == ReportType.BINARY_TRACE:
+            self.binary_trace.record_destination_value()
+        elif self.report_type == ReportType.SHORT_REPORT:
+            message = format_executed_instruction(handler, operands)
             current_function = get_symbol_name(self.last_instruction_address, self.symbols)
             print(f"   -> {message}   \t\t  [{current_function}]")
         elif self.report_type == ReportType.LONG_REPORT:
+            message = format_executed_instruction(handler, operands)
             print(f"Executed instruction -> {message} \n")
         else:
             pass
         pass
 
-    def register_device_usage(self, message):
+    # Messages are passed as a format string + arguments (same as in python's "logging" module), so the message is
+    # formatted only if it's going to be printed
+    def register_device_usage(self, message_format, *arguments):
         if LOGGER_PRINT_DEVICE_ACTIVITY:
-            print(f"[{self.instruction_counter}] {message}")
+            print(f"[{self.instruction_counter}] {message_format.format(*arguments)}")
         pass
 
-    def register_CSR_register_usage(self, message):
+    def register_CSR_register_usage(self, message_format, *arguments):
         if LOGGER_PRINT_CSR_REGISTER_ACTIVITY:
-            print(f"[{self.instruction_counter}] {message}")
+            print(f"[{self.instruction_counter}] {message_format.format(*arguments)}")
 
+    def register_CSR_register_read(self, register_num, value):
+        if LOGGER_PRINT_CSR_REGISTER_ACTIVITY:
+            register_short_name, register_long_name = CSR_REGISTER_NAMES[register_num]
+            print(f"[{self.instruction_counter}] Read  CSR[0x{register_num:x}], old value = {value:08x} (register '{register_short_name}': {register_long_name})")
 
-# Parse a ".map" file generated by linker and return a list of tuples (address, symbol_name)
-def parse_linker_map_file(file_content):
-    symbols = []
-    for line in file_content.splitlines():
-        parts = line.split()
-        if len(parts) == 3:
-            address, _, symbol = parts
-            symbols.append((int(address, 16), symbol))
-    # Sorting the symbols by address
-    symbols.sort(key=lambda x: x[0])
-    return symbols
+    def register_CSR_register_write(self, register_num, new_value):
+        if LOGGER_PRINT_CSR_REGISTER_ACTIVITY:
+            register_short_name, register_long_name = CSR_REGISTER_NAMES[register_num]
+            print(f"[{self.instruction_counter}] Write CSR[0x{register_num:x}], new value = {new_value:08x} (register '{register_short_name}': {register_long_name})\n")
 
 
-# Find a symbol name for a given address and symbol list
+# Find a symbol name for a given address in the symbol index
 # NOTE: The function doesn't cover corner cases and may return incorrect symbol on edge cases
 def get_symbol_name(address, symbols):
-    closest_symbol = 'Error parsing symbol'
-    for symbol_address, symbol_name in symbols:
-        if symbol_address <= address:
-            closest_symbol = symbol_name
-        else:
-            break
+    closest_symbol = symbols.find_symbol(address)
 
-    if closest_symbol == '_end':
+    if closest_symbol is None:
+        closest_symbol = 'Error parsing symbol'
+    elif closest_symbol == '_end':
         closest_symbol = 'Address outside of the kernel'
     else:
         closest_symbol += "()"
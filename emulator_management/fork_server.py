@@ -0,0 +1,120 @@
+import os
+import signal
+import socket
+import sys
+
+from config import FORK_SERVER_SOCKET_PATH, FORK_SERVER_PROMPT, FORK_SERVER_BOOT_INSTRUCTION_LIMIT, \
+    FORK_SERVER_JOB_INSTRUCTION_LIMIT
+from emulator_management.automation import Console_expecter
+
+# Fork server boots Linux only once (or loads a snapshot), and then serves jobs (shell commands) received over a Unix
+# socket. Every job gets its own child process made with os.fork(). The child has a copy of the whole machine right
+# at the shell prompt, so it just types the command into the console, runs the CPU until the prompt shows up again,
+# sends the console output back to the client and exits.
+#
+# Child processes share the memory of the parent with copy-on-write, so a child only uses host memory for the
+# guest RAM pages it writes. Jobs run in parallel, one child per job.
+#
+# Protocol: client connects, sends the command and closes its side of the connection for writing (shutdown). The
+# server answers with the console output of the command (without the echoed command and the final prompt), and
+# closes the connection.
+#
+# Client:
+#   python3 -m emulator_management.fork_server "uname -a"
+
+
+def run_fork_server(cpu, console, run_CPU_until, resumed_from_snapshot=False):
+    if not hasattr(os, 'fork') or not hasattr(socket, 'AF_UNIX'):
+        raise Exception("Fork server: needs os.fork() and Unix sockets, which are not available on this system")
+
+    expecter = Console_expecter(console)
+
+    # Snapshot could have been saved with the prompt already printed, so ask the shell for a new one
+    if resumed_from_snapshot:
+        console.send_input("\n")
+
+    print(" [EMULATOR] Fork server: booting to the shell prompt...")
+    if expecter.expect(FORK_SERVER_PROMPT, cpu, run_CPU_until, FORK_SERVER_BOOT_INSTRUCTION_LIMIT) is None:
+        raise Exception("Fork server: shell prompt didn't show up")
+
+    # From now on the console is used only by the jobs. Buffered output must be printed first, otherwise every forked
+    # job would print it again
+    console.flush_output()
+    console.tty_output_enabled = False
+    console.keyboard_input_enabled = False
+
+    if os.path.exists(FORK_SERVER_SOCKET_PATH):
+        os.unlink(FORK_SERVER_SOCKET_PATH)
+
+    server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server_socket.bind(FORK_SERVER_SOCKET_PATH)
+    server_socket.listen()
+
+    # Finished children are reaped automatically by the OS
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+
+    print(f"\n [EMULATOR] Fork server: ready at instruction no. {cpu.registers.executed_instruction_counter},"
+          f" listening on '{FORK_SERVER_SOCKET_PATH}'")
+
+    while True:
+        connection, _ = server_socket.accept()
+
+        if os.fork() == 0:
+            # Child
+            exit_code = 0
+            try:
+                server_socket.close()
+                serve_job(connection, cpu, console, expecter, run_CPU_until)
+            except Exception as e:
+                print(f" [EMULATOR] Fork server: job failed: {e}", file=sys.stderr)
+                exit_code = 1
+            finally:
+                # Don't return into the parent's code (and don't run any of its cleanup)
+                os._exit(exit_code)
+
+        connection.close()
+
+
+def serve_job(connection, cpu, console, expecter, run_CPU_until):
+    command = receive_all(connection).decode().strip()
+
+    console.send_input(command + "\n")
+
+    output = expecter.expect(FORK_SERVER_PROMPT, cpu, run_CPU_until, FORK_SERVER_JOB_INSTRUCTION_LIMIT)
+    if output is not None:
+        output = output[:-len(FORK_SERVER_PROMPT)]
+    else:
+        output = expecter.get_unmatched_output()
+        output += f"\n [EMULATOR] Fork server: job didn't finish in {FORK_SERVER_JOB_INSTRUCTION_LIMIT} instructions\n"
+
+    # Shell echoes the command back, that line is not a part of the command's output
+    first_line, separator, rest = output.partition("\n")
+    if first_line.strip() == command:
+        output = rest
+
+    connection.sendall(output.encode())
+    connection.close()
+
+
+def receive_all(connection):
+    data = bytearray()
+    while True:
+        chunk = connection.recv(4096)
+        if not chunk:
+            return bytes(data)
+        data.extend(chunk)
+
+
+def send_job(command, socket_path=FORK_SERVER_SOCKET_PATH):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client_socket:
+        client_socket.connect(socket_path)
+        client_socket.sendall(command.encode())
+        client_socket.shutdown(socket.SHUT_WR)
+        return receive_all(client_socket).decode()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print(f"Usage:\n\tpython3 -m emulator_management.fork_server <command>")
+    else:
+        print(send_job(sys.argv[1]), end='')
@@ -0,0 +1,180 @@
+import signal
+from collections import Counter
+
+from config import START_ADDRESS_OF_RAM, RAM_SIZE
+from memory.address_space import WORD
+
+# Statistical profiler of the guest code. Every sample is the call stack of the guest at that moment: current PC
+# plus the return addresses found by walking the chain of frame pointers. Samples are only counted during the run,
+# they are turned into function names at the end, so the profiler costs almost nothing while the guest runs.
+#
+# Samples can be taken:
+#   - every N executed instructions (deterministic, the same run gives the same profile)
+#   - every N seconds of the host CPU time, with signal.setitimer() (no overhead between the samples, not on Windows)
+#
+# Output:
+#   - "folded stacks" file, one line per unique call stack: "outer_function;...;inner_function count". This is the
+#     input format of flame graph tools (https://github.com/brendangregg/FlameGraph, https://www.speedscope.app)
+#   - table of functions with the most samples
+#
+# The kernel is compiled with frame pointers. Every function (that calls other functions) saves the return address
+# at fp-4 and the frame pointer of its caller at fp-8, so the call stack is a linked list:
+#
+#   fp (s0) --> | ...                  |
+#               | return address (ra)  |  fp-4
+#               | previous fp          |  fp-8  --> frame of the caller
+#
+# Leaf functions don't save ra (it's still in the register), only the previous fp, which is then at fp-4. Same as
+# the kernel's own walk_stackframe(), we recognize that case by checking if the value at fp-4 looks like a frame
+# pointer (points higher into the same stack) or like a return address.
+
+# Kernel stacks are 8 KiB (THREAD_SIZE of rv32 Linux), frame pointers can't point outside of the current stack
+KERNEL_STACK_SIZE = 8 * 1024
+
+MAX_STACK_DEPTH = 64
+
+REGISTER_RA = 1
+REGISTER_SP = 2
+REGISTER_FP = 8
+
+
+class Guest_profiler:
+
+    def __init__(self, cpu, symbols):
+        self.cpu = cpu
+        self.RAM = cpu.memory.RAM
+
+        # Call stack (tuple of addresses, innermost first) -> number of samples
+        self.samples = Counter()
+
+        # Symbol_index of the kernel, used only at the end, when the samples are turned into function names
+        self.symbols = symbols
+
+        self.next_sample_at_instruction_no = 0
+
+    # Called when a sample is taken. It can be called at any moment (even from a signal handler), so it only reads
+    # the registers and RAM directly, without any side effects
+    def take_sample(self):
+        self.samples[self.get_call_stack()] += 1
+
+    def get_call_stack(self):
+        registers = self.cpu.registers
+        call_stack = [registers.instruction_pointer]
+
+        fp = registers.x[REGISTER_FP]
+        sp = registers.x[REGISTER_SP]
+
+        # Leaf function
+        if self.is_valid_frame_pointer(fp, sp):
+            value = self.read_word(fp - 4)
+            if self.is_valid_frame_pointer(value, fp):
+                call_stack.append(registers.x[REGISTER_RA] - 4)
+                sp, fp = fp, value
+
+        while len(call_stack) < MAX_STACK_DEPTH and self.is_valid_frame_pointer(fp, sp):
+            return_address = self.read_word(fp - 4)
+            if return_address == 0:
+                break
+
+            # Address of the call instruction, not of the instruction after it, which could already be in the next
+            # function (if the call is the last instruction of a function)
+            call_stack.append(return_address - 4)
+            sp, fp = fp, self.read_word(fp - 8)
+
+        return tuple(call_stack)
+
+    # Frames of the callers are higher in the stack, and the stack can't cross the KERNEL_STACK_SIZE boundary
+    @staticmethod
+    def is_valid_frame_pointer(fp, sp):
+        stack_top = (sp + KERNEL_STACK_SIZE - 1) & ~(KERNEL_STACK_SIZE - 1)
+        return fp & 0x7 == 0 and sp + 8 <= fp <= stack_top \
+            and START_ADDRESS_OF_RAM + 8 <= fp <= START_ADDRESS_OF_RAM + RAM_SIZE
+
+    def read_word(self, address):
+        return WORD.unpack_from(self.RAM, address - START_ADDRESS_OF_RAM)[0]
+
+    # Returns a replacement for run_CPU_until(instruction_no) which also takes a sample every sample_interval
+    # executed instructions
+    def add_sampling_by_instruction_count(self, run_CPU_until, sample_interval):
+        registers = self.cpu.registers
+        self.next_sample_at_instruction_no = registers.executed_instruction_counter + sample_interval
+
+        def run_CPU_until_with_sampling(stop_at_instruction_no=None):
+            while stop_at_instruction_no is None or registers.executed_instruction_counter < stop_at_instruction_no:
+                next_stop = self.next_sample_at_instruction_no
+                if stop_at_instruction_no is not None:
+                    next_stop = min(next_stop, stop_at_instruction_no)
+
+                run_CPU_until(next_stop)
+
+                if registers.executed_instruction_counter >= self.next_sample_at_instruction_no:
+                    self.take_sample()
+                    self.next_sample_at_instruction_no = registers.executed_instruction_counter + sample_interval
+
+        return run_CPU_until_with_sampling
+
+    # SIGPROF is sent every interval_seconds of CPU time used by the emulator. Python runs the handler in the main
+    # thread, between two bytecodes of whatever the emulator is doing at that moment
+    def start_sampling_by_host_timer(self, interval_seconds):
+        if not hasattr(signal, 'setitimer'):
+            raise Exception("Profiler: signal.setitimer() is not available on this system")
+
+        signal.signal(signal.SIGPROF, lambda signal_number, frame: self.take_sample())
+        signal.setitimer(signal.ITIMER_PROF, interval_seconds, interval_seconds)
+
+    def stop_sampling_by_host_timer(self):
+        if hasattr(signal, 'setitimer'):
+            signal.setitimer(signal.ITIMER_PROF, 0)
+
+    def get_function_name(self, address):
+        name = self.symbols.find_symbol(address)
+        if name is None:
+            return "[unknown]"
+        if name == "_end":
+            return "[outside of the kernel]"
+        return name
+
+    # Call stack -> number of samples, with addresses replaced by function names (outermost function first)
+    def get_function_call_stacks(self):
+        names = {}
+        function_call_stacks = Counter()
+
+        for call_stack, count in self.samples.items():
+            functions = []
+            for address in reversed(call_stack):
+                if address not in names:
+                    names[address] = self.get_function_name(address)
+                functions.append(names[address])
+            function_call_stacks[tuple(functions)] += count
+
+        return function_call_stacks
+
+    def write_folded_stacks(self, path):
+        with open(path, 'w') as file:
+            for functions, count in sorted(self.get_function_call_stacks().items()):
+                file.write(f"{';'.join(functions)} {count}\n")
+
+    # "Self" samples are the ones where the function was executing, "total" also counts the samples where it was
+    # somewhere in the call stack
+    def print_top_functions(self, count):
+        total_samples = sum(self.samples.values())
+        if total_samples == 0:
+            print("\n [EMULATOR] Profiler: no samples")
+            return
+
+        self_samples = Counter()
+        inclusive_samples = Counter()
+        for functions, samples in self.get_function_call_stacks().items():
+            self_samples[functions[-1]] += samples
+            for function in set(functions):
+                inclusive_samples[function] += samples
+
+        print(f"\n [EMULATOR] Profiler: {total_samples} samples, top {count} functions:")
+        print(f"    {'Self':>7} {'Total':>7}  Function")
+        for function, samples in self_samples.most_common(count):
+            print(f"    {100 * samples / total_samples:>6.2f}% {100 * inclusive_samples[function] / total_samples:>6.2f}%  {function}")
+
+
+if __name__ == '__main__':
+    print(f"\nExecuting:\n\t{__file__} \n")
+    print("Hopefully here we will have tests for functions in this file")
@@ -0,0 +1,193 @@
+import gzip
+import json
+import os
+import sys
+
+from config import START_ADDRESS_OF_RAM
+from cpu.instruction_cache import CODE_PAGE_SIZE_BITS
+from memory.RAM_memory import allocate_anonymous_memory
+
+# Snapshot of the whole emulated machine, so we can skip the (very long) Linux boot and continue from the moment
+# the snapshot was made
+#
+# Snapshot file is a gzip compressed stream of:
+#   - one line of JSON with the state of all components (CPU registers, CSR registers, devices, ...)
+#   - content of RAM
+#
+# There are two kinds of snapshots:
+#   - full snapshot contains the whole RAM
+#   - incremental (delta) snapshot contains only the pages of RAM that were written since the previous snapshot was
+#     saved or loaded. It points to that previous snapshot (its "parent"), which can again be an incremental
+#     snapshot. Loading walks the chain back to the full snapshot, and then applies the pages of every delta in order.
+#     State of the components is stored whole in every snapshot, it's small
+#
+# A chain of snapshots can be flattened into a single full snapshot with:
+#   python3 -m emulator_management.snapshot flatten <snapshot> <output>
+#
+# Every component of the machine implements:
+#   get_state()      - returns a dict with everything needed to restore the component (only JSON types)
+#   set_state(state) - restores the component from that dict
+
+SNAPSHOT_FORMAT_VERSION = 6
+
+# Level 1 is the fastest one, and RAM (mostly zeros) still compresses very well with it
+SNAPSHOT_COMPRESSION_LEVEL = 1
+
+# RAM is written/read in chunks, so we don't need another copy of the whole RAM in memory
+RAM_CHUNK_SIZE = 1024 * 1024
+
+# Incremental snapshots store RAM in pages of the same size as the dirty pages tracked by Address_Space
+SNAPSHOT_PAGE_SIZE_BITS = CODE_PAGE_SIZE_BITS
+SNAPSHOT_PAGE_SIZE = 1 << SNAPSHOT_PAGE_SIZE_BITS
+
+
+def save_snapshot(path, cpu):
+    state = get_machine_state(cpu)
+    write_snapshot(path, state, cpu.memory.RAM, None, None)
+
+    # Next incremental snapshot is relative to this one
+    cpu.memory.dirty_pages.clear()
+
+    print(f" [EMULATOR] Snapshot saved to '{path}' at instruction no. {cpu.registers.executed_instruction_counter}")
+
+
+# Saves only the pages of RAM that were written since the snapshot parent_path was saved or loaded. Caller must make
+# sure that parent_path really is the last snapshot that was saved/loaded
+def save_delta_snapshot(path, cpu, parent_path):
+    address_space = cpu.memory
+    first_RAM_page = START_ADDRESS_OF_RAM >> SNAPSHOT_PAGE_SIZE_BITS
+    RAM_pages = sorted(page_number - first_RAM_page for page_number in address_space.dirty_pages)
+
+    state = get_machine_state(cpu)
+    write_snapshot(path, state, address_space.RAM, RAM_pages, parent_path)
+
+    address_space.dirty_pages.clear()
+
+    print(f" [EMULATOR] Incremental snapshot ({len(RAM_pages)} pages) saved to '{path}' at instruction no."
+          f" {cpu.registers.executed_instruction_counter}")
+
+
+def load_snapshot(path, cpu):
+    address_space = cpu.memory
+    RAM = address_space.RAM
+
+    state = read_snapshot(path, RAM)
+
+    if set(state["devices"]) != set(address_space.devices):
+        raise Exception(f"Snapshot: snapshot was made with devices {sorted(state['devices'])}, but the machine has {sorted(address_space.devices)}")
+
+    cpu.registers.set_state(state["registers"])
+    cpu.CSR_registers.set_state(state["CSR_registers"])
+    cpu.trap_and_interrupt_handler.set_state(state["trap_and_interrupt_handler"])
+    cpu.logger.set_state(state["logger"])
+    for name, device in address_space.devices.items():
+        device.set_state(state["devices"][name])
+
+    # RAM was changed behind the back of the instruction cache
+    cpu.instruction_cache.invalidate_all()
+
+    # RAM is now the same as in the snapshot, so it can be the parent of the next incremental snapshot
+    address_space.dirty_pages.clear()
+
+    print(f" [EMULATOR] Snapshot loaded from '{path}', continuing from instruction no. {cpu.registers.executed_instruction_counter}")
+
+
+# Turns a chain of incremental snapshots into one full snapshot
+def flatten_snapshot(path, output_path):
+    RAM_size = get_snapshot_chain(path)[-1][1]["RAM_size"]
+    RAM = allocate_anonymous_memory(RAM_size)
+
+    state = read_snapshot(path, RAM)
+    write_snapshot(output_path, state, RAM, None, None)
+
+
+def get_machine_state(cpu):
+    address_space = cpu.memory
+
+    return {
+        "RAM_size": len(address_space.RAM),
+        "registers": cpu.registers.get_state(),
+        "CSR_registers": cpu.CSR_registers.get_state(),
+        "trap_and_interrupt_handler": cpu.trap_and_interrupt_handler.get_state(),
+        "logger": cpu.logger.get_state(),
+        "devices": {name: device.get_state() for name, device in address_space.devices.items()},
+    }
+
+
+# RAM_pages is None for a full snapshot, otherwise it's a list of page indexes (relative to the start of RAM)
+def write_snapshot(path, state, RAM, RAM_pages, parent_path):
+    header = dict(state, version=SNAPSHOT_FORMAT_VERSION, RAM_pages=RAM_pages, parent=None)
+
+    # Parent is stored relative to this snapshot, so the whole chain can be moved to another directory
+    if parent_path is not None:
+        header["parent"] = os.path.relpath(parent_path, os.path.dirname(os.path.abspath(path)))
+
+    with gzip.open(path, 'wb', compresslevel=SNAPSHOT_COMPRESSION_LEVEL) as file, memoryview(RAM) as RAM_view:
+        file.write(json.dumps(header).encode() + b"\n")
+
+        if RAM_pages is None:
+            for offset in range(0, len(RAM), RAM_CHUNK_SIZE):
+                file.write(RAM_view[offset:offset + RAM_CHUNK_SIZE])
+        else:
+            for page in RAM_pages:
+                offset = page << SNAPSHOT_PAGE_SIZE_BITS
+                file.write(RAM_view[offset:offset + SNAPSHOT_PAGE_SIZE])
+
+
+def read_snapshot_header(file):
+    header = json.loads(file.readline())
+
+    if header["version"] != SNAPSHOT_FORMAT_VERSION:
+        raise Exception(f"Snapshot: unsupported snapshot version {header['version']}")
+
+    return header
+
+
+# Returns a list of (path, header) from the full snapshot to the given one
+def get_snapshot_chain(path):
+    chain = []
+
+    while path is not None:
+        with gzip.open(path, 'rb') as file:
+            header = read_snapshot_header(file)
+        chain.append((path, header))
+
+        if header["parent"] is not None:
+            path = os.path.join(os.path.dirname(os.path.abspath(path)), header["parent"])
+        else:
+            path = None
+
+    chain.reverse()
+    return chain
+
+
+# Fills RAM from the whole chain of snapshots, and returns the state of the components from the last one
+def read_snapshot(path, RAM):
+    chain = get_snapshot_chain(path)
+
+    with memoryview(RAM) as RAM_view:
+        for snapshot_path, header in chain:
+            if header["RAM_size"] != len(RAM):
+                raise Exception(f"Snapshot: snapshot '{snapshot_path}' was made with {header['RAM_size']} bytes of RAM, but RAM_SIZE is {len(RAM)}")
+
+            with gzip.open(snapshot_path, 'rb') as file:
+                read_snapshot_header(file)
+
+                if header["RAM_pages"] is None:
+                    chunks = ((offset, RAM_CHUNK_SIZE) for offset in range(0, len(RAM), RAM_CHUNK_SIZE))
+                else:
+                    chunks = ((page << SNAPSHOT_PAGE_SIZE_BITS, SNAPSHOT_PAGE_SIZE) for page in header["RAM_pages"])
+
+                for offset, size in chunks:
+                    chunk = RAM_view[offset:offset + size]
+                    if file.readinto(chunk) != len(chunk):
+                        raise Exception(f"Snapshot: file '{snapshot_path}' is truncated")
+
+    return chain[-1][1]
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == "flatten":
+        flatten_snapshot(sys.argv[2], sys.argv[3])
+    else:
+        print(f"Usage:\n\tpython3 -m emulator_management.snapshot flatten <snapshot> <output>")
@@ -0,0 +1,75 @@
+from bisect import bisect_right
+
+# Finds the kernel symbol (function) that contains a given address, using the ".map" file generated by the linker
+# (System.map). Used by the logger for the symbolized trace and progress reports, and by the guest profiler.
+#
+# The map file is read only when the first address is looked up, so the emulator doesn't spend time on parsing it
+# when no report needs symbols.
+#
+# Lookup is a binary search over two parallel lists, addresses and names, sorted by address. Consecutive lookups are
+# usually from the same function (PCs of a traced basic block, progress reports inside a busy loop), so the address
+# range of the last found symbol is remembered and checked first.
+
+
+class Symbol_index:
+
+    def __init__(self, map_file_path):
+        self.map_file_path = map_file_path
+        self.loaded = False
+
+        self.addresses = []
+        self.names = []
+
+        # Last found symbol covers addresses last_hit_start <= address < last_hit_end
+        self.last_hit_start = 0
+        self.last_hit_end = 0
+        self.last_hit_name = None
+
+    def load(self):
+        self.loaded = True
+        try:
+            with open(self.map_file_path, 'r') as file:
+                symbols = parse_linker_map_file(file.read())
+        except OSError as error:
+            # Symbols are only used for reports, the emulator can run without them
+            print(f" [EMULATOR] Kernel memory map file can't be read, symbols won't be available: {error}")
+            symbols = []
+
+        self.addresses = [address for address, name in symbols]
+        self.names = [name for address, name in symbols]
+
+    # Returns the name of the last symbol at or below the address, or None if the address is below all of the symbols
+    def find_symbol(self, address):
+        if self.last_hit_start <= address < self.last_hit_end:
+            return self.last_hit_name
+
+        if not self.loaded:
+            self.load()
+
+        index = bisect_right(self.addresses, address) - 1
+        if index < 0:
+            return None
+
+        self.last_hit_start = self.addresses[index]
+        # Last symbol (_end) has no end, the range is left empty, so it's never used from the cache
+        self.last_hit_end = self.addresses[index + 1] if index + 1 < len(self.addresses) else self.last_hit_start
+        self.last_hit_name = self.names[index]
+        return self.last_hit_name
+
+
+# Parse a ".map" file generated by linker and return a list of tuples (address, symbol_name)
+def parse_linker_map_file(file_content):
+    symbols = []
+    for line in file_content.splitlines():
+        parts = line.split()
+        if len(parts) == 3:
+            address, _, symbol = parts
+            symbols.append((int(address, 16), symbol))
+    # Sorting the symbols by address
+    symbols.sort(key=lambda x: x[0])
+    return symbols
+
+
+if __name__ == '__main__':
+    print(f"\nExecuting:\n\t{__file__} \n")
+    print("Hopefully here we will have tests for functions in this file")
@@ -3,11 +3,24 @@ from platform import system
 
 from memory.address_space import Address_Space
 from devices.device_timer_CLINT import Device_Timer_CLINT
+from devices.device_PLIC import Device_PLIC
+from devices.device_virtio_block import Device_Virtio_Block
+from devices.device_host_file_channel import Device_Host_File_Channel
 from devices.device_uart_8250 import Device_UART_8250
 from emulator_management.emulator_logger import Emulator_logger
+from emulator_management.snapshot import save_snapshot, save_delta_snapshot, load_snapshot
+from emulator_management.console import Console
+from emulator_management.fork_server import run_fork_server
+from emulator_management.automation import run_automation_script
+from emulator_management.guest_profiler import Guest_profiler
+from emulator_management.console_server import Console_server
 # Implementing RISC-V CPU emulator - only RV32IMA instruction set (32-bit integer + multiplication/division + atomics)
 
-from cpu.instruction_executer import execute_instruction
+from cpu.instruction_executer import execute_decoded_instruction
+from cpu.instruction_cache import Instruction_cache
+from cpu.cpu_state import CPU_state
+from cpu.event_scheduler import Event_scheduler
+from cpu.block_compiler import Block_compiler
 from memory.RAM_memory import RAM_memory
 from cpu.registers import Registers, CSR_Registers
 from config import *
@@ -17,14 +30,16 @@ from utils.read_keyboard import tty_prepare, tty_release
 
 
 # TODO: rename to execute_next_CPU_instruction
-def execute_single_CPU_instruction(registers, CSR_registers, trap_and_interrupt_handler, memory, logger):
+def execute_single_CPU_instruction(cpu):
+    registers = cpu.registers
 
-    # Fetch
-    instruction = memory.get_4_bytes__little_endian(registers.instruction_pointer)
+    # Fetch & decode
+    # Instructions are fetched and decoded only the first time the CPU executes them, after that the already decoded
+    # instruction is taken from the instruction cache
+    instruction, handler, operands = cpu.instruction_cache.fetch(registers.instruction_pointer)
 
     # Execute
-    # TODO: To many arguments. Group somo of them into "CPU_state" or maybe just "CPU"
-    instruction_pointer_updated = execute_instruction(instruction, registers, CSR_registers, trap_and_interrupt_handler, memory, logger)
+    instruction_pointer_updated = execute_decoded_instruction(instruction, handler, operands, cpu)
 
     # Move "instruction pointer" to the next instruction IF NOT already moved by "jump" or "branch" instruction
     if not instruction_pointer_updated:
@@ -39,11 +54,68 @@ def execute_single_CPU_instruction(registers, CSR_registers, trap_and_interrupt_
     pass
 
 
-def emulate_cpu():
-    print("") # Just for newline
+# Used by the block compiler engine. Executes the whole compiled block starting at the current instruction pointer,
+# or a single instruction (with the interpreter) if the block can't execute it
+def execute_next_CPU_block(cpu, block_compiler):
+    registers = cpu.registers
+
+    block = block_compiler.get_block(registers.instruction_pointer)
+
+    executed_instructions = 0
+    if block is not None:
+        executed_instructions = block(cpu)
+
+    if executed_instructions == 0:
+        execute_single_CPU_instruction(cpu)
+    else:
+        registers.executed_instruction_counter += executed_instructions
+        cpu.logger.register_executed_block(executed_instructions, registers)
+
+
+# Runs the CPU until it executes stop_at_instruction_no instructions (or forever if it's None)
+# Device events (timer) and interrupts are checked between the instructions, or only between the blocks with the
+# block compiler. Devices are not polled, the loop only checks if the nearest scheduled event is due, and if the trap
+# handler has an interrupt ready to be taken
+def run_CPU(cpu, block_compiler=None, stop_at_instruction_no=None):
+    registers = cpu.registers
+    trap_and_interrupt_handler = cpu.trap_and_interrupt_handler
+    event_scheduler = cpu.event_scheduler
+
+    if stop_at_instruction_no is None:
+        if block_compiler is not None:
+            while True:
+                if registers.executed_instruction_counter >= event_scheduler.next_event_at_instruction_no:
+                    event_scheduler.run_due_events()
+                execute_next_CPU_block(cpu, block_compiler)
+                if trap_and_interrupt_handler.interrupt_deliverable:
+                    trap_and_interrupt_handler.update()
+        else:
+            while True:
+                if registers.executed_instruction_counter >= event_scheduler.next_event_at_instruction_no:
+                    event_scheduler.run_due_events()
+                execute_single_CPU_instruction(cpu)
+                if trap_and_interrupt_handler.interrupt_deliverable:
+                    trap_and_interrupt_handler.update()
+
+    # Same loops as above, just with an extra check which is left out when we don't need it
+    if block_compiler is not None:
+        while registers.executed_instruction_counter < stop_at_instruction_no:
+            if registers.executed_instruction_counter >= event_scheduler.next_event_at_instruction_no:
+                event_scheduler.run_due_events()
+            execute_next_CPU_block(cpu, block_compiler)
+            if trap_and_interrupt_handler.interrupt_deliverable:
+                trap_and_interrupt_handler.update()
+    else:
+        while registers.executed_instruction_counter < stop_at_instruction_no:
+            if registers.executed_instruction_counter >= event_scheduler.next_event_at_instruction_no:
+                event_scheduler.run_due_events()
+            execute_single_CPU_instruction(cpu)
+            if trap_and_interrupt_handler.interrupt_deliverable:
+                trap_and_interrupt_handler.update()
 
-    logger = Emulator_logger(START_TRACEOUT_AT_INSTRUCTION_NO, STOP_TRACEOUT_AT_INSTRUCTION_NO, LOGGER_REPORT_TYPE)
 
+# Creates the whole emulated machine with Linux loaded into RAM, ready to start. Also used by the benchmarks
+def create_machine(logger):
     ram_memory = RAM_memory(LINUX_IMAGE_PATH, DEVICE_TREE_PATH, RAM_SIZE)
 
     registers = Registers(logger)
@@ -52,25 +124,128 @@ def emulate_cpu():
     # https://docs.kernel.org/arch/riscv/boot.html
     registers.x[11] = START_ADDRESS_OF_RAM + ram_memory.get_device_tree_RAM_address() # absolute address of RAM in CPU's address space + relative address of DTB in RAM space
 
+    # Input and output of both hvc0 console and UART
+    console = Console()
+    if CONSOLE_INPUT_PATH is not None:
+        console.open_input_stream(CONSOLE_INPUT_PATH)
+
     trap_and_interrupt_handler = Trap_And_Interrupt_Handler(registers, logger)
-    CSR_registers = CSR_Registers(trap_and_interrupt_handler, logger)
+    event_scheduler = Event_scheduler(registers)
+    CSR_registers = CSR_Registers(trap_and_interrupt_handler, logger, console)
 
     # TODO: It would probably be smart to make logger a singleton
-    device_UART_8250 = Device_UART_8250(logger)
-    device_timer_CLINT = Device_Timer_CLINT(logger, registers, trap_and_interrupt_handler) # TODO: Only pass a function for triggering the interrupt
+    device_PLIC = Device_PLIC(logger, trap_and_interrupt_handler)
+    device_UART_8250 = Device_UART_8250(logger, registers, console, device_PLIC, event_scheduler)
+    device_timer_CLINT = Device_Timer_CLINT(logger, registers, trap_and_interrupt_handler, event_scheduler, console) # TODO: Only pass a function for triggering the interrupt
+
+    address_space = Address_Space(ram_memory)
+    address_space.attach_device(START_ADDRESS_OF_PLIC, device_PLIC, "PLIC")
+    address_space.attach_device(START_ADDRESS_OF_UART, device_UART_8250, "UART")
+    address_space.attach_device(START_ADDRESS_OF_TIMER_CLINT, device_timer_CLINT, "CLINT")
+
+    if VIRTIO_BLOCK_IMAGE_PATH is not None:
+        device_virtio_block = Device_Virtio_Block(logger, address_space, device_PLIC, VIRTIO_BLOCK_IMAGE_PATH,
+                                                  VIRTIO_BLOCK_READ_ONLY)
+        address_space.attach_device(START_ADDRESS_OF_VIRTIO_BLOCK, device_virtio_block, "VIRTIO_BLOCK")
 
-    # If need for more devices appears, it would probably be smarter to pass a list of objects with a common interface
-    address_space = Address_Space(ram_memory, device_UART_8250, device_timer_CLINT)
+    if HOST_FILE_CHANNEL_FILES is not None:
+        device_host_file_channel = Device_Host_File_Channel(logger, address_space, HOST_FILE_CHANNEL_FILES)
+        address_space.attach_device(START_ADDRESS_OF_HOST_FILE_CHANNEL, device_host_file_channel, "HOST_FILE_CHANNEL")
 
     print(f" [EMULATOR] Location of Linux image: 0x{START_ADDRESS_OF_RAM:08x}")
     print(f" [EMULATOR] Location of DeviceTree:  0x{registers.x[11]:08x}")
     print(f" [EMULATOR] CPU start address:       0x{registers.instruction_pointer:08x}")
 
+    cpu = CPU_state(registers, CSR_registers, trap_and_interrupt_handler, address_space, logger)
+    cpu.instruction_cache = Instruction_cache(address_space)
+    cpu.device_timer_CLINT = device_timer_CLINT
+    cpu.device_UART_8250 = device_UART_8250
+    cpu.event_scheduler = event_scheduler
+
+    return cpu, console
+
+
+def emulate_cpu():
+    print("") # Just for newline
+
+    logger = Emulator_logger(START_TRACEOUT_AT_INSTRUCTION_NO, STOP_TRACEOUT_AT_INSTRUCTION_NO, LOGGER_REPORT_TYPE)
+
+    cpu, console = create_machine(logger)
+
+    if CONSOLE_SERVER_ADDRESS is not None:
+        Console_server(console, CONSOLE_SERVER_ADDRESS).start()
+        # Headless, the console is available only through the server
+        console.tty_output_enabled = False
+        console.keyboard_input_enabled = False
+
+    block_compiler = None
+    if EXECUTION_ENGINE == ExecutionEngine.BLOCK_COMPILER:
+        block_compiler = Block_compiler(cpu)
+
+    # Everything below runs the CPU only through this function, so the profiler can hook into it
+    def run_CPU_until(instruction_no=None):
+        run_CPU(cpu, block_compiler, instruction_no)
+
+    profiler = None
+    if PROFILER_MODE is not None:
+        profiler = Guest_profiler(cpu, logger.symbols)
+        if PROFILER_MODE == ProfilerMode.INSTRUCTION_COUNT:
+            run_CPU_until = profiler.add_sampling_by_instruction_count(run_CPU_until, PROFILER_SAMPLE_INTERVAL)
+        else:
+            profiler.start_sampling_by_host_timer(PROFILER_TIMER_INTERVAL)
+
+    try:
+        run_machine(cpu, console, run_CPU_until)
+    finally:
+        console.flush_output()
+
+        # Rest of the binary trace (or the whole ring of the last instructions) is written also when the emulation is
+        # stopped by an exception or Ctrl+C
+        if logger.binary_trace is not None:
+            logger.binary_trace.close()
+
+        # Profile is written also when the emulation is stopped by an exception or Ctrl+C
+        if profiler is not None:
+            profiler.stop_sampling_by_host_timer()
+            profiler.write_folded_stacks(PROFILER_OUTPUT_PATH)
+            profiler.print_top_functions(PROFILER_TOP_FUNCTIONS)
+            print(f" [EMULATOR] Profiler: folded stacks written to '{PROFILER_OUTPUT_PATH}'")
+
+
+def run_machine(cpu, console, run_CPU_until):
+    registers = cpu.registers
+
+    # Incremental snapshots are saved relative to the last saved or loaded snapshot
+    last_snapshot_path = None
+
+    if SNAPSHOT_LOAD_PATH is not None:
+        load_snapshot(SNAPSHOT_LOAD_PATH, cpu)
+        last_snapshot_path = SNAPSHOT_LOAD_PATH
+
     print(" [EMULATOR] Starting CPU... \n")
-    while True:
-        device_timer_CLINT.update()
-        execute_single_CPU_instruction(registers, CSR_registers, trap_and_interrupt_handler, address_space, logger)
-        trap_and_interrupt_handler.update()
+    if SNAPSHOT_SAVE_PATH is not None and SNAPSHOT_SAVE_AT_INSTRUCTION_NO is not None:
+        # With the block compiler, the snapshot is saved at the end of the block which crosses the given instruction no.
+        run_CPU_until(SNAPSHOT_SAVE_AT_INSTRUCTION_NO)
+        save_snapshot(SNAPSHOT_SAVE_PATH, cpu)
+        last_snapshot_path = SNAPSHOT_SAVE_PATH
+
+    if AUTOMATION_SCRIPT is not None:
+        # Headless run, emulator exits when the script is done
+        console.keyboard_input_enabled = False
+        run_automation_script(AUTOMATION_SCRIPT, cpu, console, run_CPU_until, AUTOMATION_DEFAULT_TIMEOUT)
+        return
+
+    if FORK_SERVER_ENABLED:
+        run_fork_server(cpu, console, run_CPU_until, resumed_from_snapshot=SNAPSHOT_LOAD_PATH is not None)
+
+    if SNAPSHOT_CHECKPOINT_INTERVAL is not None and last_snapshot_path is not None:
+        while True:
+            run_CPU_until(registers.executed_instruction_counter + SNAPSHOT_CHECKPOINT_INTERVAL)
+            checkpoint_path = SNAPSHOT_CHECKPOINT_PATH.format(instruction_no=registers.executed_instruction_counter)
+            save_delta_snapshot(checkpoint_path, cpu, last_snapshot_path)
+            last_snapshot_path = checkpoint_path
+
+    run_CPU_until()
 
 
 # Main starting point of this program/script
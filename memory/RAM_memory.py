@@ -1,4 +1,14 @@
+import mmap
+import os
+
 from config import *
+from utils.device_tree import parse_device_tree, build_device_tree
+from devices.device_PLIC import PLIC_MMIO_SIZE, PLIC_NUMBER_OF_SOURCES
+from devices.device_virtio_block import VIRTIO_MMIO_SIZE
+
+# Device tree is placed at the very end of RAM. The last DEVICE_TREE_RESERVED_SIZE bytes of RAM are left out of the
+# memory node of the device tree, so the kernel doesn't use that memory (and overwrite the device tree)
+DEVICE_TREE_RESERVED_SIZE = 0x4000
 
 
 class RAM_memory:
@@ -11,38 +21,129 @@ class RAM_memory:
         # and the code of Address_Space access RAM_memory.RAM directly. The emulator is horribly slow as is,
         # no point in adding getters and setters to access data, I can eventually add getter for passing the
         # whole bytearray instance, to make glue points more obvious
-        self.RAM = bytearray()
+        #
+        # RAM is an anonymous memory mapping. It behaves like a bytearray, but the OS gives us zero-filled pages only
+        # when they are touched for the first time. So the size of RAM doesn't affect the startup time, and the
+        # untouched part of guest RAM doesn't use any host memory
+        self.RAM = allocate_anonymous_memory(RAM_size)
+        self.RAM_size = RAM_size
 
-        # Load the content of Linux image file into a bytearray
-        with open(LINUX_IMAGE_PATH, 'rb') as file:
-            linux_image_binary = bytearray(file.read())
+        # Beginning of RAM is filled with Linux
+        # File is read directly into RAM, without making an intermediate copy of the whole image
+        linux_image_size = os.path.getsize(LINUX_IMAGE_PATH)
+        if linux_image_size > RAM_size - DEVICE_TREE_RESERVED_SIZE:
+            raise Exception("RAM: Linux image doesn't fit into RAM")
 
-        with open(DEVICE_TREE_PATH, 'rb') as file:
-            device_tree_binary = bytearray(file.read())
+        with open(LINUX_IMAGE_PATH, 'rb') as file, memoryview(self.RAM) as RAM_view:
+            file.readinto(RAM_view[0:linux_image_size])
 
-        device_tree_address = RAM_SIZE - len(device_tree_binary)
-        # print(f"Calculated DTB address: {device_tree_address:08x}")
+        # Copy content of the device tree file into the end of RAM
+        with open(DEVICE_TREE_PATH, 'rb') as file:
+            device_tree_binary = prepare_device_tree(file.read(), RAM_size)
 
-        # Beginning of RAM is filled with Linux
-        self.RAM.extend(linux_image_binary)
+        if len(device_tree_binary) > DEVICE_TREE_RESERVED_SIZE:
+            raise Exception("RAM: Device tree is bigger than the space reserved for it")
 
-        # The rest of RAM is just RAM_size (minus sizeof linux_image) of empty space
-        self.RAM.extend(bytearray(RAM_size - len(linux_image_binary)))
+        # Device tree must be placed at 8-byte aligned address
+        device_tree_address = (RAM_size - len(device_tree_binary)) & ~0x7
+        # print(f"Calculated DTB address: {device_tree_address:08x}")
 
-        # Copy content of the device tree file into the RAM at specified address
-        # TODO: Make this more readable
         self.RAM[device_tree_address:device_tree_address + len(device_tree_binary)] = device_tree_binary
 
         self.device_tree_address = device_tree_address
 
         print(f" [EMULATOR] RAM size:        {RAM_size/1024:>8.2f} kB")
-        print(f" [EMULATOR] Kernel size:     {len(linux_image_binary)/1024:>8.2f} kB")
+        print(f" [EMULATOR] Kernel size:     {linux_image_size/1024:>8.2f} kB")
         print(f" [EMULATOR] DeviceTree size: {len(device_tree_binary)/1024:>8.2f} kB")
 
     def get_device_tree_RAM_address(self):
         return self.device_tree_address
 
 
+def allocate_anonymous_memory(size):
+    # Private mapping is not available on Windows, but there the anonymous mapping also isn't backed by any file
+    if hasattr(mmap, 'MAP_PRIVATE'):
+        return mmap.mmap(-1, size, flags=mmap.MAP_PRIVATE | mmap.MAP_ANONYMOUS)
+    return mmap.mmap(-1, size)
+
+
+# Tells the kernel how much RAM the machine has. The device tree file on disk was made for 64 MiB of RAM, so the
+# "reg" property of the memory node is updated to the configured RAM size. Also the frequency of the timer is set,
+# the interrupt controller (PLIC) is added, the UART is connected to it, and the console of the kernel is selected
+def prepare_device_tree(device_tree_binary, RAM_size):
+    device_tree = parse_device_tree(device_tree_binary)
+
+    memory_node = device_tree.find_node(f"memory@{START_ADDRESS_OF_RAM:x}")
+    if memory_node is None:
+        raise Exception("RAM: Device tree doesn't have a memory node")
+
+    # Root node has #address-cells = 2 and #size-cells = 2, so both address and size are 64-bit values
+    usable_RAM_size = RAM_size - DEVICE_TREE_RESERVED_SIZE
+    memory_node.set_property_cells("reg", [START_ADDRESS_OF_RAM >> 32, START_ADDRESS_OF_RAM & 0xFFFFFFFF,
+                                           usable_RAM_size >> 32, usable_RAM_size & 0xFFFFFFFF])
+
+    cpus_node = device_tree.find_node("cpus")
+    if cpus_node is None:
+        raise Exception("RAM: Device tree doesn't have a cpus node")
+    cpus_node.set_property_cells("timebase-frequency", [TIMER_FREQUENCY])
+
+    add_PLIC_and_UART_to_device_tree(device_tree)
+    if VIRTIO_BLOCK_IMAGE_PATH is not None:
+        add_virtio_block_to_device_tree(device_tree)
+
+    chosen_node = device_tree.find_node("chosen")
+    if chosen_node is None:
+        raise Exception("RAM: Device tree doesn't have a chosen node")
+    bootargs = chosen_node.properties["bootargs"].rstrip(b"\0").decode().split()
+    bootargs = [argument for argument in bootargs if not argument.startswith("console=")] + [f"console={KERNEL_CONSOLE}"]
+    chosen_node.set_property_string("bootargs", " ".join(bootargs))
+
+    # Keep the padding of the original file
+    return build_device_tree(device_tree, minimum_size=len(device_tree_binary))
+
+
+# Device tree file on disk describes the UART with a compatible string that no driver knows, so the kernel uses it
+# only for the early console (by polling). Here it becomes a 16550 with an interrupt from the PLIC
+def add_PLIC_and_UART_to_device_tree(device_tree):
+    soc_node = device_tree.find_node("soc")
+    CPU_interrupt_controller_node = device_tree.find_node("cpus/cpu@0/interrupt-controller")
+    UART_node = device_tree.find_node(f"soc/uart@{START_ADDRESS_OF_UART:x}")
+    if soc_node is None or CPU_interrupt_controller_node is None or UART_node is None:
+        raise Exception("RAM: Device tree doesn't have a soc, interrupt-controller of the CPU or UART node")
+
+    PLIC_node = soc_node.add_child(f"plic@{START_ADDRESS_OF_PLIC:x}")
+    if "phandle" not in PLIC_node.properties:
+        PLIC_node.set_property_cells("phandle", [device_tree.get_unused_phandle()])
+    PLIC_phandle = PLIC_node.get_property_cells("phandle")[0]
+
+    # Kernel runs in machine mode, so the PLIC is connected to the machine external interrupt (11) of the CPU
+    MACHINE_EXTERNAL_INTERRUPT = 11
+    CPU_interrupt_controller_phandle = CPU_interrupt_controller_node.get_property_cells("phandle")[0]
+
+    PLIC_node.set_property_strings("compatible", ["sifive,plic-1.0.0", "riscv,plic0"])
+    PLIC_node.set_property_cells("reg", [0, START_ADDRESS_OF_PLIC, 0, PLIC_MMIO_SIZE])
+    PLIC_node.set_property_cells("#address-cells", [0])
+    PLIC_node.set_property_cells("#interrupt-cells", [1])
+    PLIC_node.properties["interrupt-controller"] = b""
+    PLIC_node.set_property_cells("interrupts-extended", [CPU_interrupt_controller_phandle, MACHINE_EXTERNAL_INTERRUPT])
+    PLIC_node.set_property_cells("riscv,ndev", [PLIC_NUMBER_OF_SOURCES])
+
+    UART_node.set_property_string("compatible", "ns16550a")
+    UART_node.set_property_cells("interrupt-parent", [PLIC_phandle])
+    UART_node.set_property_cells("interrupts", [UART_INTERRUPT_SOURCE])
+
+
+# Kernel finds virtio-mmio devices only through the device tree, the type of the device (block) is read from the device
+def add_virtio_block_to_device_tree(device_tree):
+    PLIC_node = device_tree.find_node(f"soc/plic@{START_ADDRESS_OF_PLIC:x}")
+    virtio_node = device_tree.find_node("soc").add_child(f"virtio_mmio@{START_ADDRESS_OF_VIRTIO_BLOCK:x}")
+
+    virtio_node.set_property_string("compatible", "virtio,mmio")
+    virtio_node.set_property_cells("reg", [0, START_ADDRESS_OF_VIRTIO_BLOCK, 0, VIRTIO_MMIO_SIZE])
+    virtio_node.set_property_cells("interrupt-parent", PLIC_node.get_property_cells("phandle"))
+    virtio_node.set_property_cells("interrupts", [VIRTIO_BLOCK_INTERRUPT_SOURCE])
+
+
 if __name__ == '__main__':
     print(f"\nExecuting:\n\t{__file__} \n")
     print("Hopefully here we will have tests for functions in this file")
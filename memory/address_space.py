@@ -1,62 +1,179 @@
+from struct import Struct
+
 from config import *
+from cpu.instruction_cache import CODE_PAGE_SIZE_BITS
+
+# Little endian unsigned 32-bit and 16-bit values (see get_4_bytes__little_endian() for explanation of endianness)
+WORD = Struct('<I')
+HALF_WORD = Struct('<H')
+
+
+# The address space is split into 64 KiB pages. Every page is mapped either to RAM or to a single device, so
+# finding what is at some address is just one dict lookup, no matter how many devices are attached
+MEMORY_MAP_PAGE_SIZE_BITS = 16
+MEMORY_MAP_PAGE_SIZE = 1 << MEMORY_MAP_PAGE_SIZE_BITS
 
+# Marks the pages of the memory map that belong to RAM
+RAM_REGION = object()
 
+
+# Devices attached to the address space must implement:
+#   get_mmio_size()                      - size of the device's memory mapped registers
+#   read_register(address)               - returns a byte of a register, address is relative to the device's start
+#   write_register(address, value)       - writes a byte into a register
+#   get_state() / set_state(state)       - state of the device, used by snapshots
 class Address_Space:
 
-    def __init__(self, RAM_memory, device_UART, device_timer_CLINT):
+    def __init__(self, RAM_memory):
 
         self.RAM_memory = RAM_memory
-        self.device_UART = device_UART
-        self.device_timer_CLINT = device_timer_CLINT
+        self.RAM = RAM_memory.RAM
+
+        # Page number -> RAM_REGION or (start address of the device, device)
+        self.memory_map = {}
+
+        # Device name -> device, in the order the devices were attached
+        self.devices = {}
+
+        # Writes into RAM must drop cached instructions from the written page (see cpu/instruction_cache.py)
+        self.instruction_cache = None
+        self.cached_code_pages = {}
+
+        # Numbers of the pages of RAM written since the last snapshot (see emulator_management/snapshot.py), so an
+        # incremental snapshot only needs to store these pages. Same page size as for the instruction cache, so one
+        # page number is used for both
+        self.dirty_pages = set()
+
+        for page_number in range(START_ADDRESS_OF_RAM >> MEMORY_MAP_PAGE_SIZE_BITS, (START_ADDRESS_OF_RAM + RAM_SIZE) >> MEMORY_MAP_PAGE_SIZE_BITS):
+            self.memory_map[page_number] = RAM_REGION
 
         print(f" [EMULATOR] CPU address space: ")
-        print(f" [EMULATOR]     {START_ADDRESS_OF_UART:08X}-{START_ADDRESS_OF_UART+device_UART.get_mmio_size():08X} : UART")
-        print(f" [EMULATOR]     {START_ADDRESS_OF_TIMER_CLINT:08X}-{START_ADDRESS_OF_TIMER_CLINT+device_timer_CLINT.get_mmio_size():08X} : CLINT")
         print(f" [EMULATOR]     {START_ADDRESS_OF_RAM:08X}-{START_ADDRESS_OF_RAM+RAM_SIZE:08X} : RAM")
 
+    # Device must start at the beginning of a page, and it can't share any of its pages with RAM or other devices
+    def attach_device(self, start_address, device, name):
+        if start_address % MEMORY_MAP_PAGE_SIZE != 0:
+            raise Exception(f"Address space: device '{name}' must start at a {MEMORY_MAP_PAGE_SIZE} bytes boundary")
+
+        first_page = start_address >> MEMORY_MAP_PAGE_SIZE_BITS
+        last_page = (start_address + device.get_mmio_size()) >> MEMORY_MAP_PAGE_SIZE_BITS
+
+        for page_number in range(first_page, last_page + 1):
+            if page_number in self.memory_map:
+                raise Exception(f"Address space: device '{name}' overlaps with another device or RAM")
+
+        if name in self.devices:
+            raise Exception(f"Address space: device with name '{name}' is already attached")
+
+        for page_number in range(first_page, last_page + 1):
+            self.memory_map[page_number] = (start_address, device)
+        self.devices[name] = device
+
+        print(f" [EMULATOR]     {start_address:08X}-{start_address+device.get_mmio_size():08X} : {name}")
 
     # Returns a value stored at specified address
     def get_1_byte(self, address):
+        region = self.memory_map.get(address >> MEMORY_MAP_PAGE_SIZE_BITS)
 
-        # TODO: We just repeat the same code for every device. It would be wise to just make a list of devices with
-        #       common interface and just iterate over the list. Read/write functions are already common, just needs
-        #       variables for starting address and size of memory map
-        if START_ADDRESS_OF_RAM <= address <= START_ADDRESS_OF_RAM + RAM_SIZE:
+        if region is RAM_REGION:
             RAM_addr = address - START_ADDRESS_OF_RAM
-            return self.RAM_memory.RAM[RAM_addr]
+            return self.RAM[RAM_addr]
+
+        if region is not None:
+            start_address, device = region
+            reg_address = address - start_address
+            if reg_address <= device.get_mmio_size():
+                return device.read_register(reg_address)
 
-        elif START_ADDRESS_OF_UART <= address <= START_ADDRESS_OF_UART + self.device_UART.get_mmio_size():
-            reg_address = address - START_ADDRESS_OF_UART
-            return self.device_UART.read_register(reg_address)
+        print(f"[ERROR] Address space: trying to read to unimplemented address: 0x{address:08x}")
+        raise Exception("Address space: trying to read to unimplemented address")
 
-        elif START_ADDRESS_OF_TIMER_CLINT <= address <= START_ADDRESS_OF_TIMER_CLINT + self.device_timer_CLINT.get_mmio_size():
-            reg_address = address - START_ADDRESS_OF_TIMER_CLINT
-            return self.device_timer_CLINT.read_register(reg_address)
+    # Direct memory access (DMA) for devices that transfer whole buffers (see devices/device_virtio_block.py). Data is
+    # copied with one slice assignment, instead of byte by byte through get_1_byte()/write_1_byte(). Buffer must be
+    # completely in RAM
+    @staticmethod
+    def is_RAM_block(address, size):
+        return START_ADDRESS_OF_RAM <= address and address + size <= START_ADDRESS_OF_RAM + RAM_SIZE
 
-        else:
-            print(f"[ERROR] Address space: trying to read to unimplemented address: 0x{address:08x}")
-            raise Exception("Address space: trying to read to unimplemented address")
+    def get_RAM_offset(self, address, size):
+        if not self.is_RAM_block(address, size):
+            raise Exception(f"Address space: DMA buffer 0x{address:08x} (size {size}) is outside of RAM")
+        return address - START_ADDRESS_OF_RAM
+
+    # Fills the destination (a writable memoryview) with the bytes of RAM from the address
+    def read_RAM_block(self, address, destination):
+        RAM_addr = self.get_RAM_offset(address, len(destination))
+        with memoryview(self.RAM) as RAM_view:
+            destination[:] = RAM_view[RAM_addr:RAM_addr + len(destination)]
+
+    def write_RAM_block(self, address, source):
+        RAM_addr = self.get_RAM_offset(address, len(source))
+        with memoryview(self.RAM) as RAM_view:
+            RAM_view[RAM_addr:RAM_addr + len(source)] = source
+        self.mark_RAM_written(address, len(source))
+
+    # Same for host files (opened in binary mode): data goes between the file and RAM without an intermediate copy.
+    # Both return the number of transferred bytes, reading stops at the end of the file
+    def read_file_into_RAM(self, file, address, size):
+        RAM_addr = self.get_RAM_offset(address, size)
+        with memoryview(self.RAM) as RAM_view:
+            read_bytes = file.readinto(RAM_view[RAM_addr:RAM_addr + size])
+        self.mark_RAM_written(address, read_bytes)
+        return read_bytes
+
+    def write_RAM_into_file(self, file, address, size):
+        RAM_addr = self.get_RAM_offset(address, size)
+        with memoryview(self.RAM) as RAM_view:
+            return file.write(RAM_view[RAM_addr:RAM_addr + size])
+
+    # Same as write_1_byte() does for every written byte
+    def mark_RAM_written(self, address, size):
+        if size == 0:
+            return
+        for page_number in range(address >> CODE_PAGE_SIZE_BITS, ((address + size - 1) >> CODE_PAGE_SIZE_BITS) + 1):
+            self.dirty_pages.add(page_number)
+            if page_number in self.cached_code_pages:
+                self.instruction_cache.invalidate_page(page_number)
+
+    def attach_instruction_cache(self, instruction_cache):
+        self.instruction_cache = instruction_cache
+        self.cached_code_pages = instruction_cache.code_pages
 
     def write_1_byte(self, address, value):
-        if START_ADDRESS_OF_RAM <= address <= START_ADDRESS_OF_RAM + RAM_SIZE:
+        region = self.memory_map.get(address >> MEMORY_MAP_PAGE_SIZE_BITS)
+
+        if region is RAM_REGION:
             RAM_addr = address - START_ADDRESS_OF_RAM
-            self.RAM_memory.RAM[RAM_addr] = value
+            self.RAM[RAM_addr] = value
+
+            page_number = address >> CODE_PAGE_SIZE_BITS
+            self.dirty_pages.add(page_number)
 
-        elif START_ADDRESS_OF_UART <= address <= START_ADDRESS_OF_UART + 8:
-            reg_address = address - START_ADDRESS_OF_UART
-            return self.device_UART.write_register(reg_address, value)
+            # Did we just overwrite an instruction that is cached?
+            if page_number in self.cached_code_pages:
+                self.instruction_cache.invalidate_page(page_number)
+            return
 
-        elif START_ADDRESS_OF_TIMER_CLINT <= address <= START_ADDRESS_OF_TIMER_CLINT + 0xBFFF:
-            reg_address = address - START_ADDRESS_OF_TIMER_CLINT
-            return self.device_timer_CLINT.write_register(reg_address, value)
+        if region is not None:
+            start_address, device = region
+            reg_address = address - start_address
+            if reg_address <= device.get_mmio_size():
+                return device.write_register(reg_address, value)
 
-        else:
-            print(f"[ERROR] Address space: trying to write to unimplemented address: 0x{address:08x}")
-            raise Exception("Address space: trying to write to unimplemented address")
+        print(f"[ERROR] Address space: trying to write to unimplemented address: 0x{address:08x}")
+        raise Exception("Address space: trying to write to unimplemented address")
 
     # Read 32bits/4bytes starting from specified address
     # RISC-V starts in little endian mode, therefor we need to read data as little endian order
+    #
+    # 16-bit and 32-bit accesses that fall completely into RAM (aligned or not) are done in one step directly on the
+    # RAM bytearray. Only accesses to devices (and the ones crossing the end of RAM) go byte-by-byte through
+    # get_1_byte()/write_1_byte(), because device registers are implemented per byte
     def get_4_bytes__little_endian(self, address):
+        RAM_addr = address - START_ADDRESS_OF_RAM
+        if 0 <= RAM_addr <= RAM_SIZE - 4:
+            return WORD.unpack_from(self.RAM, RAM_addr)[0]
+
         # When you read byte-by-byte you will get the same value in both little endian CPU (LE) and big endian CPU (BE)
         # But if you read more than a byte into a register, LE and BE CPUs will put individual bytes into different
         # places in the register. It is similar to how some cultures read from left-to-right and some from right-to-left
@@ -76,6 +193,10 @@ class Address_Space:
         return value
 
     def get_2_bytes__little_endian(self, address):
+        RAM_addr = address - START_ADDRESS_OF_RAM
+        if 0 <= RAM_addr <= RAM_SIZE - 2:
+            return HALF_WORD.unpack_from(self.RAM, RAM_addr)[0]
+
         byte0 = self.get_1_byte(address)
         byte1 = self.get_1_byte(address + 1)
 
@@ -84,6 +205,25 @@ class Address_Space:
         return value
 
     def write_4_bytes__little_endian(self, address, value):
+        RAM_addr = address - START_ADDRESS_OF_RAM
+        if 0 <= RAM_addr <= RAM_SIZE - 4:
+            WORD.pack_into(self.RAM, RAM_addr, value & 0xFFFFFFFF)
+
+            # Unaligned write can touch two pages
+            first_page = address >> CODE_PAGE_SIZE_BITS
+            last_page = (address + 3) >> CODE_PAGE_SIZE_BITS
+            dirty_pages = self.dirty_pages
+            dirty_pages.add(first_page)
+            dirty_pages.add(last_page)
+
+            # Did we just overwrite an instruction that is cached?
+            cached_code_pages = self.cached_code_pages
+            if first_page in cached_code_pages:
+                self.instruction_cache.invalidate_page(first_page)
+            if last_page in cached_code_pages:
+                self.instruction_cache.invalidate_page(last_page)
+            return
+
         # Break the 32-bit value into individual bytes
         byte0 = value & 0xFF
         byte1 = (value >> 8) & 0xFF
@@ -98,6 +238,23 @@ class Address_Space:
         pass
 
     def write_2_bytes__little_endian(self, address, value):
+        RAM_addr = address - START_ADDRESS_OF_RAM
+        if 0 <= RAM_addr <= RAM_SIZE - 2:
+            HALF_WORD.pack_into(self.RAM, RAM_addr, value & 0xFFFF)
+
+            first_page = address >> CODE_PAGE_SIZE_BITS
+            last_page = (address + 1) >> CODE_PAGE_SIZE_BITS
+            dirty_pages = self.dirty_pages
+            dirty_pages.add(first_page)
+            dirty_pages.add(last_page)
+
+            cached_code_pages = self.cached_code_pages
+            if first_page in cached_code_pages:
+                self.instruction_cache.invalidate_page(first_page)
+            if last_page in cached_code_pages:
+                self.instruction_cache.invalidate_page(last_page)
+            return
+
         # Break the 16-bit value into individual bytes
         byte0 = value & 0xFF
         byte1 = (value >> 8) & 0xFF
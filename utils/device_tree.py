@@ -0,0 +1,220 @@
+from struct import pack, unpack_from
+
+# Minimal reader/writer for Flattened Device Tree binaries (.dtb). We use it to adapt the device tree that is
+# passed to the kernel to the emulated machine (size of RAM, ...), so we don't need "dtc" to rebuild the .dtb
+# every time something changes.
+#
+# Format description:
+#   https://devicetree-specification.readthedocs.io/en/stable/flattened-format.html
+#
+# Binary consists of:
+#   - header (40 bytes, all fields are big endian 32-bit values)
+#   - memory reservation block (list of 64-bit address/size pairs, terminated with an all-zero pair)
+#   - structure block (nodes and their properties, as a stream of 32-bit tokens)
+#   - strings block (names of properties, referenced from the structure block by offset)
+
+FDT_MAGIC = 0xd00dfeed
+
+FDT_BEGIN_NODE = 0x1
+FDT_END_NODE = 0x2
+FDT_PROP = 0x3
+FDT_NOP = 0x4
+FDT_END = 0x9
+
+FDT_HEADER_SIZE = 40
+
+
+class Device_tree_node:
+
+    def __init__(self, name):
+        self.name = name
+
+        # Property name -> raw value (bytes). Order is kept when the tree is written back
+        self.properties = {}
+        self.children = []
+
+    def get_child(self, name):
+        for child in self.children:
+            if child.name == name:
+                return child
+        return None
+
+    # Path is relative to this node, for example "soc/uart@10000000"
+    def find_node(self, path):
+        node = self
+        for name in path.strip("/").split("/"):
+            if name == "":
+                continue
+            node = node.get_child(name)
+            if node is None:
+                return None
+        return node
+
+    # Most properties are lists of 32-bit big endian numbers ("cells")
+    def get_property_cells(self, property_name):
+        value = self.properties[property_name]
+        return list(unpack_from(f">{len(value) // 4}I", value))
+
+    def set_property_cells(self, property_name, cells):
+        self.properties[property_name] = pack(f">{len(cells)}I", *cells)
+
+    def set_property_string(self, property_name, string):
+        self.properties[property_name] = string.encode() + b"\0"
+
+    # Property with several strings, like "compatible" = "sifive,plic-1.0.0", "riscv,plic0"
+    def set_property_strings(self, property_name, strings):
+        self.properties[property_name] = b"".join(string.encode() + b"\0" for string in strings)
+
+    # Returns the existing child with this name, or a new (empty) one
+    def add_child(self, name):
+        child = self.get_child(name)
+        if child is None:
+            child = Device_tree_node(name)
+            self.children.append(child)
+        return child
+
+
+class Device_tree:
+
+    def __init__(self, root, memory_reservations=(), boot_cpuid_phys=0):
+        self.root = root
+        self.memory_reservations = list(memory_reservations)
+        self.boot_cpuid_phys = boot_cpuid_phys
+
+    def find_node(self, path):
+        return self.root.find_node(path)
+
+    # Returns a phandle (number that other nodes use to reference a node) that isn't used by any node of the tree
+    def get_unused_phandle(self):
+        largest_phandle = 0
+        nodes = [self.root]
+        while nodes:
+            node = nodes.pop()
+            if "phandle" in node.properties:
+                largest_phandle = max(largest_phandle, node.get_property_cells("phandle")[0])
+            nodes.extend(node.children)
+        return largest_phandle + 1
+
+
+def parse_device_tree(binary):
+    (magic, total_size, struct_offset, strings_offset, memory_reservation_offset, version, last_compatible_version,
+     boot_cpuid_phys, strings_size, struct_size) = unpack_from(">10I", binary, 0)
+
+    if magic != FDT_MAGIC:
+        raise Exception("Device tree: invalid magic number, not a .dtb file")
+
+    # Memory reservation block
+    memory_reservations = []
+    offset = memory_reservation_offset
+    while True:
+        address, size = unpack_from(">QQ", binary, offset)
+        offset += 16
+        if address == 0 and size == 0:
+            break
+        memory_reservations.append((address, size))
+
+    def get_string(string_offset):
+        start = strings_offset + string_offset
+        return binary[start:binary.index(b"\0", start)].decode()
+
+    # Structure block
+    root = None
+    node_stack = []
+    offset = struct_offset
+    while True:
+        token, = unpack_from(">I", binary, offset)
+        offset += 4
+
+        if token == FDT_BEGIN_NODE:
+            name_end = binary.index(b"\0", offset)
+            node = Device_tree_node(binary[offset:name_end].decode())
+            offset = align_to_4_bytes(name_end + 1)
+
+            if node_stack:
+                node_stack[-1].children.append(node)
+            else:
+                root = node
+            node_stack.append(node)
+
+        elif token == FDT_END_NODE:
+            node_stack.pop()
+
+        elif token == FDT_PROP:
+            value_length, name_offset = unpack_from(">II", binary, offset)
+            offset += 8
+            node_stack[-1].properties[get_string(name_offset)] = bytes(binary[offset:offset + value_length])
+            offset = align_to_4_bytes(offset + value_length)
+
+        elif token == FDT_NOP:
+            pass
+
+        elif token == FDT_END:
+            break
+
+        else:
+            raise Exception(f"Device tree: unknown token 0x{token:x} at offset 0x{offset - 4:x}")
+
+    return Device_tree(root, memory_reservations, boot_cpuid_phys)
+
+
+# Same as dtc's "-S" option, the binary can be padded with zeros to minimum_size bytes. The free space at the end
+# can be used by the boot code for in-place modifications of the tree
+def build_device_tree(device_tree, minimum_size=0):
+    strings = bytearray()
+    string_offsets = {}
+
+    def get_string_offset(string):
+        if string not in string_offsets:
+            string_offsets[string] = len(strings)
+            strings.extend(string.encode() + b"\0")
+        return string_offsets[string]
+
+    structure = bytearray()
+
+    def add_node(node):
+        structure.extend(pack(">I", FDT_BEGIN_NODE))
+        structure.extend(node.name.encode() + b"\0")
+        pad_to_4_bytes(structure)
+
+        for name, value in node.properties.items():
+            structure.extend(pack(">III", FDT_PROP, len(value), get_string_offset(name)))
+            structure.extend(value)
+            pad_to_4_bytes(structure)
+
+        for child in node.children:
+            add_node(child)
+
+        structure.extend(pack(">I", FDT_END_NODE))
+
+    add_node(device_tree.root)
+    structure.extend(pack(">I", FDT_END))
+
+    memory_reservations = bytearray()
+    for address, size in device_tree.memory_reservations:
+        memory_reservations.extend(pack(">QQ", address, size))
+    memory_reservations.extend(pack(">QQ", 0, 0))
+
+    memory_reservation_offset = FDT_HEADER_SIZE
+    struct_offset = memory_reservation_offset + len(memory_reservations)
+    strings_offset = struct_offset + len(structure)
+    total_size = strings_offset + len(strings)
+    padding = bytes(max(0, minimum_size - total_size))
+    total_size += len(padding)
+
+    header = pack(">10I", FDT_MAGIC, total_size, struct_offset, strings_offset, memory_reservation_offset,
+                  17, 16, device_tree.boot_cpuid_phys, len(strings), len(structure))
+
+    return header + memory_reservations + structure + strings + padding
+
+
+def align_to_4_bytes(offset):
+    return (offset + 3) & ~3
+
+
+def pad_to_4_bytes(buffer):
+    buffer.extend(bytes(align_to_4_bytes(len(buffer)) - len(buffer)))
+
+
+if __name__ == '__main__':
+    print(f"\nExecuting:\n\t{__file__} \n")
+    print("Hopefully here we will have tests for functions in this file")
@@ -13,6 +13,10 @@ if system() == 'Windows':
         else:
             return 0xffffffff
 
+    # Waits for a key, used by the keyboard thread of the console
+    def read_key_blocking():
+        return ord(msvcrt.getch())
+
     def tty_prepare():
         import os
         # Apparently this is how to put "cmd" interpreter into VT100 mode
@@ -40,13 +44,25 @@ elif system() == "Linux":
         else:
             return 0xffffffff
 
+    # Waits for a key, used by the keyboard thread of the console. Returns None at the end of input (redirected stdin)
+    def read_key_blocking():
+        char = sys.stdin.read(1)
+        if char == '':
+            return None
+        return ord(char)
+
     def tty_prepare():
         global old_settings
+        # Input can be redirected (headless runs from scripts), then there is no terminal to set up
+        if not sys.stdin.isatty():
+            return
         old_settings = termios.tcgetattr(sys.stdin)
         tty.setcbreak(sys.stdin.fileno())
         pass
 
     def tty_release():
         global old_settings
+        if old_settings is None:
+            return
         termios.tcsetattr(sys.stdin, termios.TCSADRAIN, old_settings)
         pass